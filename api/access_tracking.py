@@ -0,0 +1,131 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from api.chunking import QUERY_CHUNK_SIZE, chunked
+
+logger = logging.getLogger(__name__)
+
+
+class AccessBuffer:
+    """
+    Буфер отметок доступа к записям (dateaccessed).
+
+    Отметки копятся в памяти процесса: повторные обращения к одной записи схлопываются
+    в одну отметку с последним временем. Буфер записывается в БД одним UPDATE на модель
+    (на пачку до QUERY_CHUNK_SIZE записей), когда число записей в нем достигает max_size
+    или с момента прошлой записи прошло flush_interval секунд. Это проверяется при новой
+    отметке и по окончании запроса (flush_if_due), поэтому чтение записей само по себе
+    ничего не пишет в БД.
+
+    Внутри транзакции (импорт, построение занятий) буфер при новой отметке не записывается:
+    запись откладывается до окончания запроса или следующей отметки вне транзакции
+    """
+
+    def __init__(self, max_size=None, flush_interval=None):
+        self._max_size = max_size
+        self._flush_interval = flush_interval
+        self._pending = defaultdict(dict)
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return self._max_size or settings.API_DATEACCESSED_BUFFER_SIZE
+
+    @property
+    def flush_interval(self):
+        return self._flush_interval or settings.API_DATEACCESSED_FLUSH_INTERVAL
+
+    def __len__(self):
+        return self._size
+
+    def record(self, model, pk, when=None):
+        self.record_many(model, [pk], when)
+
+    def record_many(self, model, pks, when=None, flush=True):
+        """
+        Отмечает доступ к записям model. Пути чтения, не создающие экземпляры моделей
+        (см. api.projections), отмечают выданные записи явно. flush=False не записывает
+        буфер, даже если он заполнен (например, пока читается курсор потокового ответа)
+        """
+        when = when or timezone.now()
+        with self._lock:
+            pending = self._pending[model]
+            for pk in pks:
+                if pk not in pending:
+                    self._size += 1
+                pending[pk] = when
+            due = self._is_due()
+        if flush and due and not connection.in_atomic_block:
+            self.flush()
+
+    def flush_if_due(self) -> int:
+        """Записывает буфер, если он заполнен или прошло flush_interval секунд"""
+        with self._lock:
+            due = self._is_due()
+        return self.flush() if due else 0
+
+    def _is_due(self) -> bool:
+        return (
+            self._size >= self.max_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def flush(self) -> int:
+        """Записывает накопленные отметки в БД, возвращает число обновленных записей"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(dict)
+            self._size = 0
+            self._last_flush = time.monotonic()
+
+        updated = 0
+        for model, accessed in pending.items():
+            try:
+                updated += self._write(model, accessed)
+            except DatabaseError:
+                # Например, БД занята другой записью: отметки вернутся в буфер до следующей попытки
+                logger.warning("Не удалось записать dateaccessed для %s", model, exc_info=True)
+                self._restore(model, accessed)
+        return updated
+
+    def clear(self):
+        with self._lock:
+            self._pending = defaultdict(dict)
+            self._size = 0
+
+    @staticmethod
+    def _write(model, accessed):
+        # Своя транзакция (точка сохранения внутри чужой): ошибка записи откатывает только ее
+        updated = 0
+        with transaction.atomic(using=model.objects.db):
+            for chunk in chunked(accessed, QUERY_CHUNK_SIZE):
+                updated += model.objects.filter(pk__in=chunk).update(
+                    dateaccessed=Case(
+                        *(When(pk=pk, then=Value(accessed[pk])) for pk in chunk),
+                        output_field=DateTimeField(),
+                    )
+                )
+        return updated
+
+    def _restore(self, model, accessed):
+        with self._lock:
+            pending = self._pending[model]
+            for pk, when in accessed.items():
+                if pk not in pending:
+                    self._size += 1
+                    pending[pk] = when
+                else:
+                    pending[pk] = max(pending[pk], when)
+
+
+access_buffer = AccessBuffer()
+atexit.register(access_buffer.flush)
@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.forms import BaseInlineFormSet
-from django.utils import timezone
 
 from api.models import (
     AbstractEvent,
@@ -12,10 +11,12 @@ from api.models import (
     EventKind,
     EventParticipant,
     EventPlace,
+    ImportRun,
     Schedule,
     Subject,
     TimeSlot,
     DayDateOverride,
+    effective_value,
 )
 
 from rest_framework.authtoken.admin import TokenAdmin
@@ -25,10 +26,11 @@ class BaseAdmin(admin.ModelAdmin):
     readonly_fields = ("dateaccessed", "datemodified", "datecreated")
 
     def save_model(self, request, obj, form, change):
-        if not obj.id:  # Если это новая запись
-            obj.datecreated = timezone.now()
-        obj.datemodified = timezone.now()
-        obj.save()
+        # datemodified обновляется сигналом pre_save, только если запись действительно изменилась
+        if change:
+            obj.save(update_fields=obj.changed_fields())
+        else:
+            obj.save()
 
 
 @admin.register(Subject)
@@ -64,11 +66,45 @@ class ScheduleAdmin(BaseAdmin):
     list_filter = ("faculty", "course", "semester", "years")
 
 
+class EffectiveKindFilter(admin.SimpleListFilter):
+    title = "Тип"
+    parameter_name = "kind"
+
+    def lookups(self, request, model_admin):
+        return EventKind.objects.values_list("pk", "name")
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(effective_kind=self.value())
+        return queryset
+
+
 @admin.register(Event)
 class EventAdmin(BaseAdmin):
-    list_display = ("abstract_event__subject", "abstract_event__kind")
-    search_fields = ("abstract_event__subject__name", "abstract_event__kind__name")
-    list_filter = ("abstract_event__kind__name",)
+    list_display = ("subject_name", "kind_name", "date")
+    search_fields = ("effective_subject_name", "effective_kind_name")
+    list_filter = (EffectiveKindFilter,)
+
+    def get_queryset(self, request):
+        # Предмет и тип с учетом абстрактного события вычисляются в SQL
+        paths = Event.effective_paths
+        return (
+            super()
+            .get_queryset(request)
+            .with_effective_fields()
+            .annotate(
+                effective_subject_name=effective_value(*paths["subject"], "name"),
+                effective_kind_name=effective_value(*paths["kind"], "name"),
+            )
+        )
+
+    @admin.display(description="Предмет", ordering="effective_subject_name")
+    def subject_name(self, obj):
+        return obj.effective_subject_name
+
+    @admin.display(description="Тип", ordering="effective_kind_name")
+    def kind_name(self, obj):
+        return obj.effective_kind_name
 
 
 @admin.register(AbstractEvent)
@@ -117,4 +153,11 @@ class DayDateOverrideAdmin(BaseAdmin):
     search_fields = ("day_source", "day_destination")
 
 
-TokenAdmin.raw_id_fields = ["user"]
\ No newline at end of file
+TokenAdmin.raw_id_fields = ["user"]
+
+
+@admin.register(ImportRun)
+class ImportRunAdmin(admin.ModelAdmin):
+    list_display = ("started_at", "source", "mode", "status", "section", "offset")
+    list_filter = ("status", "mode")
+    readonly_fields = ("started_at", "updated_at", "finished_at")
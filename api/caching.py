@@ -0,0 +1,233 @@
+import hashlib
+import secrets
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+RESPONSE_KEY = "api:response:{}"
+HITS_KEY = "api:response-cache:hits"
+MISSES_KEY = "api:response-cache:misses"
+
+
+def _incr(key, initial):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключа нет (не создавался или вытеснен из кэша)
+        if not cache.add(key, initial, timeout=None):
+            return cache.incr(key)
+        return initial
+
+
+def initial_version() -> int:
+    """
+    Начальный номер версии модели: случайный, чтобы после пересоздания БД ключи кэша ответов
+    и ETag не совпадали с ключами, выданными для прежних данных
+    """
+    return secrets.randbits(48)
+
+
+def model_versions(models) -> dict:
+    """Текущие номера версий моделей (по меткам вида api.event), одним запросом к БД"""
+    return {label: version for label, (version, _) in _version_rows(models).items()}
+
+
+def _version_rows(models) -> dict:
+    """{метка модели: (номер версии, время последнего изменения)}"""
+    from api.models import ModelVersion  # api.models импортирует этот модуль
+
+    labels = {model._meta.label_lower for model in models}
+    fields = ("label", "version", "modified")
+    rows = {
+        label: (version, modified)
+        for label, version, modified in ModelVersion.objects.filter(
+            label__in=labels
+        ).values_list(*fields)
+    }
+    missing = labels - rows.keys()
+    if missing:
+        # Версия создается при первом обращении, со случайным начальным номером
+        ModelVersion.objects.bulk_create(
+            [ModelVersion(label=label) for label in missing], ignore_conflicts=True
+        )
+        rows.update(
+            (label, (version, modified))
+            for label, version, modified in ModelVersion.objects.filter(
+                label__in=missing
+            ).values_list(*fields)
+        )
+    return rows
+
+
+class PendingVersionBumps:
+    """
+    Метки моделей, версии которых увеличиваются после фиксации текущей транзакции:
+    один UPDATE на модель за транзакцию, сколько бы записей в ней ни изменилось
+    """
+
+    def __init__(self, using):
+        self.using = using
+        self.labels = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        _increment_versions(self.labels, self.using)
+
+    def is_registered(self, connection) -> bool:
+        # Обработчики on_commit отброшенной транзакции (или точки сохранения) удаляются,
+        # а выполненный обработчик новые метки уже не запишет
+        return not self.done and any(entry[1] is self for entry in connection.run_on_commit)
+
+
+def bump_model_versions(*models, using=None):
+    """
+    Отмечает, что данные моделей изменились. Закэшированные ответы, зависящие от этих моделей,
+    перестают находиться по ключу, так как номер версии входит в ключ ответа.
+    Версии хранятся в БД (см. ModelVersion), поэтому изменения видны всем процессам.
+    Внутри транзакции версии увеличиваются после ее фиксации (transaction.on_commit),
+    по одному разу на модель: строка версии не блокируется до конца транзакции
+    и не обновляется на каждую измененную запись
+    """
+    labels = {model._meta.label_lower for model in models}
+    if not labels:
+        return
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        _increment_versions(labels, using)
+        return
+    pending = getattr(connection, "pending_version_bumps", None)
+    if pending is None or not pending.is_registered(connection):
+        pending = connection.pending_version_bumps = PendingVersionBumps(using)
+        transaction.on_commit(pending, using=using)
+    pending.labels |= labels
+
+
+def _increment_versions(labels, using=None):
+    from api.models import ModelVersion
+
+    versions = ModelVersion.objects.using(using).filter(label__in=labels)
+    if versions.update(version=F("version") + 1, modified=timezone.now()) < len(labels):
+        # У части моделей строки еще нет: она создается со случайным начальным номером,
+        # который уже отличается от номеров, выданных до этого
+        ModelVersion.objects.using(using).bulk_create(
+            [ModelVersion(label=label) for label in labels], ignore_conflicts=True
+        )
+
+
+def response_cache_stats() -> dict:
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else None}
+
+
+def conditional_state(models, media_type, variant=None):
+    """
+    Валидаторы ответа (ETag, время Last-Modified) по версиям моделей, данные которых
+    попадают в ответ (см. model_versions): любая запись этих моделей меняет версию,
+    поэтому записи самого ответа не читаются, и проверка стоит один запрос к таблице версий
+    независимо от размера списка и страницы. variant различает представления одних записей
+    для разных пользователей (например, с полями администратора)
+    """
+    rows = _version_rows(models)
+    raw = repr(
+        (
+            sorted((label, version) for label, (version, _) in rows.items()),
+            media_type,
+            variant,
+        )
+    )
+    etag = 'W/"{}"'.format(hashlib.sha1(raw.encode("utf-8")).hexdigest())
+    last_modified = max((modified for _, modified in rows.values()), default=None)
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+
+
+def not_modified_response(request, etag, last_modified):
+    """Ответ 304 (или 412), если условия запроса If-None-Match/If-Modified-Since выполнены"""
+    headers = HttpResponse()
+    set_validators(headers, etag, last_modified)
+    response = get_conditional_response(request, etag, last_modified, headers)
+    return None if response is headers else response
+
+
+class ResponseCache:
+    """
+    Кэш отрисованных ответов на анонимные GET-запросы.
+
+    Ключ строится из пути, нормализованных (отсортированных) параметров запроса,
+    формата ответа и номеров версий всех моделей, данные которых попадают в ответ.
+    Версии берутся из БД, поэтому ответ не устаревает после записи из другого процесса,
+    а сами ответы хранятся в кэше CACHES: с LocMemCache - отдельно в каждом процессе
+    """
+
+    def __init__(self, request, models):
+        self.request = request
+        self.models = models
+
+    @classmethod
+    def is_applicable(cls, request, renderer_classes):
+        return (
+            settings.API_RESPONSE_CACHE_TIMEOUT
+            and request.method == "GET"
+            and not request.user.is_authenticated
+            and type(request.accepted_renderer) in renderer_classes
+        )
+
+    @property
+    def key(self):
+        query = sorted(
+            (name, value)
+            for name, values in self.request.query_params.lists()
+            for value in values
+        )
+        versions = sorted(model_versions(self.models).items())
+        raw = "|".join(
+            [
+                self.request.path,
+                urlencode(query),
+                self.request.accepted_media_type or "",
+                repr(versions),
+            ]
+        )
+        return RESPONSE_KEY.format(hashlib.sha1(raw.encode("utf-8")).hexdigest())
+
+    def get(self):
+        key = self.key
+        cached = cache.get(key)
+        if cached is None:
+            _incr(MISSES_KEY, 1)
+            return key, None
+
+        _incr(HITS_KEY, 1)
+        content, content_type, etag, last_modified = cached
+        response = HttpResponse(content, content_type=content_type)
+        response["X-Cache"] = "HIT"
+        set_validators(response, etag, last_modified)
+        return key, get_conditional_response(self.request, etag, last_modified, response)
+
+    @staticmethod
+    def store(key, response, etag, last_modified):
+        response["X-Cache"] = "MISS"
+
+        def callback(rendered):
+            cache.set(
+                key,
+                (rendered.content, rendered["Content-Type"], etag, last_modified),
+                timeout=settings.API_RESPONSE_CACHE_TIMEOUT,
+            )
+
+        response.add_post_render_callback(callback)
@@ -0,0 +1,10 @@
+from itertools import islice
+
+# Ограничение на число параметров в одном запросе (SQLite)
+QUERY_CHUNK_SIZE = 900
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
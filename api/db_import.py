@@ -0,0 +1,212 @@
+import importlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+from api.chunking import QUERY_CHUNK_SIZE, chunked
+from api.importers import JSONImporter
+from api.models import ImportRun
+
+# Декларативное описание внешней БД: раздел импорта -> таблица ("table") и соответствие полей
+# записи раздела в формате JSON-импорта (ключи "fields") столбцам или SQL-выражениям таблицы.
+# Участники и holding_info событий читаются из отдельных таблиц, связанных с событием
+# столбцом "key". Источник может переопределить отдельные разделы в "MAPPING",
+# раздел со значением None не импортируется
+DEFAULT_MAPPING = {
+    "subjects": {"table": "subjects", "fields": ["idnumber", "name"]},
+    "event_kinds": {"table": "event_kinds", "fields": ["idnumber", "name"]},
+    "time_slots": {"table": "time_slots", "fields": ["idnumber", "start_time", "end_time"]},
+    "event_places": {"table": "event_places", "fields": ["idnumber", "building", "room"]},
+    "event_participants": {
+        "table": "event_participants",
+        "fields": ["idnumber", "name", "role"],
+    },
+    "schedules": {
+        "table": "schedules",
+        "fields": ["idnumber", "faculty", "scope", "course", "semester", "years"],
+    },
+    "events": {
+        "table": "events",
+        "fields": ["idnumber", "subject_id", "kind_id", "schedule_id"],
+        "participants": {
+            "table": "event_participants_link",
+            "key": "event_id",
+            "value": "participant_id",
+        },
+        "holding_info": {
+            "table": "event_holdings",
+            "key": "event_id",
+            "fields": ["idnumber", "date", "place_id", "slot_id"],
+        },
+    },
+}
+
+# Поля записей, содержащие idnumber (приводятся к строке, как в JSON-документе)
+IDNUMBER_FIELDS = {"idnumber", "subject_id", "kind_id", "schedule_id", "place_id", "slot_id"}
+
+
+def build_mapping(overrides=None) -> dict:
+    """Описание таблиц источника: DEFAULT_MAPPING с переопределениями, поля - словари"""
+    mapping = {}
+    for section, table in {**DEFAULT_MAPPING, **(overrides or {})}.items():
+        if table is None:
+            continue
+        table = dict(table)
+        table["fields"] = _fields(table["fields"])
+        if "holding_info" in table:
+            table["holding_info"] = {
+                **table["holding_info"],
+                "fields": _fields(table["holding_info"]["fields"]),
+            }
+        mapping[section] = table
+    return mapping
+
+
+def _fields(fields) -> dict:
+    return fields if isinstance(fields, dict) else {field: field for field in fields}
+
+
+def _record(fields, row) -> dict:
+    return {
+        field: str(value) if field in IDNUMBER_FIELDS and value is not None else value
+        for field, value in zip(fields, row)
+    }
+
+
+class DatabaseSource:
+    """
+    Подключение к внешней БД: алиас из DATABASES ("DATABASE") или модуль DB-API
+    ("MODULE") с аргументами подключения ("OPTIONS")
+    """
+
+    # paramstyle DB-API -> заполнитель параметра запроса
+    PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+    def __init__(self, config):
+        if "DATABASE" in config:
+            self.connection = connections[config["DATABASE"]]
+            self.placeholder = "%s"
+            self.is_django = True
+        else:
+            module = importlib.import_module(config["MODULE"])
+            self.placeholder = self.PLACEHOLDERS.get(module.paramstyle)
+            if self.placeholder is None:
+                raise ImproperlyConfigured(
+                    f"Не поддерживается paramstyle {module.paramstyle} модуля {config['MODULE']}"
+                )
+            self.connection = module.connect(**config.get("OPTIONS", {}))
+            self.is_django = False
+
+    def stream_cursor(self):
+        """Курсор для чтения больших таблиц: серверный, если его поддерживает БД"""
+        if self.is_django:
+            return self.connection.chunked_cursor()
+        return self.connection.cursor()
+
+    def fetch(self, sql, params=()) -> list:
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def placeholders(self, count) -> str:
+        return ", ".join([self.placeholder] * count)
+
+    def close(self):
+        if not self.is_django:
+            self.connection.close()
+
+
+class DatabaseImporter:
+    """
+    Импорт из внешней БД, описанной в API_DB_IMPORT_SOURCES. Таблицы читаются
+    порциями fetchmany (через серверный курсор, если он есть) и записываются тем же
+    путем, что и JSON-документ (JSONImporter.import_batches): пачками по idnumber,
+    с контрольными точками и режимами импорта. Память не зависит от размера таблиц
+    """
+
+    def __init__(self, source_name, run=None, batch_size=None, mode=ImportRun.Mode.FULL):
+        sources = settings.API_DB_IMPORT_SOURCES
+        if source_name not in sources:
+            raise ImproperlyConfigured(f"Источник импорта {source_name} не настроен")
+        self.config = sources[source_name]
+        self.mapping = build_mapping(self.config.get("MAPPING"))
+        self.importer = JSONImporter(
+            run=run, batch_size=batch_size, source=f"База данных {source_name}", mode=mode
+        )
+
+    @property
+    def run(self):
+        return self.importer.run
+
+    def import_data(self):
+        source = DatabaseSource(self.config)
+        try:
+            sections = [section for section in JSONImporter.sections if section in self.mapping]
+            totals = {}
+            for section in sections:
+                table = self.mapping[section]["table"]
+                totals[section] = source.fetch(f"SELECT COUNT(*) FROM {table}")[0][0]
+            self.importer.import_batches(self.iter_batches(source, sections), totals)
+        finally:
+            source.close()
+
+    def iter_batches(self, source, sections):
+        """
+        Пары (раздел, пачка записей в формате JSON-документа). Записи упорядочены
+        по idnumber, чтобы прерванный импорт продолжался с той же записи
+        """
+        batch_size = self.importer.batch_size
+        for section in sections:
+            table = self.mapping[section]
+            fields = table["fields"]
+            key_index = list(fields).index("idnumber")
+            cursor = source.stream_cursor()
+            try:
+                cursor.execute(
+                    f"SELECT {', '.join(fields.values())} FROM {table['table']} "
+                    f"ORDER BY {fields['idnumber']}"
+                )
+                while rows := cursor.fetchmany(batch_size):
+                    items = [_record(fields, row) for row in rows]
+                    if section == "events":
+                        keys = [row[key_index] for row in rows]
+                        self._attach_event_details(source, table, items, keys)
+                    yield section, items
+            finally:
+                cursor.close()
+
+    def _attach_event_details(self, source, table, items, keys):
+        """Участники и holding_info пачки событий: один запрос на таблицу и пачку"""
+        by_key = {str(key): item for key, item in zip(keys, items)}
+        participants = table.get("participants")
+        if participants:
+            for item in items:
+                item["participants"] = []
+            for chunk in chunked(keys, QUERY_CHUNK_SIZE):
+                for key, value in source.fetch(
+                    f"SELECT {participants['key']}, {participants['value']} "
+                    f"FROM {participants['table']} "
+                    f"WHERE {participants['key']} IN ({source.placeholders(len(chunk))}) "
+                    f"ORDER BY {participants['key']}, {participants['value']}",
+                    chunk,
+                ):
+                    by_key[str(key)]["participants"].append(str(value))
+
+        holdings = table.get("holding_info")
+        if holdings:
+            fields = holdings["fields"]
+            for item in items:
+                item["holding_info"] = []
+            for chunk in chunked(keys, QUERY_CHUNK_SIZE):
+                for key, *row in source.fetch(
+                    f"SELECT {holdings['key']}, {', '.join(fields.values())} "
+                    f"FROM {holdings['table']} "
+                    f"WHERE {holdings['key']} IN ({source.placeholders(len(chunk))}) "
+                    f"ORDER BY {holdings['key']}, {fields['idnumber']}",
+                    chunk,
+                ):
+                    by_key[str(key)]["holding_info"].append(_record(fields, row))
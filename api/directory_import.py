@@ -0,0 +1,114 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections
+from rest_framework.exceptions import ValidationError
+
+from api.importers import JSONImporter
+
+
+def parse_import_file(path) -> dict:
+    """
+    Чтение и проверка одного файла импорта. Выполняется в процессе пула
+    и не обращается к БД, поэтому файлы разбираются параллельно
+    """
+    started = time.perf_counter()
+    try:
+        with open(path, "rb") as fd:
+            document = json.load(fd)
+    except (OSError, ValueError) as e:
+        errors, sections = {"json": [str(e)]}, {}
+    else:
+        errors = JSONImporter.validate_document(document)
+        sections = {
+            section: document[section]
+            for section in JSONImporter.sections
+            if isinstance(document, dict) and section in document
+        }
+    return {
+        "path": path,
+        "sections": sections,
+        "errors": errors,
+        "items": sum(len(items) for items in sections.values()),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+class DirectoryImporter:
+    """
+    Импорт каталога JSON-файлов (например, выгрузок по факультетам).
+
+    Файлы разбираются и проверяются в пуле процессов, затем записи всех файлов
+    объединяются по idnumber (повторяющиеся справочники записываются один раз,
+    при различающемся содержимом побеждает файл, идущий позже по имени)
+    и записываются одним JSONImporter в порядке зависимостей разделов.
+    Объединенный документ хранится в памяти целиком
+    """
+
+    def __init__(self, paths, workers=None, batch_size=None, source=""):
+        self.paths = sorted(paths)
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.source = source
+        self.stats = {
+            "files": len(self.paths),
+            "items": 0,
+            "unique_items": 0,
+            "duplicates": 0,
+            "conflicts": 0,
+            "parse_seconds": 0.0,
+            "write_seconds": 0.0,
+        }
+
+    @classmethod
+    def from_directory(cls, directory, **kwargs):
+        paths = [
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith(".json")
+        ]
+        return cls(paths, source=kwargs.pop("source", directory), **kwargs)
+
+    def parse(self) -> list:
+        if self.workers == 1 or len(self.paths) < 2:
+            return [parse_import_file(path) for path in self.paths]
+        # Дочерние процессы не должны унаследовать открытые соединения с БД
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(self.paths))) as pool:
+            return list(pool.map(parse_import_file, self.paths))
+
+    def merge(self, parsed) -> dict:
+        merged = {section: {} for section in JSONImporter.sections}
+        for result in parsed:
+            for section, items in result["sections"].items():
+                records = merged[section]
+                for item in items:
+                    previous = records.get(item["idnumber"])
+                    if previous is not None:
+                        self.stats["duplicates"] += 1
+                        self.stats["conflicts"] += previous != item
+                    records[item["idnumber"]] = item
+        self.stats["unique_items"] = sum(len(records) for records in merged.values())
+        return {section: list(records.values()) for section, records in merged.items()}
+
+    def import_all(self):
+        started = time.perf_counter()
+        parsed = self.parse()
+        self.stats["parse_seconds"] = time.perf_counter() - started
+        self.stats["items"] = sum(result["items"] for result in parsed)
+
+        errors = {
+            os.path.basename(result["path"]): result["errors"]
+            for result in parsed
+            if result["errors"]
+        }
+        if errors:
+            raise ValidationError({"files": errors})
+
+        started = time.perf_counter()
+        document = self.merge(parsed)
+        JSONImporter(document, batch_size=self.batch_size, source=self.source).import_data()
+        self.stats["write_seconds"] = time.perf_counter() - started
+        return self.stats
@@ -0,0 +1,340 @@
+import datetime
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import Exists, F, Max, OuterRef, Q
+from django.utils import timezone
+
+from api.caching import bump_model_versions
+from api.chunking import QUERY_CHUNK_SIZE, chunked
+from api.models import AbstractEvent, DayDateOverride, Event, EventMembership, Schedule
+
+# Поля занятия, заполненные значения которых означают, что занятие изменено вручную
+OVERRIDE_FIELDS = (
+    "kind_override_id",
+    "subject_override_id",
+    "place_override_id",
+    "time_slot_override_id",
+)
+
+
+def cycle_start(start_date, aligned_by_week_day=0, starting_day_number=0) -> int:
+    """
+    Порядковый номер (date.toordinal) дня 0 цикла расписания: дата начала семестра,
+    при выравнивании - ближайший не позднее нее день недели aligned_by_week_day (пн=1, ...),
+    сдвинутая назад на номер дня цикла, с которого начинается семестр
+    """
+    ordinal = start_date.toordinal()
+    if aligned_by_week_day:
+        ordinal -= (start_date.isoweekday() - aligned_by_week_day) % 7
+    return ordinal - starting_day_number
+
+
+def occurrence_ordinals(first, last, anchor, day_number, period, repeatable) -> range:
+    """
+    Порядковые номера дат дня шаблона day_number в отрезке [first, last]. Даты образуют
+    арифметическую прогрессию anchor + day_number + k * period, поэтому вычисляются
+    сразу как range, без перебора дней семестра
+    """
+    origin = anchor + day_number
+    if not repeatable or period <= 0:
+        return range(origin, origin + 1) if first <= origin <= last else range(0)
+    start = origin - (origin - first) // period * period
+    return range(start, last + 1, period)
+
+
+@lru_cache(maxsize=4096)
+def _from_ordinal(ordinal) -> datetime.date:
+    return datetime.date.fromordinal(ordinal)
+
+
+class ScheduleExpander:
+    """
+    Построение занятий (Event) расписаний по шаблонам: AbstractSchedule задает период
+    повторения и выравнивание цикла, AbstractEvent расписания (AbstractEvent.schedule) -
+    день цикла (AbstractDay.day_number), Schedule - границы семестра и день цикла,
+    с которого он начинается (starting_day_number). Переносы дней (DayDateOverride)
+    переводят занятия с day_source на day_destination.
+
+    Даты одного дня шаблона вычисляются один раз на расписание и переиспользуются
+    всеми его абстрактными событиями. Занятие определяется тройкой (расписание,
+    абстрактное событие, дата по шаблону - Event.original_date): недостающие создаются
+    пачками INSERT, лишние удаляются. Занятия с заполненными *_override или перенесенные
+    на другую дату (изменены вручную) не удаляются.
+    Расписания обрабатываются пачками по chunk_size, каждая - в своей транзакции.
+
+    С materialize=False занятия по шаблонам не хранятся (их вычисляет occurrences_between
+    при чтении, см. EventViewSet), и expand удаляет все неизмененные занятия, оставляя
+    только исключения
+    """
+
+    # Поля расписания и его шаблона, из которых вычисляются даты (см. occurrences)
+    schedule_fields = (
+        "pk",
+        "start_date",
+        "end_date",
+        "starting_day_number__day_number",
+        "abstract_schedule__repetition_period",
+        "abstract_schedule__repeatable",
+        "abstract_schedule__aligned_by_week_day",
+    )
+
+    def __init__(self, schedule_ids=None, chunk_size=100, batch_size=2000, materialize=True):
+        self.schedule_ids = schedule_ids
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.materialize = materialize
+
+    def schedules(self):
+        """Расписания, занятия которых строятся по шаблону"""
+        schedules = Schedule.objects.exclude(abstract_schedule=None).exclude(
+            start_date=None
+        ).exclude(end_date=None)
+        if self.schedule_ids is not None:
+            schedules = schedules.filter(pk__in=self.schedule_ids)
+        return schedules
+
+    def expand(self, abstract_event_ids=None, dates=None) -> dict:
+        """
+        Строит занятия расписаний, возвращает счетчики. abstract_event_ids и dates
+        ограничивают построение занятиями этих абстрактных событий и дат (после переносов):
+        остальные занятия расписаний не читаются и не меняются (см. api.signals)
+        """
+        stats = {"schedules": 0, "created": 0, "deleted": 0, "unchanged": 0, "kept": 0}
+        rows = self.schedules().order_by("pk").values_list(*self.schedule_fields)
+        for chunk in chunked(list(rows), self.chunk_size):
+            with transaction.atomic():
+                counters = self.expand_chunk(chunk, abstract_event_ids, dates)
+            for name, value in counters.items():
+                stats[name] += value
+            stats["schedules"] += len(chunk)
+        if stats["created"] or stats["deleted"]:
+            bump_model_versions(Event)
+        return stats
+
+    def occurrences_between(self, date_from, date_to, abstract_events=None) -> set:
+        """
+        Тройки занятий расписаний с датами в окне [date_from, date_to] без записи в БД.
+        abstract_events - queryset AbstractEvent, ограничивающий шаблоны
+        """
+        schedules = self.schedules().filter(
+            Q(start_date__lte=date_to, end_date__gte=date_from)
+            | Q(day_overrides__day_destination__range=(date_from, date_to))
+        )
+        if abstract_events is not None:
+            schedules = schedules.filter(pk__in=abstract_events.values("schedule_id"))
+        rows = schedules.distinct().order_by("pk").values_list(*self.schedule_fields)
+
+        occurrences = set()
+        for chunk in chunked(list(rows), QUERY_CHUNK_SIZE):
+            schedule_ids = [row[0] for row in chunk]
+            templates = self._templates(schedule_ids, abstract_events)
+            shifts = self._shifts(schedule_ids)
+            for schedule_id, *parameters in chunk:
+                occurrences |= self.occurrences(
+                    schedule_id,
+                    parameters,
+                    templates[schedule_id],
+                    shifts[schedule_id],
+                    (date_from, date_to),
+                )
+        return occurrences
+
+    def expand_chunk(self, schedules, abstract_event_ids=None, dates=None) -> dict:
+        schedule_ids = [row[0] for row in schedules]
+        target = set()
+        if self.materialize:
+            abstract_events = None
+            if abstract_event_ids is not None:
+                abstract_events = AbstractEvent.objects.filter(pk__in=abstract_event_ids)
+            templates = self._templates(schedule_ids, abstract_events)
+            shifts = self._shifts(schedule_ids)
+            for schedule_id, *parameters in schedules:
+                target |= self.occurrences(
+                    schedule_id, parameters, templates[schedule_id], shifts[schedule_id]
+                )
+            if dates is not None:
+                target = {occurrence for occurrence in target if occurrence[2] in dates}
+
+        existing, kept, duplicates = self._existing(schedule_ids, abstract_event_ids, dates)
+        stale = duplicates + [pk for key, pk in existing.items() if key not in target]
+        if stale:
+            self._delete(stale)
+        created = target - existing.keys() - kept.keys()
+        if created:
+            self._insert(created)
+        return {
+            "created": len(created),
+            "deleted": len(stale),
+            "unchanged": len(target) - len(created),
+            "kept": len(kept.keys() - target),
+        }
+
+    def _delete(self, pks):
+        """
+        Удаляет лишние занятия DELETE пачками по batch_size. QuerySet.delete() читает
+        каждое занятие и отправляет для него сигналы, а у лишних занятий нет
+        participants_override (иначе они были бы сохранены), и ссылаются на них только
+        записи EventMembership, которые удаляются явно. Границы расписаний с шаблоном
+        не пересчитываются (см. Schedule.refresh_dates), версию Event обновляет expand
+        """
+        for batch in chunked(pks, self.batch_size):
+            EventMembership.objects.filter(event_id__in=batch)._raw_delete(connection.alias)
+            Event.objects.filter(pk__in=batch)._raw_delete(connection.alias)
+
+    def _insert(self, occurrences):
+        """
+        Записывает новые занятия INSERT через executemany пачками по batch_size.
+        Создание экземпляров Event и компиляция bulk_create занимают большую часть
+        времени построения семестра, а у новых занятий задаются только ссылки и даты
+        (остальные поля допускают NULL), дата по шаблону совпадает с датой. INSERT
+        не вызывает сигналы, поэтому участники новых занятий (см. EventMembership)
+        записываются явно
+        """
+        last_pk = Event.objects.aggregate(last=Max("pk"))["last"] or 0
+        operations = connection.ops
+        adapt_date = operations.adapt_datefield_value
+        now = operations.adapt_datetimefield_value(timezone.now())
+        columns = [
+            operations.quote_name(Event._meta.get_field(name).column)
+            for name in (
+                "schedule", "abstract_event", "date", "original_date", "datecreated", "datemodified"
+            )
+        ]
+        sql = (
+            f"INSERT INTO {operations.quote_name(Event._meta.db_table)} "
+            f"({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        with connection.cursor() as cursor:
+            for batch in chunked(list(occurrences), self.batch_size):
+                cursor.executemany(
+                    sql,
+                    [
+                        (
+                            schedule_id,
+                            abstract_event_id,
+                            adapt_date(date),
+                            adapt_date(date),
+                            now,
+                            now,
+                        )
+                        for schedule_id, abstract_event_id, date in batch
+                    ],
+                )
+        schedule_ids = {schedule_id for schedule_id, _, _ in occurrences}
+        EventMembership.refresh(Event.objects.filter(pk__gt=last_pk, schedule_id__in=schedule_ids))
+
+    @staticmethod
+    def occurrences(schedule_id, parameters, templates, shifts, window=None) -> set:
+        """
+        Тройки (расписание, абстрактное событие, дата) занятий расписания.
+        templates - {номер дня шаблона: [pk абстрактного события]}, shifts - {дата: новая дата}.
+        Если задано окно window (первая и последняя дата), остаются только занятия
+        с датами в нем (с учетом переносов в окно и из него)
+        """
+        start_date, end_date, starting_day, period, repeatable, aligned = parameters
+        anchor = cycle_start(start_date, aligned, starting_day or 0)
+        first, last = start_date.toordinal(), end_date.toordinal()
+        if window is None:
+            low, high, incoming = first, last, []
+        else:
+            low, high = window[0].toordinal(), window[1].toordinal()
+            # Переносы в окно дат, которые сами лежат вне его
+            incoming = [
+                (source.toordinal(), destination)
+                for source, destination in shifts.items()
+                if window[0] <= destination <= window[1]
+                and not window[0] <= source <= window[1]
+            ]
+
+        occurrences = set()
+        for day_number, abstract_event_ids in templates.items():
+            ordinals = occurrence_ordinals(
+                max(first, low), min(last, high), anchor, day_number, period, repeatable
+            )
+            dates = [shifts.get(date, date) for date in map(_from_ordinal, ordinals)]
+            if window is not None:
+                semester = occurrence_ordinals(
+                    first, last, anchor, day_number, period, repeatable
+                )
+                dates = [date for date in dates if window[0] <= date <= window[1]]
+                dates += [destination for source, destination in incoming if source in semester]
+            occurrences.update(
+                (schedule_id, abstract_event_id, date)
+                for abstract_event_id in abstract_event_ids
+                for date in dates
+            )
+        return occurrences
+
+    @staticmethod
+    def _templates(schedule_ids, abstract_events=None) -> dict:
+        """{pk расписания: {номер дня шаблона: [pk абстрактного события]}}"""
+        if abstract_events is None:
+            abstract_events = AbstractEvent.objects.all()
+        templates = defaultdict(lambda: defaultdict(list))
+        for pk, schedule_id, day_number in abstract_events.filter(
+            schedule_id__in=schedule_ids
+        ).values_list("pk", "schedule_id", "abstract_day__day_number"):
+            templates[schedule_id][day_number].append(pk)
+        return templates
+
+    @staticmethod
+    def _shifts(schedule_ids) -> dict:
+        """{pk расписания: {дата: дата переноса}}"""
+        shifts = defaultdict(dict)
+        through = DayDateOverride.schedule.through
+        for schedule_id, source, destination in through.objects.filter(
+            schedule_id__in=schedule_ids
+        ).values_list(
+            "schedule_id", "daydateoverride__day_source", "daydateoverride__day_destination"
+        ):
+            shifts[schedule_id][source] = destination
+        return shifts
+
+    @staticmethod
+    def _existing(schedule_ids, abstract_event_ids=None, dates=None):
+        """
+        Занятия расписаний, построенные по их абстрактным событиям (или по abstract_event_ids,
+        если они заданы, в том числе перенесенным в другое расписание), с датами по шаблону
+        из dates: словари {(расписание, абстрактное событие, дата по шаблону): pk} неизмененных
+        занятий и занятий с *_override, participants_override или перенесенных на другую дату,
+        а также pk лишних неизмененных занятий, повторяющих уже найденную тройку.
+        У занятий без original_date (созданных не по шаблону) датой по шаблону считается date
+        """
+        through = Event.participants_override.through
+        events = Event.objects.filter(schedule_id__in=schedule_ids)
+        if abstract_event_ids is not None:
+            events = events.filter(abstract_event_id__in=abstract_event_ids)
+        else:
+            events = events.filter(abstract_event__schedule_id=F("schedule_id"))
+        if dates is not None:
+            events = events.filter(
+                Q(original_date__in=dates) | Q(original_date=None, date__in=dates)
+            )
+        rows = (
+            events.annotate(
+                has_participants=Exists(through.objects.filter(event_id=OuterRef("pk")))
+            )
+            .order_by("pk")
+            .values_list(
+                "pk",
+                "schedule_id",
+                "abstract_event_id",
+                "date",
+                "original_date",
+                "has_participants",
+                *OVERRIDE_FIELDS,
+            )
+        )
+        existing, kept, duplicates = {}, {}, []
+        for pk, schedule_id, abstract_event_id, date, original, *overrides in rows.iterator():
+            key = (schedule_id, abstract_event_id, original or date)
+            if any(overrides) or key[2] != date:
+                kept[key] = pk
+            elif key in existing:
+                duplicates.append(pk)
+            else:
+                existing[key] = pk
+        duplicates.extend(existing.pop(key) for key in kept.keys() & existing.keys())
+        return existing, kept, duplicates
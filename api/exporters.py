@@ -0,0 +1,215 @@
+import datetime
+import json
+from itertools import islice
+
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+
+from api.chunking import QUERY_CHUNK_SIZE, chunked
+from api.importers import JSONImporter
+from api.models import AbstractEvent, Event, Schedule
+
+# Разделы справочников -> имя значения занятия (см. Event.effective_paths), по которому
+# при выгрузке части расписаний отбираются только используемые записи
+REFERENCED_SECTIONS = {
+    "subjects": "subject",
+    "event_kinds": "kind",
+    "time_slots": "time_slot",
+    "event_places": "place",
+    "event_participants": "participants",
+}
+
+# Ссылки событий и элементов holding_info документа -> значения занятия
+EVENT_REFERENCES = {"subject_id": "subject", "kind_id": "kind"}
+HOLDING_REFERENCES = {"place_id": "place", "slot_id": "time_slot"}
+REFERENCE_SECTIONS = {name: section for section, name in REFERENCED_SECTIONS.items()}
+
+
+def _export_value(value):
+    if isinstance(value, datetime.time):
+        return value.strftime("%H:%M") if not value.second else value.isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class JSONExporter:
+    """
+    Выгрузка БД в формате, который принимает JSONImporter (см. JSONImportAPIView).
+
+    Записи читаются через iterator() порциями по chunk_size и выдаются по мере чтения,
+    в памяти хранятся только соответствия pk -> idnumber справочников и одна порция занятий.
+    Записи без idnumber получают идентификатор вида "<раздел>-<pk>".
+
+    Занятия элементов holding_info (с Event.holding_idnumber) собираются в одно событие документа
+    с элементами holding_info, остальные занятия с датой, местом или временем выгружаются
+    событием с единственным элементом holding_info с idnumber null, который импорт относит
+    к записи самого события, поэтому повторный импорт выгрузки не создает новых занятий.
+    Предмет, тип, место, время
+    и участники выгружаются с учетом абстрактного события (см. Event.effective_paths),
+    а предмет, тип и участники события берутся из его первого занятия
+    """
+
+    def __init__(self, schedules=None, faculty=None, status=None, chunk_size=2000):
+        """schedules - ID расписаний, faculty и status - отбор расписаний по полям Schedule"""
+        self.chunk_size = chunk_size
+        self.schedules = Schedule.objects.all()
+        if schedules:
+            self.schedules = self.schedules.filter(pk__in=schedules)
+        if faculty:
+            self.schedules = self.schedules.filter(faculty=faculty)
+        if status is not None:
+            self.schedules = self.schedules.filter(status=status)
+        self.filtered = bool(schedules or faculty or status is not None)
+        self.events = Event.objects.all()
+        if self.filtered:
+            self.events = self.events.filter(schedule__in=self.schedules)
+        # Раздел -> {pk: idnumber в документе} для ссылок из событий
+        self.idnumbers = {}
+
+    def render(self, buffer_size=64 * 1024):
+        """Документ по частям, блоками примерно по buffer_size байт"""
+        buffer = ["{"]
+        buffered = 0
+        for index, section in enumerate(JSONImporter.sections):
+            buffer.append(("," if index else "") + json.dumps(section) + ":[")
+            for position, item in enumerate(self.iter_section(section)):
+                chunk = json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+                buffer.append("," + chunk if position else chunk)
+                buffered += len(chunk)
+                if buffered >= buffer_size:
+                    yield "".join(buffer).encode("utf-8")
+                    buffer = []
+                    buffered = 0
+            buffer.append("]")
+        buffer.append("}")
+        yield "".join(buffer).encode("utf-8")
+
+    def write(self, fd):
+        for chunk in self.render():
+            fd.write(chunk)
+
+    def iter_section(self, section):
+        if section == "events":
+            return self.iter_events()
+        return self.iter_simple_section(section)
+
+    def iter_simple_section(self, section):
+        model, fields = JSONImporter.simple_sections[section]
+        if section == "schedules":
+            queryset = self.schedules
+        else:
+            queryset = model.objects.all()
+            if self.filtered:
+                queryset = queryset.filter(self._referenced(REFERENCED_SECTIONS[section]))
+        idnumbers = self.idnumbers[section] = {}
+        rows = queryset.order_by("pk").values_list("pk", "idnumber", *fields)
+        for pk, idnumber, *values in rows.iterator(chunk_size=self.chunk_size):
+            idnumber = idnumbers[pk] = idnumber or f"{section}-{pk}"
+            yield {
+                "idnumber": idnumber,
+                **{field: _export_value(value) for field, value in zip(fields, values)},
+            }
+
+    def _referenced(self, name) -> Q:
+        """Условие на записи справочника, используемые выгружаемыми занятиями"""
+        if name != "participants":
+            column = f"effective_{name}"
+            events = self.events.with_effective_fields().exclude(**{column: None})
+            return Q(pk__in=events.values(column))
+        condition = Q()
+        for path in Event.effective_paths[name]:
+            condition |= Q(pk__in=self.events.exclude(**{path: None}).values(path))
+        return condition
+
+    def iter_events(self):
+        references = {**EVENT_REFERENCES, **HOLDING_REFERENCES}
+        rows = (
+            self.events.with_effective_fields()
+            .order_by(Coalesce("event_idnumber", "idnumber"), "idnumber", "pk")
+            .values_list(
+                "pk",
+                "idnumber",
+                "event_idnumber",
+                "date",
+                "schedule_id",
+                "abstract_event_id",
+                "holding_idnumber",
+                *(f"effective_{name}" for name in references.values()),
+            )
+            .iterator(chunk_size=self.chunk_size)
+        )
+
+        current = None
+        while chunk := list(islice(rows, self.chunk_size)):
+            participants = self._participants(chunk)
+            for row in chunk:
+                pk, idnumber, event_idnumber, date, schedule_id, _, holding_idnumber, *values = row
+                effective = dict(zip(references.values(), values))
+                is_holding = holding_idnumber is not None
+                if not is_holding:
+                    event_idnumber = idnumber or f"events-{pk}"
+
+                if current is None or current["idnumber"] != event_idnumber:
+                    if current is not None:
+                        yield current
+                    current = {
+                        "idnumber": event_idnumber,
+                        **{
+                            field: self._reference(name, effective[name])
+                            for field, name in EVENT_REFERENCES.items()
+                        },
+                        "schedule_id": self.idnumbers["schedules"][schedule_id],
+                        "participants": sorted(
+                            self.idnumbers["event_participants"][participant]
+                            for participant in participants.get(pk, ())
+                        ),
+                        "holding_info": [],
+                    }
+                if is_holding or date or effective["place"] or effective["time_slot"]:
+                    current["holding_info"].append(
+                        {
+                            "idnumber": holding_idnumber,
+                            "date": _export_value(date),
+                            **{
+                                field: self._reference(name, effective[name])
+                                for field, name in HOLDING_REFERENCES.items()
+                            },
+                        }
+                    )
+        if current is not None:
+            yield current
+
+    def _reference(self, name, pk):
+        """idnumber в документе записи, на которую ссылается значение name занятия"""
+        if pk is None:
+            return None
+        return self.idnumbers[REFERENCE_SECTIONS[name]][pk]
+
+    def _participants(self, chunk) -> dict:
+        """
+        Участники занятий порции {pk занятия: [pk участника]}: из participants_override,
+        а если он пуст - из абстрактного события
+        """
+        through = Event.participants_override.through
+        participants = {}
+        for pks in chunked([row[0] for row in chunk], QUERY_CHUNK_SIZE):
+            for event_id, participant_id in through.objects.filter(event_id__in=pks).values_list(
+                "event_id", "eventparticipant_id"
+            ):
+                participants.setdefault(event_id, []).append(participant_id)
+
+        abstract_ids = {
+            row[5] for row in chunk if row[5] is not None and row[0] not in participants
+        }
+        abstract_through = AbstractEvent.participants.through
+        abstract = {}
+        for ids in chunked(abstract_ids, QUERY_CHUNK_SIZE):
+            for abstract_event_id, participant_id in abstract_through.objects.filter(
+                abstractevent_id__in=ids
+            ).values_list("abstractevent_id", "eventparticipant_id"):
+                abstract.setdefault(abstract_event_id, []).append(participant_id)
+        for row in chunk:
+            if row[0] not in participants and row[5] in abstract:
+                participants[row[0]] = abstract[row[5]]
+        return participants
@@ -4,28 +4,33 @@ from api.models import Event, EventKind, EventParticipant, EventPlace, Schedule
 
 
 class EventFilter(django_filters.FilterSet):
+    """
+    Фильтр занятий по значениям с учетом абстрактного события, вычисляемым в SQL
+    (см. EventQuerySet.with_effective_fields, queryset должен быть аннотирован им)
+    """
+
     schedule = django_filters.NumberFilter(field_name="schedule__id", label="ID расписания")
 
     date_from = django_filters.DateFilter(
-        field_name="holdings__date",
+        field_name="effective_date",
         lookup_expr="gte",
         required=False,
         label="Поиск по дате проведения от",
     )
     date_to = django_filters.DateFilter(
-        field_name="holdings__date",
+        field_name="effective_date",
         lookup_expr="lte",
         required=False,
         label="Поиск по дате проведения до",
     )
     time_from = django_filters.TimeFilter(
-        field_name="holdings__time_slot__start_time",
+        field_name="effective_start_time",
         lookup_expr="gte",
         required=False,
         label="Время проведения от",
     )
     time_to = django_filters.TimeFilter(
-        field_name="holdings__time_slot__end_time",
+        field_name="effective_end_time",
         lookup_expr="lte",
         required=False,
         label="Время проведения до",
@@ -33,17 +38,20 @@ class EventFilter(django_filters.FilterSet):
     participants = django_filters.ModelMultipleChoiceFilter(
         field_name="participants",
         queryset=EventParticipant.objects.all(),
+        method="filter_participants",
         required=False,
         label="Участники",
     )
     can_have_kind = django_filters.ModelMultipleChoiceFilter(
-        field_name="kind",
+        field_name="effective_kind",
+        method="filter_effective_reference",
         queryset=EventKind.objects.all(),
         required=False,
         label="Фильтр видов занятий",
     )
     possible_rooms = django_filters.ModelMultipleChoiceFilter(
-        field_name="holdings__place",
+        field_name="effective_place",
+        method="filter_effective_reference",
         queryset=EventPlace.objects.all(),
         required=False,
         label="Возможные места проведения",
@@ -62,6 +70,40 @@ class EventFilter(django_filters.FilterSet):
             "possible_rooms",
         ]
 
+    # Поле фильтра -> условие на абстрактные события, по которым вычисляются виртуальные занятия
+    abstract_event_lookups = {
+        "schedule": "schedule_id",
+        "time_from": "time_slot__start_time__gte",
+        "time_to": "time_slot__end_time__lte",
+        "participants": "participants__in",
+        "can_have_kind": "kind__in",
+        "possible_rooms": "place__in",
+    }
+
+    def filter_participants(self, queryset, name, value):
+        if not value:
+            return queryset
+        # Границы дат сужают и выборку из EventMembership (см. for_participants)
+        dates = self.form.cleaned_data
+        return queryset.for_participants(value, dates.get("date_from"), dates.get("date_to"))
+
+    def filter_effective_reference(self, queryset, name, value):
+        # Аннотация хранит id записи, поэтому сравнивается с pk выбранных записей
+        if not value:
+            return queryset
+        return queryset.filter(**{f"{name}__in": [instance.pk for instance in value]})
+
+    def filter_abstract_events(self, queryset):
+        """
+        Абстрактные события, занятия которых проходят фильтр (форма должна быть проверена).
+        Отбор по участникам соединяет таблицу связей, поэтому повторы исключаются distinct
+        """
+        for name, lookup in self.abstract_event_lookups.items():
+            value = self.form.cleaned_data.get(name)
+            if value:
+                queryset = queryset.filter(**{lookup: value})
+        return queryset.distinct()
+
 
 class ScheduleFilter(django_filters.FilterSet):
     faculty = django_filters.CharFilter(
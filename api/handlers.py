@@ -1,6 +1,10 @@
+import json
 import traceback
+
+import msgpack
 from django.conf import settings
-from rest_framework.renderers import JSONRenderer
+from rest_framework.compat import SHORT_SEPARATORS
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.exceptions import (
     ValidationError,
     NotAuthenticated,
@@ -12,19 +16,153 @@ from rest_framework.views import exception_handler
 from api.exceptions import ScheduleAPIException
 
 
+def build_response_envelope(data, renderer_context):
+    """
+    Конверт успешного ответа {"type": "response", "items": [...]}.
+    Для ответов с ошибкой возвращает None: они уже сформированы exception_response_handler
+    """
+    response = (renderer_context or {}).get("response", None)
+    if response is not None and response.status_code >= 400:
+        return None
+
+    response_data = {
+        "type": "response",
+        "items": data if isinstance(data, list) else [data],
+    }
+    # Постраничный вывод (см. api.pagination) дополняет конверт курсорами next/prev
+    cursors = getattr(response, "cursors", None)
+    if cursors is not None:
+        response_data.update(cursors)
+    return response_data
+
+
 class ResponseJSONRenderer(JSONRenderer):
     def render(self, data, accepted_media_type=None, renderer_context=None):
-        if renderer_context and renderer_context.get("response", None):
-            response = renderer_context["response"]
-            if response.status_code >= 400:
-                return super().render(data, accepted_media_type, renderer_context)
-
-        response_data = {
-            "type": "response",
-            "items": data if isinstance(data, list) else [data],
+        response_data = build_response_envelope(data, renderer_context)
+        if response_data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return super().render(response_data, accepted_media_type, renderer_context)
+
+    def render_stream(self, items, buffer_size=64 * 1024):
+        """
+        Отрисовывает тот же конверт {"type": "response", "items": [...]} по частям:
+        элементы items кодируются по одному и отдаются блоками примерно по buffer_size байт
+        """
+        buffer = [b'{"type":"response","items":[']
+        buffered = 0
+        for index, item in enumerate(items):
+            chunk = json.dumps(
+                item,
+                cls=self.encoder_class,
+                ensure_ascii=self.ensure_ascii,
+                allow_nan=not self.strict,
+                separators=SHORT_SEPARATORS,
+            ).encode("utf-8")
+            if index:
+                buffer.append(b",")
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= buffer_size:
+                yield b"".join(buffer)
+                buffer = []
+                buffered = 0
+        buffer.append(b"]}")
+        yield b"".join(buffer)
+
+
+class ResponseMessagePackRenderer(BaseRenderer):
+    """Тот же конверт ответа, что и у ResponseJSONRenderer, в формате MessagePack"""
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        response_data = build_response_envelope(data, renderer_context)
+        return msgpack.packb(data if response_data is None else response_data, default=str)
+
+
+class ColumnarJSONRenderer(ResponseJSONRenderer):
+    """
+    Колоночный JSON со словарным кодированием.
+
+    Вместо списка объектов `items` ответ содержит `columns` - значения каждого поля
+    для всех записей подряд (`count` записей). Вложенные объекты из `columnar_tables`
+    представления (например, предметы и места проведения занятий) передаются один раз
+    в `tables`, а в колонках заменяются их индексами в таблице.
+    Прочие вложенные объекты передаются списками значений в порядке ключей из `schemas`
+    (недостающие в конце списка значения равны null)
+    """
+
+    media_type = "application/vnd.schedule.columnar+json"
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response_data = build_response_envelope(data, renderer_context)
+        if response_data is None:
+            return super(ResponseJSONRenderer, self).render(
+                data, accepted_media_type, renderer_context
+            )
+
+        view = (renderer_context or {}).get("view", None)
+        encoder = ColumnarEncoder(getattr(view, "columnar_tables", {}))
+        items = response_data.pop("items")
+        response_data.update(encoder.encode(items))
+        return super(ResponseJSONRenderer, self).render(
+            response_data, accepted_media_type, renderer_context
+        )
+
+
+class ColumnarEncoder:
+    def __init__(self, table_paths):
+        # Путь поля (через точку) -> имя таблицы
+        self.table_paths = table_paths
+        self.tables = {name: [] for name in table_paths.values()}
+        self._table_indexes = {name: {} for name in table_paths.values()}
+        self.schemas = {}
+
+    def encode(self, items):
+        keys = list(dict.fromkeys(key for item in items for key in item))
+        columns = {key: [self._encode(key, item.get(key)) for item in items] for key in keys}
+        return {
+            "layout": "columnar",
+            "count": len(items),
+            "tables": self.tables,
+            "schemas": self.schemas,
+            "columns": columns,
         }
 
-        return super().render(response_data, accepted_media_type, renderer_context)
+    def _encode(self, path, value):
+        if value is None:
+            return None
+        if path in self.table_paths:
+            table = self.table_paths[path]
+            if isinstance(value, list):
+                return [self._intern(table, element) for element in value]
+            return self._intern(table, value)
+        if isinstance(value, list):
+            return [self._encode_object(path, element) for element in value]
+        return self._encode_object(path, value)
+
+    def _encode_object(self, path, value):
+        if not isinstance(value, dict):
+            return value
+        schema = self.schemas.setdefault(path, [])
+        for key in value:
+            if key not in schema:
+                schema.append(key)
+        return [self._encode(f"{path}.{key}", value.get(key)) for key in schema]
+
+    def _intern(self, table, value):
+        key = json.dumps(value, sort_keys=True, default=str)
+        indexes = self._table_indexes[table]
+        if key not in indexes:
+            indexes[key] = len(self.tables[table])
+            self.tables[table].append(value)
+        return indexes[key]
 
 
 def exception_response_handler(exc, context):
@@ -0,0 +1,197 @@
+import datetime
+import hashlib
+import zoneinfo
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api.models import AbstractEvent, Event, EventKind, EventPlace, Subject, TimeSlot
+
+VEVENT_KEY = "api:vevent:{}"
+PRODID = "-//VSTU//Schedule API//RU"
+UID_DOMAIN = "schedule.vstu.ru"
+
+# Связанные модели, данные которых попадают в VEVENT занятия: имя атрибута Event -> модель
+REFERENCED_MODELS = {
+    "time_slot": TimeSlot,
+    "place": EventPlace,
+    "subject": Subject,
+    "kind": EventKind,
+}
+REFERENCED_FIELDS = {
+    TimeSlot: ["start_time", "end_time"],
+    EventPlace: ["building", "room"],
+    Subject: ["name"],
+    EventKind: ["name"],
+}
+
+# Модели, изменение которых может изменить календарь участника: значения занятий
+# и их состав (участники) берутся и из абстрактных событий
+CALENDAR_MODELS = [
+    Event,
+    AbstractEvent,
+    Event.participants_override.through,
+    AbstractEvent.participants.through,
+    *REFERENCED_MODELS.values(),
+]
+
+
+def escape_text(value) -> str:
+    """Экранирование значения типа TEXT (RFC 5545, 3.3.11)"""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold_line(line: str) -> str:
+    """Перенос строк длиннее 75 октетов (RFC 5545, 3.1), не разрывая символы UTF-8"""
+    if len(line.encode("utf-8")) <= 75:
+        return line
+    parts = []
+    current, size, limit = [], 0, 75
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            parts.append("".join(current))
+            # Строки продолжения начинаются с пробела, который тоже занимает октет
+            current, size, limit = [], 0, 74
+        current.append(char)
+        size += char_size
+    parts.append("".join(current))
+    return "\r\n ".join(parts)
+
+
+def format_utc(value: datetime.datetime) -> str:
+    return value.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def content_lines(*lines) -> str:
+    return "".join(fold_line(line) + "\r\n" for line in lines)
+
+
+class CalendarBuilder:
+    """
+    Формирование календаря iCalendar (RFC 5545) по занятиям.
+
+    Текст VEVENT каждого занятия хранится в кэше по ключу, включающему datemodified
+    самого занятия (или его абстрактного события, если оно изменено позже) и записей,
+    из которых берутся время, место, предмет и тип,
+    поэтому блок строится заново, только если изменилась одна из этих записей.
+    Данные загружаются фиксированным числом запросов, независимо от числа занятий
+    """
+
+    event_fields = [
+        "pk",
+        "date",
+        "datemodified",
+        "abstract_event__datemodified",
+        *(f"{name}_override" for name in REFERENCED_MODELS),
+        *(f"abstract_event__{name}" for name in REFERENCED_MODELS),
+    ]
+
+    def __init__(self, events):
+        self.events = events
+        self.timezone = zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
+    def render(self, name) -> str:
+        return "".join(
+            [
+                content_lines(
+                    "BEGIN:VCALENDAR",
+                    "VERSION:2.0",
+                    f"PRODID:{PRODID}",
+                    "CALSCALE:GREGORIAN",
+                    "METHOD:PUBLISH",
+                    f"X-WR-CALNAME:{escape_text(name)}",
+                    f"X-WR-TIMEZONE:{settings.TIME_ZONE}",
+                ),
+                *self.vevents(),
+                content_lines("END:VCALENDAR"),
+            ]
+        )
+
+    def vevents(self):
+        rows = list(
+            self.events.exclude(date=None).order_by("date", "pk").values_list(*self.event_fields)
+        )
+        events = [self._resolve(row) for row in rows]
+        referenced = {
+            model: self._load(model, {event[name] for event in events} - {None})
+            for name, model in REFERENCED_MODELS.items()
+        }
+
+        keys = {}
+        for event in events:
+            related = {
+                name: referenced[model].get(event[name]) for name, model in REFERENCED_MODELS.items()
+            }
+            # Занятия без времени проведения нельзя поместить в календарь
+            if related["time_slot"] is not None:
+                keys[self._cache_key(event, related)] = (event, related)
+
+        blocks = cache.get_many(keys.keys())
+        missing = {key: self._vevent(*keys[key]) for key in keys.keys() - blocks.keys()}
+        if missing:
+            cache.set_many(missing, timeout=settings.API_CALENDAR_EVENT_CACHE_TIMEOUT)
+            blocks.update(missing)
+        return [blocks[key] for key in keys]
+
+    @staticmethod
+    def _resolve(row):
+        pk, date, datemodified, template_modified = row[:4]
+        overrides = row[4 : 4 + len(REFERENCED_MODELS)]
+        fallbacks = row[4 + len(REFERENCED_MODELS) :]
+        # Изменение абстрактного события (например, его времени) меняет и занятие
+        if template_modified is not None:
+            datemodified = max(datemodified, template_modified)
+        event = {"pk": pk, "date": date, "datemodified": datemodified}
+        for name, override, fallback in zip(REFERENCED_MODELS, overrides, fallbacks):
+            event[name] = override if override is not None else fallback
+        return event
+
+    @staticmethod
+    def _load(model, ids):
+        fields = ["pk", "datemodified", *REFERENCED_FIELDS[model]]
+        return {
+            values["pk"]: values
+            for values in model.objects.filter(pk__in=ids).values(*fields)
+        }
+
+    @staticmethod
+    def _cache_key(event, related):
+        stamps = [(event["pk"], event["date"], event["datemodified"])]
+        for name in REFERENCED_MODELS:
+            record = related[name]
+            stamps.append((record["pk"], record["datemodified"]) if record else None)
+        raw = repr(stamps).encode("utf-8")
+        return VEVENT_KEY.format(hashlib.sha1(raw).hexdigest())
+
+    def _vevent(self, event, related) -> str:
+        time_slot, place, subject, kind = (related[name] for name in REFERENCED_MODELS)
+        start = datetime.datetime.combine(event["date"], time_slot["start_time"], self.timezone)
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:event-{event['pk']}@{UID_DOMAIN}",
+            f"DTSTAMP:{format_utc(event['datemodified'])}",
+            f"DTSTART:{format_utc(start)}",
+        ]
+        if time_slot["end_time"]:
+            end = datetime.datetime.combine(event["date"], time_slot["end_time"], self.timezone)
+            lines.append(f"DTEND:{format_utc(end)}")
+
+        summary = subject["name"] if subject else "Занятие"
+        if kind:
+            summary = f"{summary} ({kind['name']})"
+        lines.append(f"SUMMARY:{escape_text(summary)}")
+        if place:
+            location = "{}, {}".format(place["building"], place["room"])
+            lines.append(f"LOCATION:{escape_text(location)}")
+        if kind:
+            lines.append(f"CATEGORIES:{escape_text(kind['name'])}")
+        lines.append("END:VEVENT")
+        return content_lines(*lines)
@@ -1,14 +1,39 @@
+import hashlib
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ProtectedError
 from rest_framework.exceptions import ValidationError
 
+from api.caching import bump_model_versions
+from api.chunking import QUERY_CHUNK_SIZE, chunked
+
 from api.models import (
     Event,
     EventKind,
+    EventMembership,
     EventParticipant,
     EventPlace,
+    ImportDigest,
+    ImportRun,
     Schedule,
     Subject,
     TimeSlot,
 )
+from api.json_stream import count_json_sections, iter_json_sections
+
+# Разделитель idnumber события и idnumber элемента holding_info в idnumber записи Event
+HOLDING_IDNUMBER_SEPARATOR = "#"
+
+
+def item_digest(item) -> str:
+    """Хэш содержимого объекта документа, не зависящий от порядка ключей"""
+    raw = json.dumps(
+        item, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
 
 class JSONImporter:
@@ -16,8 +41,35 @@ class JSONImporter:
     Описание формата следует смотреть в классе ImportJSONAPIView в файле views.py
     """
 
-    def __init__(self, json_data):
+    # Разделы с записями без ссылок: раздел -> (модель, поля записи кроме idnumber)
+    simple_sections = {
+        "subjects": (Subject, ["name"]),
+        "event_kinds": (EventKind, ["name"]),
+        "time_slots": (TimeSlot, ["start_time", "end_time"]),
+        "event_places": (EventPlace, ["building", "room"]),
+        "event_participants": (EventParticipant, ["name", "role"]),
+        "schedules": (Schedule, ["faculty", "scope", "course", "semester", "years"]),
+    }
+    # Порядок разделов важен: события ссылаются на записи остальных разделов
+    sections = [*simple_sections, "events"]
+    # Обязательные поля события и элемента его holding_info
+    event_fields = ["subject_id", "kind_id", "schedule_id"]
+    holding_fields = ["idnumber", "date", "place_id", "slot_id"]
+
+    def __init__(
+        self, json_data=None, run=None, batch_size=None, source="", mode=ImportRun.Mode.FULL
+    ):
+        """
+        run - запуск импорта (ImportRun) для продолжения прерванного импорта,
+        если не задан, создается новый. batch_size - число записей раздела,
+        записываемых в одной транзакции (по умолчанию API_IMPORT_CHUNK_SIZE).
+        mode - режим импорта (см. ImportRun.Mode), при продолжении берется из run
+        """
         self.json = json_data
+        self.run = run
+        self.batch_size = batch_size or settings.API_IMPORT_CHUNK_SIZE
+        self.source = source
+        self.mode = run.mode if run is not None else mode
 
     def _check_idnumber(self, item):
         if "idnumber" not in item:
@@ -29,111 +81,495 @@ class JSONImporter:
             )
         return True
 
+    @classmethod
+    def validate_document(cls, document) -> dict:
+        """
+        Проверка структуры документа без обращения к БД: разделы являются списками,
+        у записей есть idnumber и обязательные поля. Ссылки между записями не проверяются.
+        Возвращает ошибки по разделам, пустой словарь - документ корректен
+        """
+        if not isinstance(document, dict):
+            return {"json": ["Документ должен быть объектом"]}
+        errors = {}
+        for section in cls.sections:
+            items = document.get(section, [])
+            if not isinstance(items, list):
+                errors[section] = ["Раздел должен быть списком"]
+                continue
+            if section == "events":
+                required = ["idnumber", *cls.event_fields]
+            else:
+                required = ["idnumber", *cls.simple_sections[section][1]]
+            section_errors = []
+            for index, item in enumerate(items):
+                missing = [field for field in required if field not in item]
+                if section == "events":
+                    missing += [
+                        f"holding_info.{field}"
+                        for holding in item.get("holding_info") or []
+                        for field in cls.holding_fields
+                        if field not in holding
+                    ]
+                if missing:
+                    section_errors.append({"index": index, "missing": sorted(set(missing))})
+            if section_errors:
+                errors[section] = section_errors
+        return errors
+
     def import_data(self):
+        self.import_batches(
+            (
+                (section, batch)
+                for section in self.sections
+                for batch in chunked(self.json.get(section, []), self.batch_size)
+            ),
+            totals={section: len(self.json.get(section, [])) for section in self.sections},
+        )
+
+    def import_stream(self, stream):
+        """
+        Импорт из файла или потока запроса без загрузки документа в память целиком:
+        разделы разбираются по мере чтения и записываются пачками по batch_size.
+        Разделы обрабатываются в порядке следования в документе, поэтому события
+        должны идти после записей, на которые они ссылаются.
+        Если поток поддерживает seek, число записей разделов для отчета о ходе
+        импорта подсчитывается предварительным проходом по документу
+        """
+        try:
+            totals = None
+            if getattr(stream, "seekable", lambda: False)():
+                position = stream.tell()
+                totals = count_json_sections(stream)
+                stream.seek(position)
+            self.import_batches(iter_json_sections(stream, self.batch_size), totals)
+        except json.JSONDecodeError as e:
+            raise ValidationError({"json": [f"Некорректный JSON: {e.msg}"]})
+
+    def import_batches(self, batches, totals=None):
+        """
+        Импорт из последовательности пар (раздел, список записей).
+        Каждая пачка записывается в своей транзакции вместе с контрольной точкой в self.run,
+        записи, обработанные предыдущими попытками этого запуска, пропускаются
+        """
+        if self.run is None:
+            self.run = ImportRun.objects.create(source=self.source, mode=self.mode)
+        self.run.start_attempt()
+        if totals is not None:
+            self.run.set_totals(totals)
+
         try:
-            self._import_data()
+            for section, items in self._pending_batches(batches):
+                with transaction.atomic():
+                    schedule_ids, counters = self._import_batch(section, items)
+                    # bulk_create не вызывает сигналы, поэтому границы расписаний и версии данных
+                    # для кэша ответов обновляются явно
+                    if schedule_ids:
+                        Schedule.refresh_dates(schedule_ids)
+                    self.run.advance(section, len(items), counters)
+                if counters["created"] or counters["updated"]:
+                    self._bump_versions()
+
+            if self.mode in ImportRun.DIFF_MODES:
+                with transaction.atomic():
+                    deleted = self._delete_missing()
+                if deleted:
+                    self._bump_versions()
         except KeyError as e:
+            self.run.finish(error=f"Обязательное поле: {e}")
             raise ValidationError({str(e): ["Обязательное поле."]})
+        except ValidationError as e:
+            self.run.finish(error=json.dumps(e.detail, ensure_ascii=False))
+            raise
+        except Exception as e:
+            self.run.finish(error=str(e) or type(e).__name__)
+            raise
+        self.run.finish()
 
-    def _import_data(self):
-        data = self.json
+    def _pending_batches(self, batches):
+        seen = defaultdict(int)
+        for section, items in batches:
+            skip = max(self.run.done(section) - seen[section], 0)
+            seen[section] += len(items)
+            if len(items) > skip:
+                yield section, items[skip:]
 
-        # Загрузка Subjects
-        subjects = [
-            Subject(idnumber=item["idnumber"], name=item["name"])
-            for item in data.get("subjects", [])
-            if self._check_idnumber(item)
-        ]
-        Subject.objects.bulk_create(
-            subjects, update_conflicts=True, unique_fields=["idnumber"], update_fields=["name"]
+    @staticmethod
+    def _bump_versions():
+        bump_model_versions(
+            Subject, EventKind, TimeSlot, EventPlace, EventParticipant, Schedule, Event
         )
 
-        # Загрузка EventKinds
-        event_kinds = [
-            EventKind(idnumber=item["idnumber"], name=item["name"])
-            for item in data.get("event_kinds", [])
-            if self._check_idnumber(item)
-        ]
-        EventKind.objects.bulk_create(
-            event_kinds, update_conflicts=True, unique_fields=["idnumber"], update_fields=["name"]
-        )
-
-        # Загрузка TimeSlots
-        time_slots = [
-            TimeSlot(
-                idnumber=item["idnumber"], start_time=item["start_time"], end_time=item["end_time"]
+    def _import_batch(self, section, items):
+        """
+        Импорт пачки записей раздела с учетом хэшей содержимого (ImportDigest).
+        В режимах DIFF и SNAPSHOT записываются только новые и изменившиеся объекты.
+        Возвращает идентификаторы затронутых расписаний и счетчики created/updated/unchanged
+        """
+        items = [item for item in items if self._check_idnumber(item)]
+        digests = {item["idnumber"]: item_digest(item) for item in items}
+        known = {}
+        for chunk in chunked(digests, QUERY_CHUNK_SIZE):
+            known.update(
+                ImportDigest.objects.filter(section=section, idnumber__in=chunk).values_list(
+                    "idnumber", "digest"
+                )
             )
-            for item in data.get("time_slots", [])
-            if self._check_idnumber(item)
-        ]
-        TimeSlot.objects.bulk_create(
-            time_slots,
-            update_conflicts=True,
-            unique_fields=["idnumber"],
-            update_fields=["start_time", "end_time"],
-        )
 
-        # Загрузка EventPlaces
-        event_places = [
-            EventPlace(idnumber=item["idnumber"], building=item["building"], room=item["room"])
-            for item in data.get("event_places", [])
-            if self._check_idnumber(item)
-        ]
-        EventPlace.objects.bulk_create(
-            event_places,
-            update_conflicts=True,
-            unique_fields=["idnumber"],
-            update_fields=["building", "room"],
-        )
+        if self.mode in ImportRun.DIFF_MODES:
+            changed = [
+                item for item in items if known.get(item["idnumber"]) != digests[item["idnumber"]]
+            ]
+        else:
+            changed = items
+        changed_idnumbers = {item["idnumber"] for item in changed}
+        existing = self._existing_items(section, changed, known)
+        schedule_ids = self.import_section(section, changed) if changed else set()
 
-        # Загрузка EventParticipants
-        event_participants = [
-            EventParticipant(idnumber=item["idnumber"], name=item["name"], role=item["role"])
-            for item in data.get("event_participants", [])
-            if self._check_idnumber(item)
-        ]
-        EventParticipant.objects.bulk_create(
-            event_participants,
+        ImportDigest.objects.bulk_create(
+            [
+                ImportDigest(
+                    section=section, idnumber=idnumber, digest=digests[idnumber], run=self.run
+                )
+                for idnumber in changed_idnumbers
+            ],
             update_conflicts=True,
-            unique_fields=["idnumber"],
-            update_fields=["name", "role"],
+            unique_fields=["section", "idnumber"],
+            update_fields=["digest", "run"],
         )
+        unchanged = digests.keys() - changed_idnumbers
+        for chunk in chunked(unchanged, QUERY_CHUNK_SIZE):
+            ImportDigest.objects.filter(section=section, idnumber__in=chunk).update(run=self.run)
 
-        # Загрузка Schedules
-        schedules = [
-            Schedule(
-                idnumber=item["idnumber"],
-                faculty=item["faculty"],
-                scope=item["scope"],
-                course=item["course"],
-                semester=item["semester"],
-                years=item["years"],
+        counters = {
+            "created": len(changed_idnumbers - existing),
+            "updated": len(changed_idnumbers & existing),
+            "unchanged": len(unchanged),
+        }
+        return schedule_ids, counters
+
+    def _existing_items(self, section, items, known) -> set:
+        """
+        idnumber объектов раздела, уже имеющих записи в БД. Объекты с известным хэшем
+        импортировались ранее, остальные ищутся по индексу idnumber их записей
+        """
+        existing = {item["idnumber"] for item in items if item["idnumber"] in known}
+        records = {}
+        for item in items:
+            if item["idnumber"] in existing:
+                continue
+            records[item["idnumber"]] = item["idnumber"]
+            if section == "events":
+                for holding in item.get("holding_info") or []:
+                    idnumber = self.holding_idnumber(item["idnumber"], holding["idnumber"])
+                    records[idnumber] = item["idnumber"]
+        if section == "events":
+            model = Event
+        elif section in self.simple_sections:
+            model = self.simple_sections[section][0]
+        else:
+            return existing
+        for chunk in chunked(records, QUERY_CHUNK_SIZE):
+            found = model.objects.filter(idnumber__in=chunk).values_list("idnumber", flat=True)
+            existing.update(records[idnumber] for idnumber in found)
+        return existing
+
+    def _delete_missing(self) -> bool:
+        """
+        Удаляет записи объектов, которые были импортированы ранее, но отсутствуют в документе
+        этого запуска. Рассматриваются только разделы, непустые в документе,
+        события удаляются первыми, так как ссылаются на записи остальных разделов.
+        Записи, на которые ссылаются другие записи (PROTECT), остаются.
+
+        Документ в режиме DIFF может описывать только часть данных (например, один факультет),
+        поэтому удаляются только занятия расписаний из раздела schedules документа.
+        Во всей БД и во всех разделах отсутствующие объекты удаляются только в режиме SNAPSHOT
+        """
+        deleted_any = False
+        present = [section for section in reversed(self.sections) if self.run.done(section)]
+        schedule_ids = None
+        if self.mode != ImportRun.Mode.SNAPSHOT:
+            present = [section for section in present if section == "events"]
+            schedule_ids = Schedule.objects.filter(
+                idnumber__in=ImportDigest.objects.filter(
+                    section="schedules", run=self.run
+                ).values("idnumber")
+            ).values("pk")
+        for section in present:
+            missing = list(
+                ImportDigest.objects.filter(section=section)
+                .exclude(run=self.run)
+                .values_list("idnumber", flat=True)
+            )
+            deleted, protected, affected_schedule_ids = 0, 0, set()
+            for chunk in chunked(missing, QUERY_CHUNK_SIZE):
+                in_scope, chunk_deleted, chunk_schedule_ids = self._delete_items(
+                    section, chunk, schedule_ids
+                )
+                deleted += chunk_deleted
+                protected += len(in_scope) - chunk_deleted
+                affected_schedule_ids |= chunk_schedule_ids
+                ImportDigest.objects.filter(section=section, idnumber__in=in_scope).delete()
+            if affected_schedule_ids:
+                Schedule.refresh_dates(affected_schedule_ids)
+            counters = {"deleted": deleted}
+            if protected:
+                counters["protected"] = protected
+            self.run.count(section, counters)
+            deleted_any = deleted_any or bool(deleted)
+        self.run.save(update_fields=["summary", "updated_at"])
+        return deleted_any
+
+    def _delete_items(self, section, idnumbers, schedule_ids=None):
+        """
+        Удаляет записи объектов раздела. schedule_ids (queryset pk расписаний), если задан,
+        ограничивает удаление занятиями этих расписаний. Возвращает idnumber объектов,
+        попавших в эти границы, число удаленных объектов и расписания удаленных занятий
+        """
+        if section == "events":
+            found = set()
+            for chunk in chunked(idnumbers, QUERY_CHUNK_SIZE):
+                records = self._event_records(chunk)
+                if schedule_ids is not None:
+                    records = records.filter(schedule_id__in=schedule_ids)
+                found.update(records.values_list("event_idnumber", "schedule_id"))
+                Event.objects.filter(pk__in=records.values("pk")).delete()
+            deleted = {idnumber for idnumber, _ in found}
+            in_scope = idnumbers if schedule_ids is None else deleted
+            return in_scope, len(deleted), {pk for _, pk in found}
+        if section not in self.simple_sections:
+            return idnumbers, len(idnumbers), set()
+
+        model = self.simple_sections[section][0]
+        try:
+            with transaction.atomic():
+                counts = model.objects.filter(idnumber__in=idnumbers).delete()[1]
+            return idnumbers, counts.get(model._meta.label, 0), set()
+        except ProtectedError:
+            deleted = 0
+            for record in model.objects.filter(idnumber__in=idnumbers):
+                try:
+                    with transaction.atomic():
+                        record.delete()
+                    deleted += 1
+                except ProtectedError:
+                    pass
+            return idnumbers, deleted, set()
+
+    def import_section(self, section, items) -> set:
+        """Импорт пачки записей раздела, возвращает идентификаторы затронутых расписаний"""
+        items = [item for item in items if self._check_idnumber(item)]
+        if section == "events":
+            return self._import_events(items)
+        if section in self.simple_sections:
+            model, fields = self.simple_sections[section]
+            model.objects.bulk_create(
+                [
+                    model(idnumber=item["idnumber"], **{field: item[field] for field in fields})
+                    for item in items
+                ],
+                update_conflicts=True,
+                unique_fields=["idnumber"],
+                update_fields=[*fields, "datemodified"],
             )
-            for item in data.get("schedules", [])
-            if self._check_idnumber(item)
+        return set()
+
+    @staticmethod
+    def _resolve_idnumbers(model, idnumbers) -> dict:
+        """Словарь idnumber -> pk для записей model, одним запросом на пачку идентификаторов"""
+        resolved = {}
+        for chunk in chunked(set(idnumbers), QUERY_CHUNK_SIZE):
+            resolved.update(
+                model.objects.filter(idnumber__in=chunk).values_list("idnumber", "pk")
+            )
+        return resolved
+
+    def _resolve_references(self, references) -> dict:
+        """
+        Разрешает все ссылки по idnumber сразу.
+        references - словарь {ключ ссылки: (модель, множество idnumber)},
+        результат - {ключ ссылки: {idnumber: pk}}.
+        Все неизвестные ссылки сообщаются вместе одной ошибкой ValidationError
+        """
+        resolved = {}
+        unknown = {}
+        for key, (model, idnumbers) in references.items():
+            # null в ссылке означает отсутствие значения (например, занятие без места)
+            idnumbers = idnumbers - {None}
+            resolved[key] = {None: None, **self._resolve_idnumbers(model, idnumbers)}
+            missing = idnumbers - resolved[key].keys()
+            if missing:
+                unknown[key] = sorted(missing, key=str)
+        if unknown:
+            raise ValidationError({"unknown_references": unknown})
+        return resolved
+
+    @staticmethod
+    def holding_idnumber(event_idnumber, holding_idnumber):
+        """
+        idnumber записи Event для одного элемента holding_info события.
+        Событие без holding_info хранится одной записью с idnumber самого события,
+        ее же описывает элемент с idnumber null (так выгружаются занятия, созданные не импортом)
+        """
+        if holding_idnumber is None:
+            return event_idnumber
+        return f"{event_idnumber}{HOLDING_IDNUMBER_SEPARATOR}{holding_idnumber}"
+
+    def _import_events(self, event_items) -> set:
+        """
+        Каждый элемент holding_info события становится отдельной записью Event
+        с датой, местом и временем проведения в полях *_override.
+        Возвращает идентификаторы затронутых расписаний
+        """
+        holdings = [
+            (item, holding)
+            for item in event_items
+            for holding in (item.get("holding_info") or [None])
         ]
-        Schedule.objects.bulk_create(
-            schedules,
-            update_conflicts=True,
-            unique_fields=["idnumber"],
-            update_fields=["faculty", "scope", "course", "semester", "years"],
+        references = self._resolve_references(
+            {
+                "subject_id": (Subject, {item["subject_id"] for item in event_items}),
+                "kind_id": (EventKind, {item["kind_id"] for item in event_items}),
+                "schedule_id": (Schedule, {item["schedule_id"] for item in event_items}),
+                "participants": (
+                    EventParticipant,
+                    {idnumber for item in event_items for idnumber in item.get("participants", [])},
+                ),
+                "place_id": (
+                    EventPlace,
+                    {holding["place_id"] for _, holding in holdings if holding},
+                ),
+                "slot_id": (TimeSlot, {holding["slot_id"] for _, holding in holdings if holding}),
+            }
         )
 
-        # Загрузка Events
         events = []
-        for item in data.get("events", []):
-            self._check_idnumber(item)
+        for item, holding in holdings:
             event = Event(
                 idnumber=item["idnumber"],
-                subject=Subject.objects.get(idnumber=item["subject_id"]),
-                kind=EventKind.objects.get(idnumber=item["kind_id"]),
-                schedule=Schedule.objects.get(idnumber=item["schedule_id"]),
+                event_idnumber=item["idnumber"],
+                subject_override_id=references["subject_id"][item["subject_id"]],
+                kind_override_id=references["kind_id"][item["kind_id"]],
+                schedule_id=references["schedule_id"][item["schedule_id"]],
             )
+            if holding is not None:
+                self._check_idnumber(holding)
+                event.idnumber = self.holding_idnumber(item["idnumber"], holding["idnumber"])
+                if holding["idnumber"] is not None:
+                    event.holding_idnumber = str(holding["idnumber"])
+                event.date = holding["date"]
+                event.place_override_id = references["place_id"][holding["place_id"]]
+                event.time_slot_override_id = references["slot_id"][holding["slot_id"]]
             events.append(event)
 
         Event.objects.bulk_create(
             events,
             update_conflicts=True,
             unique_fields=["idnumber"],
-            update_fields=["subject", "kind", "schedule"],
-        )
\ No newline at end of file
+            update_fields=[
+                "subject_override",
+                "kind_override",
+                "schedule",
+                "date",
+                "place_override",
+                "time_slot_override",
+                "event_idnumber",
+                "holding_idnumber",
+                "datemodified",
+            ],
+        )
+        event_ids = self._resolve_idnumbers(Event, [event.idnumber for event in events])
+        stale_schedule_ids = self._delete_stale_holdings(
+            {item["idnumber"] for item in event_items}, event_ids.keys()
+        )
+
+        self._sync_participants(
+            {
+                event_ids[event.idnumber]: {
+                    references["participants"][idnumber] for idnumber in item["participants"]
+                }
+                for (item, _), event in zip(holdings, events)
+                if "participants" in item
+            }
+        )
+        # bulk_create не вызывает сигналы, поэтому участники занятий пересчитываются явно
+        for chunk in chunked(list(event_ids.values()), QUERY_CHUNK_SIZE):
+            EventMembership.refresh(Event.objects.filter(pk__in=chunk))
+        return {event.schedule_id for event in events} | stale_schedule_ids
+
+    @staticmethod
+    def _event_records(event_idnumbers):
+        """Записи Event событий документа (по индексу Event.event_idnumber)"""
+        return Event.objects.filter(event_idnumber__in=event_idnumbers)
+
+    def _delete_stale_holdings(self, event_idnumbers, imported_idnumbers) -> set:
+        """
+        Удаляет записи Event импортированных событий, которых больше нет в их holding_info.
+        Возвращает идентификаторы расписаний удаленных записей
+        """
+        stale = {}
+        for chunk in chunked(event_idnumbers, QUERY_CHUNK_SIZE):
+            for pk, idnumber, schedule_id in self._event_records(chunk).values_list(
+                "pk", "idnumber", "schedule_id"
+            ):
+                if idnumber not in imported_idnumbers:
+                    stale[pk] = schedule_id
+        for chunk in chunked(stale, QUERY_CHUNK_SIZE):
+            Event.objects.filter(pk__in=chunk).delete()
+        return set(stale.values())
+
+    @staticmethod
+    def _sync_participants(participants):
+        """
+        Приводит participants_override событий к заданным множествам участников
+        ({pk события: {pk участника}}): недостающие связи добавляются одним bulk_create
+        на пачку событий, лишние удаляются по разности множеств
+        """
+        through = Event.participants_override.through
+        for chunk in chunked(participants, QUERY_CHUNK_SIZE):
+            existing = {
+                (event_id, participant_id): pk
+                for pk, event_id, participant_id in through.objects.filter(
+                    event_id__in=chunk
+                ).values_list("pk", "event_id", "eventparticipant_id")
+            }
+            required = {
+                (event_id, participant_id)
+                for event_id in chunk
+                for participant_id in participants[event_id]
+            }
+            stale = [existing[link] for link in existing.keys() - required]
+            for stale_chunk in chunked(stale, QUERY_CHUNK_SIZE):
+                through.objects.filter(pk__in=stale_chunk).delete()
+            through.objects.bulk_create(
+                through(event_id=event_id, eventparticipant_id=participant_id)
+                for event_id, participant_id in required - existing.keys()
+            )
+
+
+def run_import_job(run):
+    """
+    Выполняет задание импорта из очереди (см. ImportRun.claim_next): документ читается
+    из сохраненного файла (после успешного импорта файл удаляется) либо из внешней БД.
+    Ошибка импорта сохраняется в задании и пробрасывается дальше
+    """
+    try:
+        if run.database:
+            # Импорт из внешней БД использует JSONImporter, поэтому импортируется здесь
+            from api.db_import import DatabaseImporter
+
+            DatabaseImporter(run.database, run=run).import_data()
+        else:
+            with run.file.open("rb") as stream:
+                JSONImporter(run=run).import_stream(stream)
+    except Exception as e:
+        # Ошибки до начала записи пачек (например, некорректный JSON при подсчете записей)
+        # не проходят через import_batches, поэтому задание завершается здесь
+        if run.status != ImportRun.Status.FAILED:
+            detail = e.detail if isinstance(e, ValidationError) else str(e) or type(e).__name__
+            if not isinstance(detail, str):
+                detail = json.dumps(detail, ensure_ascii=False)
+            run.finish(error=detail)
+        raise
+    if run.file:
+        run.file.delete(save=False)
+        run.save(update_fields=["file"])
@@ -0,0 +1,129 @@
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_CHARS = re.compile(r"[0-9eE.+-]*")
+
+
+class JSONStreamReader:
+    """
+    Последовательное чтение JSON-значений из файла или потока запроса.
+
+    В памяти хранится только непрочитанный остаток буфера и текущее значение,
+    поэтому потребление памяти не зависит от размера всего документа
+    """
+
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+        self._bytes_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+    def _fill(self, size=None):
+        if self.pos:
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        chunk = self.stream.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+        if isinstance(chunk, bytes) or not chunk:
+            chunk = self._bytes_decoder.decode(chunk or b"", final=self.eof)
+        self.buffer += chunk
+
+    def peek(self) -> str:
+        """Следующий значащий символ (без его чтения) или пустая строка в конце потока"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos : self.pos + 1]
+            self._fill()
+
+    def read_char(self) -> str:
+        char = self.peek()
+        self.pos += len(char)
+        return char
+
+    def expect(self, expected):
+        char = self.read_char()
+        if char != expected:
+            raise json.JSONDecodeError(f"Ожидается '{expected}'", self.buffer, self.pos)
+
+    def read_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # Значение обрезано концом буфера: дочитываем (с ростом порции, чтобы
+                # длинное значение не разбиралось заново квадратичное число раз)
+                self._fill(max(self.chunk_size, len(self.buffer)))
+                continue
+            if (
+                not self.eof
+                and not isinstance(value, (dict, list, str))
+                and NUMBER_CHARS.match(self.buffer, end).end() == len(self.buffer)
+            ):
+                # Число на границе буфера может продолжаться в следующей порции
+                # (например, "-2.5" из "-2.5e10")
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def skip_separator(self, closing) -> bool:
+        """Читает "," или закрывающую скобку, возвращает True, если контейнер закончился"""
+        char = self.read_char()
+        if char == closing:
+            return True
+        if char != ",":
+            raise json.JSONDecodeError(f"Ожидается ',' или '{closing}'", self.buffer, self.pos)
+        return False
+
+
+def iter_json_sections(stream, batch_size, chunk_size=64 * 1024):
+    """
+    Разбирает документ вида {"раздел": [элемент, ...], ...} по мере чтения stream
+    и выдает пары (раздел, список элементов) размером не более batch_size.
+    Значения разделов, не являющиеся списками, пропускаются
+    """
+    reader = JSONStreamReader(stream, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        section = reader.read_value()
+        reader.expect(":")
+        if reader.peek() != "[":
+            reader.read_value()
+        else:
+            reader.expect("[")
+            batch = []
+            closed = reader.peek() == "]"
+            if closed:
+                reader.expect("]")
+            while not closed:
+                batch.append(reader.read_value())
+                if len(batch) >= batch_size:
+                    yield section, batch
+                    batch = []
+                closed = reader.skip_separator("]")
+            if batch:
+                yield section, batch
+
+        if reader.skip_separator("}"):
+            break
+
+
+def count_json_sections(stream, chunk_size=64 * 1024) -> dict:
+    """Число элементов в каждом разделе-списке документа"""
+    counts = {}
+    for section, batch in iter_json_sections(stream, 1000, chunk_size):
+        counts[section] = counts.get(section, 0) + len(batch)
+    return counts
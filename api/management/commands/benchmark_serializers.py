@@ -0,0 +1,120 @@
+import datetime
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import (
+    AbstractDay,
+    AbstractEvent,
+    Event,
+    EventKind,
+    EventParticipant,
+    EventPlace,
+    Schedule,
+    Subject,
+    TimeSlot,
+)
+from api.projections import Projection
+from api.query_planning import QueryPlan
+from api.serializers import EventSerializer
+from api.views import EventViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает скорость вывода списка занятий через сериализатор DRF и через проекцию, "
+        "а также размер и время разбора ответа в разных форматах. "
+        "Тестовые данные создаются в транзакции, которая затем откатывается"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000, help="Число занятий")
+        parser.add_argument("--repeat", type=int, default=3, help="Число повторов замера")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._create_events(options["rows"])
+            self._benchmark(options["repeat"])
+            transaction.set_rollback(True)
+
+    def _create_events(self, rows):
+        schedule = Schedule.objects.create(
+            faculty="bench", scope=Schedule.Scope.BACHELOR, course=1, semester=1, years="bench"
+        )
+        kind = EventKind.objects.create(name="Лекция")
+        subject = Subject.objects.create(name="Предмет")
+        place = EventPlace.objects.create(building="Корпус", room="101")
+        time_slot = TimeSlot.objects.create(
+            start_time=datetime.time(8, 30), end_time=datetime.time(10, 0)
+        )
+        day = AbstractDay.objects.create(day_number=0, name="Понедельник")
+        participants = EventParticipant.objects.bulk_create(
+            EventParticipant(name=f"Группа {i}", role=EventParticipant.Role.STUDENT)
+            for i in range(4)
+        )
+        abstract_event = AbstractEvent.objects.create(
+            kind=kind, subject=subject, place=place, abstract_day=day, time_slot=time_slot
+        )
+        abstract_event.participants.set(participants[:2])
+
+        start = datetime.date(2024, 9, 1)
+        events = Event.objects.bulk_create(
+            Event(
+                schedule=schedule,
+                abstract_event=abstract_event,
+                date=start + datetime.timedelta(days=i % 120),
+                place_override=place if i % 3 == 0 else None,
+            )
+            for i in range(rows)
+        )
+        through = Event.participants_override.through
+        through.objects.bulk_create(
+            through(event_id=event.pk, eventparticipant_id=participants[2].pk)
+            for event in events[::2]
+        )
+
+    def _benchmark(self, repeat):
+        queryset = QueryPlan.for_serializer(EventSerializer).apply(Event.objects.all())
+        projection = Projection.for_serializer(EventSerializer)
+
+        serializer_time = self._measure(
+            lambda: EventSerializer(queryset.all(), many=True).data, repeat
+        )
+        projection_time = self._measure(lambda: projection.evaluate(queryset.all()), repeat)
+
+        rows = queryset.count()
+        self.stdout.write(f"Занятий: {rows}")
+        self.stdout.write(f"Сериализатор DRF: {rows / serializer_time:.0f} записей/с")
+        self.stdout.write(f"Проекция: {rows / projection_time:.0f} записей/с")
+        self.stdout.write(
+            self.style.SUCCESS(f"Ускорение: {serializer_time / projection_time:.1f}x")
+        )
+
+        data = projection.evaluate(queryset.all())
+        renderer_context = {"view": EventViewSet}
+        renderers = {renderer.format: renderer for renderer in EventViewSet.renderer_classes}
+        payloads = [
+            ("JSON", "json", json.loads),
+            ("MessagePack", "msgpack", msgpack.unpackb),
+            ("Колоночный JSON", "columnar", json.loads),
+        ]
+        for name, renderer_format, parse in payloads:
+            renderer = renderers[renderer_format]()
+            content = renderer.render(data, renderer_context=renderer_context)
+            parse_time = self._measure(lambda: parse(content), repeat)
+            self.stdout.write(
+                f"{name}: {len(content) / 1024:.0f} КБ, разбор {parse_time * 1000:.1f} мс"
+            )
+
+    @staticmethod
+    def _measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.expansion import ScheduleExpander
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит занятия расписаний с абстрактным расписанием по шаблонам (AbstractEvent) "
+        "с учетом переносов дней"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "schedules", nargs="*", type=int, help="ID расписаний (по умолчанию - все расписания)"
+        )
+        parser.add_argument(
+            "--virtual",
+            action="store_true",
+            help=(
+                "Не хранить занятия по шаблонам (они вычисляются при чтении с ?virtual=1): "
+                "удалить неизмененные занятия, оставив только исключения"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        expander = ScheduleExpander(
+            options["schedules"] or None, materialize=not options["virtual"]
+        )
+        started = time.perf_counter()
+        stats = expander.expand()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Расписаний: {stats['schedules']}, создано занятий: {stats['created']}, "
+            f"удалено: {stats['deleted']}, без изменений: {stats['unchanged']}, "
+            f"измененных вручную вне шаблона: {stats['kept']}"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Занятия построены за {elapsed:.1f} с"))
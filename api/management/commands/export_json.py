@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from api.exporters import JSONExporter
+from api.models import Schedule
+
+
+class Command(BaseCommand):
+    help = "Выгружает базу данных в формате JSON-импорта (см. /api/import/json/)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", nargs="?", help="Файл для выгрузки (по умолчанию - stdout)")
+        parser.add_argument(
+            "--schedule", type=int, action="append", help="ID расписания (можно несколько)"
+        )
+        parser.add_argument("--faculty", help="Факультет расписаний")
+        parser.add_argument(
+            "--status", type=int, choices=Schedule.Status.values, help="Статус расписаний"
+        )
+
+    def handle(self, *args, **options):
+        exporter = JSONExporter(
+            schedules=options["schedule"], faculty=options["faculty"], status=options["status"]
+        )
+        if options["output"]:
+            with open(options["output"], "wb") as fd:
+                exporter.write(fd)
+            self.stderr.write(self.style.SUCCESS(f"Данные выгружены в {options['output']}"))
+        else:
+            exporter.write(sys.stdout.buffer)
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.db_import import DatabaseImporter
+from api.models import ImportRun
+
+
+class Command(BaseCommand):
+    help = "Импортирует данные из внешней БД, описанной в API_DB_IMPORT_SOURCES, без очереди"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Имя источника в API_DB_IMPORT_SOURCES")
+        parser.add_argument(
+            "--mode", choices=ImportRun.Mode.values, default=ImportRun.Mode.FULL, help="Режим"
+        )
+        parser.add_argument("--batch-size", type=int, default=None, help="Размер пачки записей")
+
+    def handle(self, *args, **options):
+        importer = DatabaseImporter(
+            options["source"], batch_size=options["batch_size"], mode=options["mode"]
+        )
+        started = time.perf_counter()
+        importer.import_data()
+        elapsed = time.perf_counter() - started
+        run = importer.run
+        self.stdout.write(f"Итоги: {run.summary}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Импорт #{run.pk}: {run.rows_done} записей за {elapsed:.1f} с "
+                f"({run.rows_done / elapsed:.0f} записей/с)"
+            )
+        )
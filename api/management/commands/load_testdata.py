@@ -1,19 +1,65 @@
 import json
 import os
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from api.directory_import import DirectoryImporter
 from api.importers import JSONImporter
 
 
 class Command(BaseCommand):
-    help = "Загружает тестовые данные в базу данных"
+    help = (
+        "Загружает тестовые данные в базу данных. Файлы каталога разбираются и проверяются "
+        "параллельно, после чего объединенные записи записываются в порядке зависимостей"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "datadir", nargs="?", default="testdata", help="Каталог с JSON-файлами"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Число процессов разбора файлов (по умолчанию - число ядер)",
+        )
+        parser.add_argument(
+            "--sequential",
+            action="store_true",
+            help="Импортировать файлы по одному, потоково, без объединения в памяти",
+        )
 
-    def handle(self, *args, **kwargs):
-        datadir = os.path.abspath("testdata")
-        for file in os.listdir(datadir):
-            if file.endswith(".json"):
-                with open(os.path.join(datadir, file), "r", encoding="utf-8") as fd:
-                    data = json.load(fd)
-                    self.stdout.write(f"Заполнение данных из файла {file}")
-                    JSONImporter(data).import_data()
+    def handle(self, *args, **options):
+        datadir = os.path.abspath(options["datadir"])
+        if options["sequential"]:
+            for file in sorted(os.listdir(datadir)):
+                if file.endswith(".json"):
+                    with open(os.path.join(datadir, file), "rb") as fd:
+                        self.stdout.write(f"Заполнение данных из файла {file}")
+                        JSONImporter(source=file).import_stream(fd)
+        else:
+            importer = DirectoryImporter.from_directory(datadir, workers=options["workers"])
+            try:
+                stats = importer.import_all()
+            except ValidationError as e:
+                details = json.dumps(e.detail, ensure_ascii=False, indent=2)
+                raise CommandError(f"Ошибки в файлах данных: {details}")
+            self._report(stats, importer.workers)
         self.stdout.write(self.style.SUCCESS("Тестовые данные успешно загружены в базу данных"))
+
+    def _report(self, stats, workers):
+        parse_seconds = stats["parse_seconds"] or 1e-9
+        write_seconds = stats["write_seconds"] or 1e-9
+        self.stdout.write(
+            f"Файлов: {stats['files']}, записей: {stats['items']}, "
+            f"уникальных: {stats['unique_items']}, повторов: {stats['duplicates']} "
+            f"(с различающимся содержимым: {stats['conflicts']})"
+        )
+        self.stdout.write(
+            f"Разбор ({workers} проц.): {parse_seconds:.2f} с, "
+            f"{stats['items'] / parse_seconds:.0f} записей/с"
+        )
+        self.stdout.write(
+            f"Запись: {write_seconds:.2f} с, {stats['unique_items'] / write_seconds:.0f} записей/с"
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import EventMembership
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает таблицу участия в занятиях (EventMembership) по участникам занятий"
+
+    def handle(self, *args, **options):
+        count = EventMembership.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Записей участия в занятиях: {count}"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Schedule
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает даты начала и окончания расписаний по датам их занятий"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "schedules", nargs="*", type=int, help="ID расписаний (по умолчанию - все расписания)"
+        )
+
+    def handle(self, *args, **options):
+        schedule_ids = options["schedules"] or None
+        updated = Schedule.refresh_dates(schedule_ids)
+        self.stdout.write(self.style.SUCCESS(f"Обновлены даты расписаний: {updated}"))
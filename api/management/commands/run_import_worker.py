@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+
+from api.importers import run_import_job
+from api.models import ImportRun
+
+
+class Command(BaseCommand):
+    help = (
+        "Обработчик очереди импорта: по одному выполняет задания, поставленные в очередь "
+        "через /api/import/json/, в порядке их постановки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Выполнить задания из очереди и завершиться"
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.API_IMPORT_WORKER_POLL_INTERVAL,
+            help="Интервал проверки очереди в секундах",
+        )
+        parser.add_argument(
+            "--recover",
+            action="store_true",
+            help=(
+                "Вернуть в очередь задания, оставшиеся в состоянии выполнения после аварийной "
+                "остановки обработчика (только если других обработчиков не запущено)"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["recover"]:
+            jobs = Q(file__gt="") | Q(database__gt="")
+            recovered = ImportRun.objects.filter(jobs, status=ImportRun.Status.RUNNING).update(
+                status=ImportRun.Status.QUEUED
+            )
+            self.stdout.write(f"Возвращено в очередь заданий: {recovered}")
+
+        while True:
+            close_old_connections()
+            run = ImportRun.claim_next()
+            if run is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(f"Импорт #{run.pk}: {run.source}")
+            try:
+                run_import_job(run)
+            except Exception:
+                self.stderr.write(
+                    self.style.ERROR(f"Импорт #{run.pk} завершен с ошибкой: {run.error}")
+                )
+            else:
+                self.stdout.write(
+                    self.style.SUCCESS(f"Импорт #{run.pk} завершен, записей: {run.rows_done}")
+                )
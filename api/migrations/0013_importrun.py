@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_event_date_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.IntegerField(choices=[(0, 'Выполняется'), (1, 'Завершен'), (2, 'Ошибка')], default=0, verbose_name='Статус')),
+                ('source', models.CharField(blank=True, max_length=255, verbose_name='Источник данных')),
+                ('section', models.CharField(blank=True, max_length=64, null=True, verbose_name='Текущий раздел')),
+                ('offset', models.IntegerField(default=0, verbose_name='Обработано записей раздела')),
+                ('progress', models.JSONField(default=dict, verbose_name='Ход импорта по разделам')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Ошибка')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Время начала')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Время последней контрольной точки')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Время окончания')),
+                ('attempt_started_at', models.DateTimeField(null=True, verbose_name='Время начала текущей попытки')),
+                ('attempt_rows_before', models.IntegerField(default=0, verbose_name='Обработано записей до текущей попытки')),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Автор импорта')),
+            ],
+            options={
+                'verbose_name': 'Запуск импорта',
+                'verbose_name_plural': 'Запуски импорта',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_importrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importrun',
+            name='mode',
+            field=models.CharField(choices=[('full', 'Запись всех записей'), ('diff', 'Запись только изменившихся записей')], default='full', max_length=16, verbose_name='Режим'),
+        ),
+        migrations.AddField(
+            model_name='importrun',
+            name='summary',
+            field=models.JSONField(default=dict, verbose_name='Итоги импорта по разделам'),
+        ),
+        migrations.CreateModel(
+            name='ImportDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(max_length=64, verbose_name='Раздел')),
+                ('idnumber', models.CharField(max_length=260, verbose_name='Уникальный строковый идентификатор')),
+                ('digest', models.CharField(max_length=40, verbose_name='Хэш содержимого')),
+                ('run', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.importrun', verbose_name='Последний запуск импорта, в документе которого был объект')),
+            ],
+            options={
+                'verbose_name': 'Хэш импортированного объекта',
+                'verbose_name_plural': 'Хэши импортированных объектов',
+                'constraints': [models.UniqueConstraint(fields=('section', 'idnumber'), name='import_digest_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_import_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importrun',
+            name='file',
+            field=models.FileField(blank=True, null=True, upload_to='imports/', verbose_name='Документ задания импорта'),
+        ),
+        migrations.AlterField(
+            model_name='importrun',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Выполняется'), (1, 'Завершен'), (2, 'Ошибка'), (3, 'В очереди')], default=0, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_import_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importrun',
+            name='database',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Внешняя БД задания импорта'),
+        ),
+    ]
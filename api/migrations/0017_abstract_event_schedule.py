@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_import_database'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='abstractevent',
+            name='schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='abstract_events', to='api.schedule', verbose_name='Расписание'),
+        ),
+    ]
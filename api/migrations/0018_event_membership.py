@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_memberships(apps, schema_editor):
+    # Та же логика, что и в EventMembership.refresh, на исторических моделях
+    Event = apps.get_model("api", "Event")
+    EventMembership = apps.get_model("api", "EventMembership")
+    overridden = Event.participants_override.through.objects.filter(
+        event_id=models.OuterRef("pk")
+    )
+    sources = [
+        Event.objects.filter(participants_override__isnull=False).values_list(
+            "pk", "participants_override", "date"
+        ),
+        Event.objects.filter(
+            ~models.Exists(overridden), abstract_event__participants__isnull=False
+        ).values_list("pk", "abstract_event__participants", "date"),
+    ]
+    batch = []
+    for source in sources:
+        for event_id, participant_id, date in source.order_by().iterator(chunk_size=5000):
+            batch.append(
+                EventMembership(event_id=event_id, participant_id=participant_id, date=date)
+            )
+            if len(batch) >= 5000:
+                EventMembership.objects.bulk_create(batch)
+                batch = []
+    EventMembership.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_abstract_event_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(null=True, verbose_name='Дата')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.event', verbose_name='Занятие')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.eventparticipant', verbose_name='Участник')),
+            ],
+            options={
+                'verbose_name': 'Участие в занятии',
+                'verbose_name_plural': 'Участие в занятиях',
+                'indexes': [models.Index(fields=['participant', 'date', 'event'], name='membership_participant_idx')],
+                'constraints': [models.UniqueConstraint(fields=('event', 'participant'), name='event_membership_unique')],
+            },
+        ),
+        migrations.RunPython(fill_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_event_membership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100, unique=True, verbose_name='Модель (api.event)')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Номер версии')),
+            ],
+            options={
+                'verbose_name': 'Версия данных модели',
+                'verbose_name_plural': 'Версии данных моделей',
+            },
+        ),
+    ]
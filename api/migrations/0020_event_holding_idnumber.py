@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:58
+
+from django.db import migrations, models
+from django.db.models.functions import StrIndex, Substr
+
+
+def fill_holding_idnumbers(apps, schema_editor):
+    # Прежние записи элементов holding_info определялись по первому "#" в idnumber
+    Event = apps.get_model("api", "Event")
+    Event.objects.filter(idnumber__contains="#").update(
+        holding_idnumber=Substr("idnumber", StrIndex("idnumber", models.Value("#")) + 1)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_model_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='holding_idnumber',
+            field=models.CharField(blank=True, max_length=260, null=True, verbose_name='Элемент holding_info события'),
+        ),
+        migrations.RunPython(fill_holding_idnumbers, migrations.RunPython.noop),
+    ]
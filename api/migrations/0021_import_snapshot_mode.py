@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_event_holding_idnumber'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importrun',
+            name='mode',
+            field=models.CharField(choices=[('full', 'Запись всех записей'), ('diff', 'Запись только изменившихся записей'), ('snapshot', 'Документ - полный снимок данных')], default='full', max_length=16, verbose_name='Режим'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:12
+
+import api.caching
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_import_snapshot_mode'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='modelversion',
+            name='version',
+            field=models.BigIntegerField(default=api.caching.initial_version, verbose_name='Номер версии'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_model_version_seed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelversion',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время изменения данных'),
+        ),
+    ]
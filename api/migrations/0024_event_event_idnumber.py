@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:17
+
+from django.db import migrations, models
+from django.db.models.functions import Left, Length
+
+
+def fill_event_idnumbers(apps, schema_editor):
+    # idnumber записи элемента holding_info - "<событие>#<элемент>", остальных записей - idnumber события
+    Event = apps.get_model("api", "Event")
+    Event.objects.filter(holding_idnumber__isnull=False).update(
+        event_idnumber=Left("idnumber", Length("idnumber") - Length("holding_idnumber") - 1)
+    )
+    Event.objects.filter(holding_idnumber__isnull=True).update(event_idnumber=models.F("idnumber"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_model_version_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='event_idnumber',
+            field=models.CharField(blank=True, db_index=True, max_length=260, null=True, verbose_name='Событие импорта'),
+        ),
+        migrations.RunPython(fill_event_idnumbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_original_dates(apps, schema_editor):
+    # Перенесенные вручную занятия не отличить от построенных по шаблону, дата берется текущая
+    Event = apps.get_model("api", "Event")
+    Event.objects.filter(abstract_event__isnull=False).update(original_date=models.F("date"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_event_event_idnumber'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='original_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Дата по шаблону'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='abstract_event',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.abstractevent', verbose_name='Абстрактное событие'),
+        ),
+        migrations.RunPython(fill_original_dates, migrations.RunPython.noop),
+    ]
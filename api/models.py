@@ -2,7 +2,11 @@ from typing import Optional, Self
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from api.caching import bump_model_versions, initial_version
 
 
 class CommonModel(models.Model):
@@ -28,6 +32,77 @@ class CommonModel(models.Model):
         null=True, blank=True, verbose_name="Комментарий для этой записи", max_length=1024
     )
 
+    # Поля, изменение которых не считается изменением записи
+    untracked_fields = ("datemodified", "dateaccessed")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._concrete_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Перечитанные поля (в том числе загруженные отложенные) совпадают с БД
+        refreshed = self._concrete_values()
+        if fields is not None:
+            fields = set(fields)
+            refreshed = {
+                field.attname: refreshed[field.attname]
+                for field in self._meta.concrete_fields
+                if field.attname in refreshed and {field.name, field.attname} & fields
+            }
+        self._loaded_values = {**getattr(self, "_loaded_values", {}), **refreshed}
+
+    def _concrete_values(self) -> dict:
+        # Отложенные (deferred) поля не загружены и в снимок не попадают
+        return {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def loaded_value(self, attname, default=None):
+        """Значение поля на момент загрузки из БД (или последнего сохранения)"""
+        return getattr(self, "_loaded_values", {}).get(attname, default)
+
+    def changed_fields(self) -> set:
+        """
+        Имена полей, значения которых отличаются от загруженных из БД.
+        Для записи, не загруженной из БД, возвращаются все поля, кроме первичного ключа
+        """
+        loaded = getattr(self, "_loaded_values", None)
+        fields = [field for field in self._meta.concrete_fields if not field.primary_key]
+        if loaded is None:
+            return {field.name for field in fields}
+        missing = object()
+        return {
+            field.name
+            for field in fields
+            if field.attname in self.__dict__
+            and loaded.get(field.attname, missing) != self.__dict__[field.attname]
+        }
+
+    def has_tracked_changes(self, update_fields=None) -> bool:
+        """Есть ли изменения (среди update_fields, если задан), обновляющие datemodified"""
+        changed = self.changed_fields().difference(self.untracked_fields)
+        if update_fields is not None:
+            changed &= {self._meta.get_field(name).name for name in update_fields}
+        return bool(changed)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and self.has_tracked_changes(update_fields):
+            # datemodified выставляется сигналом pre_save и должен попасть в UPDATE
+            kwargs["update_fields"] = {*update_fields, "datemodified"}
+        super().save(*args, **kwargs)
+
+        saved = self._concrete_values()
+        if kwargs.get("update_fields") is not None:
+            attnames = {self._meta.get_field(name).attname for name in kwargs["update_fields"]}
+            saved = {attname: value for attname, value in saved.items() if attname in attnames}
+        self._loaded_values = {**getattr(self, "_loaded_values", {}), **saved}
+
     @classmethod
     def last_modified_record(cls) -> Optional[Self]:
         return cls.objects.order_by("-datemodified").first()
@@ -163,14 +238,38 @@ class Schedule(CommonModel):
     abstract_schedule = models.ForeignKey(AbstractSchedule, null=True, on_delete=models.PROTECT, verbose_name="Абстрактное расписание")
 
     def first_event(self):
-        events = self.events.all()
-
-        return events.annotate(min_date=models.Min("holdings__date")).order_by("min_date").first()
+        return self.events.exclude(date=None).order_by("date").first()
 
     def last_event(self):
-        events = self.events.all()
+        return self.events.exclude(date=None).order_by("-date").first()
+
+    @classmethod
+    def refresh_dates(cls, schedule_ids=None) -> int:
+        """
+        Пересчитывает start_date и end_date по датам занятий одним UPDATE.
+        Если schedule_ids не задан, пересчитываются все расписания.
+        У расписаний с abstract_schedule границы задают семестр, по которому строятся
+        занятия (см. api.expansion), и не пересчитываются
+        """
+        events = Event.objects.filter(schedule=models.OuterRef("pk")).exclude(date=None)
+        schedules = cls.objects.filter(abstract_schedule=None)
+        if schedule_ids is not None:
+            schedules = schedules.filter(pk__in=schedule_ids)
+        updated = schedules.update(
+            start_date=models.Subquery(events.order_by("date").values("date")[:1]),
+            end_date=models.Subquery(events.order_by("-date").values("date")[:1]),
+        )
+        bump_model_versions(cls)
+        return updated
 
-        return events.annotate(max_date=models.Max("holdings__date")).order_by("-max_date").first()
+    @classmethod
+    def extend_dates(cls, schedule_id, date) -> None:
+        """Расширяет границы расписания без abstract_schedule так, чтобы они включали дату date"""
+        cls.objects.filter(pk=schedule_id, abstract_schedule=None).update(
+            start_date=Least(Coalesce("start_date", models.Value(date)), models.Value(date)),
+            end_date=Greatest(Coalesce("end_date", models.Value(date)), models.Value(date)),
+        )
+        bump_model_versions(cls)
 
     def __repr__(self):
         return f"{self.faculty},{self.years},{self.scope},{self.course}к,{self.semester}сем"
@@ -206,12 +305,80 @@ class AbstractEvent(CommonModel):
     place = models.ForeignKey(EventPlace, on_delete=models.PROTECT, verbose_name="Место")
     abstract_day = models.ForeignKey(AbstractDay, on_delete=models.PROTECT, verbose_name="Абстрактный день")
     time_slot = models.ForeignKey(TimeSlot, on_delete=models.PROTECT, verbose_name="Временной интервал")
+    schedule = models.ForeignKey(
+        Schedule,
+        null=True,
+        blank=True,
+        related_name="abstract_events",
+        on_delete=models.CASCADE,
+        verbose_name="Расписание",
+    )
+
+
+def effective_value(override_path, fallback_path, lookup=""):
+    """
+    SQL-выражение значения занятия (или поля lookup связанной записи): по ссылке
+    override_path, а если она не задана - по fallback_path (см. Event.effective_paths)
+    """
+    if not lookup:
+        return Coalesce(override_path, fallback_path)
+    return models.Case(
+        models.When(
+            **{f"{override_path}__isnull": False}, then=models.F(f"{override_path}__{lookup}")
+        ),
+        default=models.F(f"{fallback_path}__{lookup}"),
+    )
+
+
+class EventQuerySet(models.QuerySet):
+    def with_effective_fields(self):
+        """
+        Аннотирует значения занятий с учетом абстрактного события, вычисляемые в SQL:
+        effective_kind, effective_subject, effective_place, effective_time_slot (id записей),
+        effective_date, а также effective_start_time и effective_end_time (границы
+        временного интервала) для фильтрации и упорядочивания по времени
+        """
+        paths = Event.effective_paths
+        return self.annotate(
+            **{
+                f"effective_{name}": effective_value(*paths[name])
+                for name in ("kind", "subject", "place", "time_slot")
+            },
+            # Дата хранится только в самом занятии, аннотация нужна для единообразия условий
+            effective_date=models.F("date"),
+            effective_start_time=effective_value(*paths["time_slot"], "start_time"),
+            effective_end_time=effective_value(*paths["time_slot"], "end_time"),
+        )
+
+    def for_participant(self, participant):
+        """
+        Занятия, в которых участвует participant: по participants_override, а если
+        у занятия он пуст - по участникам абстрактного события (см. Event.participants)
+        """
+        return self.for_participants([participant])
+
+    def for_participants(self, participants, date_from=None, date_to=None):
+        """
+        Занятия, в которых участвует хотя бы один из participants (см. for_participant),
+        по таблице EventMembership. Границы дат date_from и date_to, если заданы,
+        ограничивают и выборку из нее, чтобы она читалась одним диапазоном индекса
+        """
+        memberships = EventMembership.objects.filter(participant__in=participants)
+        if date_from is not None:
+            memberships = memberships.filter(date__gte=date_from)
+        if date_to is not None:
+            memberships = memberships.filter(date__lte=date_to)
+        return self.filter(pk__in=memberships.values("event_id"))
 
 
 class Event(CommonModel):
     class Meta:
         verbose_name = "Событие"
         verbose_name_plural = "События"
+        indexes = [
+            models.Index(fields=["schedule", "date"], name="event_schedule_date_idx"),
+            models.Index(fields=["date", "id"], name="event_date_id_idx"),
+        ]
 
     date = models.DateField(null=True, blank=False, verbose_name="Дата")
     kind_override = models.ForeignKey(EventKind, null=True, on_delete=models.PROTECT, verbose_name="Тип")
@@ -219,7 +386,20 @@ class Event(CommonModel):
     participants_override = models.ManyToManyField(EventParticipant, verbose_name="Участники")
     place_override = models.ForeignKey(EventPlace, null=True, on_delete=models.PROTECT, verbose_name="Место")
     time_slot_override = models.ForeignKey(TimeSlot, null=True, on_delete=models.PROTECT, verbose_name="Временной интервал")
-    abstract_event = models.ForeignKey(AbstractEvent, null=True, on_delete=models.PROTECT, verbose_name="Абстрактное событие")
+    # Занятия, в том числе измененные вручную, удаляются вместе со своим абстрактным событием
+    # (и с расписанием, к которому оно относится)
+    abstract_event = models.ForeignKey(AbstractEvent, null=True, on_delete=models.CASCADE, verbose_name="Абстрактное событие")
+    # Дата, на которую занятие построено по шаблону (см. ScheduleExpander): занятие,
+    # перенесенное вручную на другую дату, остается исключением и не строится заново
+    original_date = models.DateField(null=True, blank=True, verbose_name="Дата по шаблону")
+    # idnumber импортированного события и элемента его holding_info (у записи idnumber вида
+    # "<событие>#<элемент>"): записи события находятся по индексу, даже если idnumber содержит "#"
+    event_idnumber = models.CharField(
+        null=True, blank=True, max_length=260, db_index=True, verbose_name="Событие импорта"
+    )
+    holding_idnumber = models.CharField(
+        null=True, blank=True, max_length=260, verbose_name="Элемент holding_info события"
+    )
     schedule = models.ForeignKey(
         Schedule,
         related_name="events",
@@ -227,8 +407,159 @@ class Event(CommonModel):
         on_delete=models.CASCADE
     )
 
+    objects = EventQuerySet.as_manager()
+
+    # Значения этих атрибутов берутся из *_override, а если они не заданы - из abstract_event.
+    # Пути используются при планировании select_related/prefetch_related (см. api.query_planning)
+    effective_paths = {
+        "kind": ("kind_override", "abstract_event__kind"),
+        "subject": ("subject_override", "abstract_event__subject"),
+        "place": ("place_override", "abstract_event__place"),
+        "time_slot": ("time_slot_override", "abstract_event__time_slot"),
+        "participants": ("participants_override", "abstract_event__participants"),
+    }
+
+    def _effective_value(self, name):
+        override = getattr(self, f"{name}_override")
+        if override is not None or self.abstract_event_id is None:
+            return override
+        return getattr(self.abstract_event, name)
+
+    @property
+    def kind(self) -> Optional[EventKind]:
+        return self._effective_value("kind")
+
+    @kind.setter
+    def kind(self, value):
+        self.kind_override = value
+
+    @property
+    def subject(self) -> Optional[Subject]:
+        return self._effective_value("subject")
+
+    @subject.setter
+    def subject(self, value):
+        self.subject_override = value
+
+    @property
+    def place(self) -> Optional[EventPlace]:
+        return self._effective_value("place")
+
+    @place.setter
+    def place(self, value):
+        self.place_override = value
+
+    @property
+    def time_slot(self) -> Optional[TimeSlot]:
+        return self._effective_value("time_slot")
+
+    @time_slot.setter
+    def time_slot(self, value):
+        self.time_slot_override = value
+
+    @property
+    def participants(self):
+        if self.pk is None:
+            # У несохраненного (например, виртуального, см. EventViewSet) занятия нет связей M2M
+            if self.abstract_event_id is None:
+                return EventParticipant.objects.none()
+            return self.abstract_event.participants.all()
+        participants = self.participants_override.all()
+        if participants or self.abstract_event_id is None:
+            return participants
+        return self.abstract_event.participants.all()
+
     def __repr__(self):
-        return f"Занятие по {self.abstract_event.subject.name} [{self.pk}]"
+        subject = self.subject
+        return f"Занятие по {subject.name if subject else '?'} [{self.pk}]"
+
+
+class EventMembership(models.Model):
+    """
+    Итоговые участники занятий (см. Event.participants) с датой занятия: производная
+    таблица для выборки занятий участника за период без объединения participants_override
+    и участников абстрактного события. Обновляется сигналами (см. api.signals),
+    импортом и построением занятий по шаблонам, пересчитывается командой
+    rebuild_event_memberships
+    """
+
+    class Meta:
+        verbose_name = "Участие в занятии"
+        verbose_name_plural = "Участие в занятиях"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "participant"], name="event_membership_unique"
+            ),
+        ]
+        indexes = [
+            # event в конце индекса позволяет отбирать занятия, не читая саму таблицу
+            models.Index(
+                fields=["participant", "date", "event"], name="membership_participant_idx"
+            ),
+        ]
+
+    event = models.ForeignKey(
+        Event, related_name="memberships", on_delete=models.CASCADE, verbose_name="Занятие"
+    )
+    participant = models.ForeignKey(
+        EventParticipant,
+        related_name="memberships",
+        on_delete=models.CASCADE,
+        verbose_name="Участник",
+    )
+    date = models.DateField(null=True, verbose_name="Дата")
+
+    @classmethod
+    def refresh(cls, events) -> None:
+        """
+        Пересчитывает записи занятий queryset events: удаляет их и заново вставляет
+        двумя INSERT ... SELECT - по participants_override и, для занятий без него,
+        по участникам абстрактного события
+        """
+        cls.objects.filter(event__in=events.values("pk")).delete()
+        through = Event.participants_override.through
+        overridden = through.objects.filter(event_id=models.OuterRef("pk"))
+        sources = [
+            events.filter(participants_override__isnull=False).values_list(
+                "pk", "participants_override", "date"
+            ),
+            events.filter(~models.Exists(overridden), abstract_event__participants__isnull=False)
+            .values_list("pk", "abstract_event__participants", "date"),
+        ]
+        operations = connection.ops
+        columns = ", ".join(
+            operations.quote_name(cls._meta.get_field(name).column)
+            for name in ("event", "participant", "date")
+        )
+        with connection.cursor() as cursor:
+            for source in sources:
+                sql, params = source.order_by().query.sql_with_params()
+                cursor.execute(
+                    f"INSERT INTO {operations.quote_name(cls._meta.db_table)} ({columns}) {sql}",
+                    params,
+                )
+
+    @classmethod
+    def rebuild(cls, chunk_size=5000) -> int:
+        """
+        Пересчитывает таблицу целиком пачками по chunk_size занятий (диапазонами pk,
+        без чтения всех pk в память), возвращает число записей
+        """
+        cls.objects.all().delete()
+        last_pk = None
+        while True:
+            events = Event.objects.all()
+            if last_pk is not None:
+                events = events.filter(pk__gt=last_pk)
+            bound = list(
+                events.order_by("pk").values_list("pk", flat=True)[chunk_size - 1 : chunk_size]
+            )
+            if not bound:
+                cls.refresh(events)
+                break
+            cls.refresh(events.filter(pk__lte=bound[0]))
+            last_pk = bound[0]
+        return cls.objects.count()
 
 
 class DayDateOverride(CommonModel):
@@ -242,4 +573,199 @@ class DayDateOverride(CommonModel):
         Schedule, 
         related_name="day_overrides", 
         verbose_name="Расписание"
-    )
\ No newline at end of file
+    )
+
+class ModelVersion(models.Model):
+    """
+    Номер версии данных модели (см. api.caching.bump_model_versions). Хранится в БД,
+    а не в кэше процесса, чтобы записи из других процессов (воркера импорта, других
+    процессов сервера, команд manage.py) сразу меняли ключи кэша ответов и ETag.
+    Начальный номер случайный (см. api.caching.initial_version)
+    """
+
+    class Meta:
+        verbose_name = "Версия данных модели"
+        verbose_name_plural = "Версии данных моделей"
+
+    label = models.CharField(max_length=100, unique=True, verbose_name="Модель (api.event)")
+    version = models.BigIntegerField(default=initial_version, verbose_name="Номер версии")
+    modified = models.DateTimeField(default=timezone.now, verbose_name="Время изменения данных")
+
+
+class ImportRun(models.Model):
+    """
+    Запуск импорта данных. Импорт выполняется пачками, каждая в своей транзакции,
+    вместе с которой сохраняется контрольная точка (раздел и число обработанных записей),
+    поэтому прерванный импорт можно продолжить с места остановки.
+
+    Запуск с сохраненным документом (file) или именем внешней БД (database) является заданием
+    очереди импорта: его выполняет обработчик очереди (команда run_import_worker) вне HTTP-запроса
+    """
+
+    class Meta:
+        verbose_name = "Запуск импорта"
+        verbose_name_plural = "Запуски импорта"
+        ordering = ["-started_at"]
+
+    class Status(models.IntegerChoices):
+        RUNNING = 0, "Выполняется"
+        COMPLETED = 1, "Завершен"
+        FAILED = 2, "Ошибка"
+        QUEUED = 3, "В очереди"
+
+    class Mode(models.TextChoices):
+        FULL = "full", "Запись всех записей"
+        DIFF = "diff", "Запись только изменившихся записей"
+        SNAPSHOT = "snapshot", "Документ - полный снимок данных"
+
+    # Режимы, в которых объекты с прежним хэшем содержимого не записываются
+    DIFF_MODES = (Mode.DIFF, Mode.SNAPSHOT)
+
+    status = models.IntegerField(choices=Status, default=Status.RUNNING, verbose_name="Статус")
+    mode = models.CharField(choices=Mode, default=Mode.FULL, max_length=16, verbose_name="Режим")
+    source = models.CharField(max_length=255, blank=True, verbose_name="Источник данных")
+    section = models.CharField(max_length=64, null=True, blank=True, verbose_name="Текущий раздел")
+    offset = models.IntegerField(default=0, verbose_name="Обработано записей раздела")
+    # {раздел: {"done": обработано записей, "total": всего записей или null, если неизвестно}}
+    progress = models.JSONField(default=dict, verbose_name="Ход импорта по разделам")
+    # {раздел: {"created": ..., "updated": ..., "unchanged": ..., "deleted": ...}}
+    summary = models.JSONField(default=dict, verbose_name="Итоги импорта по разделам")
+    error = models.TextField(null=True, blank=True, verbose_name="Ошибка")
+    file = models.FileField(
+        upload_to="imports/", null=True, blank=True, verbose_name="Документ задания импорта"
+    )
+    database = models.CharField(
+        max_length=64, null=True, blank=True, verbose_name="Внешняя БД задания импорта"
+    )
+    author = models.ForeignKey(
+        User, blank=True, null=True, on_delete=models.SET_NULL, verbose_name="Автор импорта"
+    )
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name="Время начала")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Время последней контрольной точки")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Время окончания")
+    attempt_started_at = models.DateTimeField(null=True, verbose_name="Время начала текущей попытки")
+    attempt_rows_before = models.IntegerField(default=0, verbose_name="Обработано записей до текущей попытки")
+
+    @property
+    def rows_done(self) -> int:
+        return sum(entry["done"] for entry in self.progress.values())
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        """Скорость текущей (или последней) попытки импорта"""
+        if self.attempt_started_at is None:
+            return None
+        finished = self.finished_at or self.updated_at
+        elapsed = (finished - self.attempt_started_at).total_seconds()
+        if elapsed <= 0:
+            return None
+        return (self.rows_done - self.attempt_rows_before) / elapsed
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Длительность текущей (или последней) попытки импорта в секундах"""
+        if self.attempt_started_at is None:
+            return None
+        finished = self.finished_at or timezone.now()
+        return (finished - self.attempt_started_at).total_seconds()
+
+    @classmethod
+    def enqueue(cls, document=None, name=None, **fields) -> "ImportRun":
+        """Сохраняет документ (если он есть) и ставит задание импорта в очередь"""
+        run = cls(status=cls.Status.QUEUED, **fields)
+        if document is not None:
+            run.file.save(name, document, save=False)
+        run.save()
+        return run
+
+    def requeue(self, document=None, name=None):
+        """
+        Возвращает задание в очередь для продолжения с контрольной точки,
+        при необходимости заменяя сохраненный документ
+        """
+        if document is not None:
+            self.file.delete(save=False)
+            self.file.save(name, document, save=False)
+        self.status = self.Status.QUEUED
+        self.error = None
+        self.finished_at = None
+        self.save()
+
+    @classmethod
+    def claim_next(cls) -> Optional["ImportRun"]:
+        """
+        Забирает из очереди самое раннее задание. Задание переводится в RUNNING условным UPDATE,
+        поэтому одно задание не достанется двум обработчикам очереди
+        """
+        while True:
+            run = cls.objects.filter(status=cls.Status.QUEUED).order_by("started_at", "pk").first()
+            if run is None:
+                return None
+            claimed = cls.objects.filter(pk=run.pk, status=cls.Status.QUEUED).update(
+                status=cls.Status.RUNNING
+            )
+            if claimed:
+                run.status = cls.Status.RUNNING
+                return run
+
+    def done(self, section) -> int:
+        return self.progress.get(section, {}).get("done", 0)
+
+    def set_totals(self, totals):
+        for section, total in totals.items():
+            self.progress.setdefault(section, {"done": 0, "total": None})["total"] = total
+        self.save(update_fields=["progress", "updated_at"])
+
+    def start_attempt(self):
+        self.status = self.Status.RUNNING
+        self.error = None
+        self.finished_at = None
+        self.attempt_started_at = timezone.now()
+        self.attempt_rows_before = self.rows_done
+        self.save()
+
+    def count(self, section, counters):
+        """Добавляет счетчики записей раздела (created, updated, ...) к итогам импорта"""
+        entry = self.summary.setdefault(section, {})
+        for name, value in counters.items():
+            entry[name] = entry.get(name, 0) + value
+
+    def advance(self, section, count, counters=None):
+        """Контрольная точка: сохраняется в транзакции пачки, записанной импортом"""
+        entry = self.progress.setdefault(section, {"done": 0, "total": None})
+        entry["done"] += count
+        self.section = section
+        self.offset = entry["done"]
+        self.count(section, counters or {})
+        self.save(update_fields=["progress", "summary", "section", "offset", "updated_at"])
+
+    def finish(self, error=None):
+        self.status = self.Status.FAILED if error else self.Status.COMPLETED
+        self.error = error
+        self.finished_at = timezone.now()
+        self.save(update_fields=["status", "error", "finished_at", "updated_at"])
+
+
+class ImportDigest(models.Model):
+    """
+    Хэш содержимого импортированного объекта (по разделу и idnumber объекта в документе).
+    По нему импорт в режимах DIFF и SNAPSHOT (см. ImportRun.Mode) пропускает объекты,
+    которые не изменились с прошлого импорта, и находит объекты, исчезнувшие из документа
+    """
+
+    class Meta:
+        verbose_name = "Хэш импортированного объекта"
+        verbose_name_plural = "Хэши импортированных объектов"
+        constraints = [
+            models.UniqueConstraint(fields=["section", "idnumber"], name="import_digest_unique")
+        ]
+
+    section = models.CharField(max_length=64, verbose_name="Раздел")
+    idnumber = models.CharField(max_length=260, verbose_name="Уникальный строковый идентификатор")
+    digest = models.CharField(max_length=40, verbose_name="Хэш содержимого")
+    run = models.ForeignKey(
+        ImportRun,
+        null=True,
+        on_delete=models.SET_NULL,
+        verbose_name="Последний запуск импорта, в документе которого был объект",
+    )
@@ -0,0 +1,153 @@
+import base64
+import datetime
+import json
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class EventCursorPagination(BasePagination):
+    """
+    Постраничный вывод занятий по ключу (дата, время начала, id).
+
+    Режим включается, только если в запросе есть `cursor` или `page_size`,
+    иначе список возвращается целиком, как и раньше.
+    Следующая страница выбирается условием "ключ больше последнего выданного",
+    поэтому стоимость запроса не зависит от того, как далеко клиент пролистал список.
+    """
+
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Некорректный курсор"
+
+    def is_requested(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        # Дата и время начала с учетом абстрактного события (см. EventQuerySet.with_effective_fields)
+        if "effective_start_time" not in queryset.query.annotations:
+            queryset = queryset.with_effective_fields()
+        if position is not None:
+            queryset = queryset.filter(self._position_filter(position, reverse))
+        queryset = queryset.order_by(*self._ordering(reverse))
+
+        results = list(queryset[: page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        # При обратном проходе известно, что следующая страница есть всегда
+        has_next = has_more if not reverse else True
+        has_prev = has_more if reverse else position is not None
+        self.next_cursor = (
+            self.encode_cursor(self._position(results[-1]), False) if has_next and results else None
+        )
+        self.prev_cursor = (
+            self.encode_cursor(self._position(results[0]), True) if has_prev and results else None
+        )
+        return results
+
+    def get_paginated_response(self, data):
+        response = Response(data)
+        # Курсоры добавляются в конверт ответа в ResponseJSONRenderer
+        response.cursors = {"next": self.next_cursor, "prev": self.prev_cursor}
+        return response
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            date, start_time, pk = payload["p"]
+            position = (
+                datetime.date.fromisoformat(date) if date else None,
+                datetime.time.fromisoformat(start_time) if start_time else None,
+                int(pk),
+            )
+            return position, bool(payload.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        date, start_time, pk = position
+        payload = {
+            "p": [
+                date.isoformat() if date else None,
+                start_time.isoformat() if start_time else None,
+                pk,
+            ],
+        }
+        if reverse:
+            payload["r"] = 1
+        data = json.dumps(payload, separators=(",", ":")).encode("ascii")
+        return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def _position(event):
+        return event.effective_date, event.effective_start_time, event.pk
+
+    @staticmethod
+    def _ordering(reverse):
+        # NULL-значения даты и времени идут первыми при прямом порядке
+        if reverse:
+            return (
+                F("effective_date").desc(nulls_last=True),
+                F("effective_start_time").desc(nulls_last=True),
+                F("id").desc(),
+            )
+        return (
+            F("effective_date").asc(nulls_first=True),
+            F("effective_start_time").asc(nulls_first=True),
+            F("id").asc(),
+        )
+
+    @classmethod
+    def _position_filter(cls, position, reverse):
+        date, start_time, pk = position
+        id_filter = Q(id__lt=pk) if reverse else Q(id__gt=pk)
+        tail = cls._after("effective_start_time", start_time, reverse) | (
+            cls._equal("effective_start_time", start_time) & id_filter
+        )
+        return cls._after("effective_date", date, reverse) | (
+            cls._equal("effective_date", date) & tail
+        )
+
+    @staticmethod
+    def _equal(field, value):
+        if value is None:
+            return Q(**{f"{field}__isnull": True})
+        return Q(**{field: value})
+
+    @staticmethod
+    def _after(field, value, reverse):
+        """Условие "значение поля строго дальше value" с учетом того, что NULL идет первым"""
+        if reverse:
+            if value is None:
+                return Q(pk__in=[])
+            return Q(**{f"{field}__lt": value}) | Q(**{f"{field}__isnull": True})
+        if value is None:
+            return Q(**{f"{field}__isnull": False})
+        return Q(**{f"{field}__gt": value})
@@ -0,0 +1,314 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+from api.access_tracking import access_buffer
+from api.chunking import QUERY_CHUNK_SIZE, chunked
+from api.models import CommonModel, effective_value
+from api.serializers import CommonModelSerializer
+
+# Поля, значения которых уже имеют нужный для вывода тип
+IDENTITY_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+# Поля связанных моделей, из которых берется строковое представление записи
+STRING_LOOKUPS = {User: User.USERNAME_FIELD}
+
+
+class ProjectionNotSupported(Exception):
+    pass
+
+
+class ManyRelation:
+    """Загрузка множественной связи (M2M) одним запросом на пачку владельцев"""
+
+    def __init__(self, key_index, model, query_name, child):
+        self.key_index = key_index
+        self.model = model
+        self.query_name = query_name
+        self.child = child
+
+    def load(self, keys):
+        result = defaultdict(list)
+        for chunk in chunked(keys, QUERY_CHUNK_SIZE):
+            rows = list(
+                self.model.objects.filter(**{f"{self.query_name}__in": chunk}).values_list(
+                    self.query_name, *self.child.columns
+                )
+            )
+            items = self.child.build_rows([row[1:] for row in rows])
+            for row, item in zip(rows, items):
+                result[row[0]].append(item)
+        return result
+
+
+class Projection:
+    """
+    Быстрый путь чтения для списков: описание полей сериализатора один раз компилируется
+    в функцию над кортежами из .values_list(), без создания экземпляров моделей
+    и без обхода полей DRF для каждой записи.
+
+    Результат совпадает с to_representation сериализатора, включая отбрасывание
+    null-полей и поля администратора. Если сериализатор содержит поля, которые
+    нельзя выразить через столбцы (например, SerializerMethodField),
+    for_serializer возвращает None, и используется обычный сериализатор.
+
+    Экземпляры моделей не создаются, поэтому доступ к выданным записям (dateaccessed,
+    см. api.access_tracking) отмечается явно - только для записей самого списка,
+    без вложенных записей (предметов, участников и т.д.)
+    """
+
+    _cache = {}
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = []
+        # Индекс столбца -> (путь ссылки *_override, путь fallback, поле): столбец выбирается
+        # выражением effective_value вместо пути в self.columns
+        self.effective_columns = {}
+        self.relations = []
+        self._column_indexes = {}
+        self._build = None
+        # Индекс столбца pk записей списка, если доступ к ним отмечается (см. for_serializer)
+        self._pk_index = None
+
+    @classmethod
+    def for_serializer(cls, serializer_class, include_admin_fields=False):
+        key = (serializer_class, include_admin_fields)
+        if key not in cls._cache:
+            serializer = serializer_class()
+            projection = cls(serializer.Meta.model)
+            try:
+                projection._build = projection._compile_serializer(
+                    serializer, projection.model, "", include_admin_fields
+                )
+            except ProjectionNotSupported:
+                projection = None
+            else:
+                if issubclass(projection.model, CommonModel):
+                    projection._pk_index = projection._column("pk")
+            cls._cache[key] = projection
+        return cls._cache[key]
+
+    def evaluate(self, queryset):
+        rows = list(self._values(queryset))
+        self._record_access(rows)
+        return self.build_rows(rows)
+
+    def iterate(self, queryset, chunk_size):
+        rows = self._values(queryset).iterator(chunk_size=chunk_size)
+        try:
+            for chunk in chunked(rows, chunk_size):
+                # Буфер не записывается, пока открыт курсор чтения
+                self._record_access(chunk, flush=False)
+                yield from self.build_rows(chunk)
+        finally:
+            rows.close()
+            if self._pk_index is not None:
+                access_buffer.flush_if_due()
+
+    def _record_access(self, rows, flush=True):
+        if self._pk_index is not None:
+            index = self._pk_index
+            access_buffer.record_many(self.model, [row[index] for row in rows], flush=flush)
+
+    def evaluate_mapped(self, queryset, paths) -> dict:
+        """
+        Представления несохраненных записей, значения которых берутся из записей queryset
+        другой модели (например, виртуальных занятий по абстрактным событиям), в виде
+        {pk записи queryset: представление}. paths - {путь в модели проекции: путь
+        в модели queryset}, столбцы вне этих путей считаются равными None
+        """
+        lookups = [
+            _map_lookup(self._source_column(index), paths) for index in range(len(self.columns))
+        ]
+        values = list(dict.fromkeys(["pk", *(lookup for lookup in lookups if lookup)]))
+        positions = [None if lookup is None else values.index(lookup) for lookup in lookups]
+        records = list(queryset.values_list(*values))
+        rows = [
+            tuple(None if position is None else record[position] for position in positions)
+            for record in records
+        ]
+        return {record[0]: item for record, item in zip(records, self.build_rows(rows))}
+
+    def build_rows(self, rows):
+        related = [
+            relation.load({row[relation.key_index] for row in rows} - {None})
+            for relation in self.relations
+        ]
+        build = self._build
+        return [build(row, related) for row in rows]
+
+    def _values(self, queryset):
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if not self.effective_columns:
+            return queryset.values_list(*self.columns)
+        aliases = {index: f"effective_column_{index}" for index in self.effective_columns}
+        return queryset.annotate(
+            **{
+                aliases[index]: effective_value(*spec)
+                for index, spec in self.effective_columns.items()
+            }
+        ).values_list(*(aliases.get(index, column) for index, column in enumerate(self.columns)))
+
+    def _resolve_effective(self, override_path, fallback_path):
+        """Помечает столбцы пути override_path как выбираемые с учетом fallback_path"""
+        for index, column in enumerate(self.columns):
+            if index in self.effective_columns:
+                continue
+            if column == override_path:
+                self.effective_columns[index] = (override_path, fallback_path, "")
+            elif column.startswith(f"{override_path}__"):
+                lookup = column[len(override_path) + 2 :]
+                self.effective_columns[index] = (override_path, fallback_path, lookup)
+
+    def _source_column(self, index):
+        """Путь, из которого берется столбец, если ссылка *_override не задана"""
+        if index not in self.effective_columns:
+            return self.columns[index]
+        _, fallback_path, lookup = self.effective_columns[index]
+        return f"{fallback_path}__{lookup}" if lookup else fallback_path
+
+    def _column(self, lookup):
+        if lookup not in self._column_indexes:
+            self._column_indexes[lookup] = len(self.columns)
+            self.columns.append(lookup)
+        return self._column_indexes[lookup]
+
+    def _compile_serializer(self, serializer, model, prefix, include_admin_fields):
+        getters = [
+            (field.field_name, self._compile_field(field, model, prefix, include_admin_fields))
+            for field in serializer.fields.values()
+            if not field.write_only
+        ]
+
+        common = isinstance(serializer, CommonModelSerializer)
+        if common and include_admin_fields:
+            admin_fields = {**serializer.admin_readonly_fields, **serializer.admin_fields}
+            for name, field in admin_fields.items():
+                getters.append((name, self._compile_path(model, prefix, [name], field)))
+
+        if not common:
+            return lambda row, related: {name: getter(row, related) for name, getter in getters}
+
+        keep_none = None in serializer.visible_nullable
+
+        def build(row, related):
+            representation = {}
+            for name, getter in getters:
+                value = getter(row, related)
+                if value is not None or keep_none:
+                    representation[name] = value
+            return representation
+
+        return build
+
+    def _compile_field(self, field, model, prefix, include_admin_fields):
+        if field.source == "*":
+            if isinstance(field, serializers.ListSerializer):
+                # Список из одного элемента, построенного по той же записи (см. HoldingInfoListSerializer)
+                child = self._compile_serializer(field.child, model, prefix, include_admin_fields)
+                return lambda row, related: [child(row, related)]
+            if isinstance(field, serializers.BaseSerializer):
+                return self._compile_serializer(field, model, prefix, include_admin_fields)
+            raise ProjectionNotSupported(field)
+
+        if isinstance(field, serializers.SerializerMethodField):
+            raise ProjectionNotSupported(field)
+        return self._compile_path(model, prefix, field.source_attrs, field, include_admin_fields)
+
+    def _compile_path(self, model, prefix, attrs, field, include_admin_fields=False):
+        attr, rest = attrs[0], attrs[1:]
+
+        effective_paths = getattr(model, "effective_paths", {})
+        if attr in effective_paths:
+            override_path, fallback_path = effective_paths[attr]
+            override = self._compile_path(
+                model, prefix, override_path.split("__") + rest, field, include_admin_fields
+            )
+            override_field = model._meta.get_field(override_path.split("__")[0])
+            if override_field.many_to_many:
+                fallback = self._compile_path(
+                    model, prefix, fallback_path.split("__") + rest, field, include_admin_fields
+                )
+                return lambda row, related: override(row, related) or fallback(row, related)
+            # Столбцы пути через ссылку *_override выбираются в SQL с учетом fallback_path
+            # (см. effective_value), поэтому override уже возвращает итоговое значение
+            self._resolve_effective(_join(prefix, override_path), _join(prefix, fallback_path))
+            return override
+
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise ProjectionNotSupported(field)
+        lookup = _join(prefix, attr)
+
+        if not model_field.is_relation:
+            if rest:
+                raise ProjectionNotSupported(field)
+            return self._compile_leaf(self._column(lookup), field)
+
+        if model_field.many_to_many and not model_field.auto_created:
+            if rest or not isinstance(field, serializers.ListSerializer):
+                raise ProjectionNotSupported(field)
+            child = Projection(model_field.related_model)
+            child._build = child._compile_serializer(
+                field.child, child.model, "", include_admin_fields
+            )
+            relation_index = len(self.relations)
+            key_index = self._column(prefix or "pk")
+            self.relations.append(
+                ManyRelation(
+                    key_index, model_field.related_model, model_field.related_query_name(), child
+                )
+            )
+            return lambda row, related: related[relation_index].get(row[key_index], [])
+
+        if not (model_field.many_to_one or model_field.one_to_one) or model_field.auto_created:
+            raise ProjectionNotSupported(field)
+
+        related_model = model_field.related_model
+        if rest:
+            return self._compile_path(related_model, lookup, rest, field, include_admin_fields)
+        if isinstance(field, serializers.BaseSerializer):
+            if isinstance(field, serializers.ListSerializer):
+                raise ProjectionNotSupported(field)
+            index = self._column(lookup)
+            nested = self._compile_serializer(field, related_model, lookup, include_admin_fields)
+            return lambda row, related: nested(row, related) if row[index] is not None else None
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            return self._compile_leaf(self._column(lookup), field)
+        if related_model in STRING_LOOKUPS:
+            index = self._column(_join(lookup, STRING_LOOKUPS[related_model]))
+            return self._compile_leaf(index, field)
+        raise ProjectionNotSupported(field)
+
+    @staticmethod
+    def _compile_leaf(index, field):
+        if isinstance(field, IDENTITY_FIELDS):
+            return lambda row, related: row[index]
+        to_representation = field.to_representation
+        return lambda row, related: (
+            None if row[index] is None else to_representation(row[index])
+        )
+
+
+def _join(prefix, lookup):
+    return f"{prefix}__{lookup}" if prefix else lookup
+
+
+def _map_lookup(lookup, paths):
+    for path, target in paths.items():
+        if lookup == path:
+            return target
+        if lookup.startswith(f"{path}__"):
+            rest = lookup[len(path) + 2 :]
+            return rest if target == "pk" else _join(target, rest)
+    return None
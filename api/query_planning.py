@@ -0,0 +1,129 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+class QueryPlan:
+    """
+    План select_related/prefetch_related, построенный по объявленным полям сериализатора.
+
+    Обходит поля сериализатора, включая вложенные сериализаторы и пути в `source=`
+    через точку (например, `kind.name`), и сопоставляет их со связями модели:
+    однозначные связи попадают в select_related, множественные - в prefetch_related.
+    Атрибуты модели из `effective_paths` (см. Event) раскрываются во все их возможные пути.
+    Благодаря этому число запросов на список не зависит от количества записей.
+    """
+
+    _cache = {}
+
+    def __init__(self, model):
+        self.model = model
+        self.select_related = set()
+        self.prefetch_related = set()
+
+    @classmethod
+    def for_serializer(cls, serializer_class, include_admin_fields=False):
+        key = (serializer_class, include_admin_fields)
+        if key not in cls._cache:
+            serializer = serializer_class()
+            plan = cls(serializer.Meta.model)
+            plan._add_serializer(serializer, plan.model, "", False, include_admin_fields)
+            cls._cache[key] = plan
+        return cls._cache[key]
+
+    @property
+    def related_models(self):
+        """Модели, данные которых попадают в ответ по этому плану"""
+        models = {self.model}
+        for path in self.select_related | self.prefetch_related:
+            model = self.model
+            for attr in path.split("__"):
+                model = model._meta.get_field(attr).related_model
+                models.add(model)
+        return models
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        return queryset
+
+    def _add_serializer(self, serializer, model, prefix, prefetched, include_admin_fields):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            self._add_field(field, model, prefix, prefetched, include_admin_fields)
+
+        if include_admin_fields:
+            for name in getattr(serializer, "admin_fields", {}):
+                self._add_path(name.split("."), model, prefix, prefetched, True)
+
+    def _add_field(self, field, model, prefix, prefetched, include_admin_fields):
+        nested = isinstance(field, serializers.BaseSerializer)
+        if field.source == "*":
+            if nested:
+                self._add_serializer(field, model, prefix, prefetched, include_admin_fields)
+            return
+
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and len(field.source_attrs) == 1:
+            # Значение берется из <поле>_id без обращения к связанной записи
+            return
+
+        targets = self._add_path(
+            field.source_attrs, model, prefix, prefetched, nested or _is_relation_field(field)
+        )
+        if nested:
+            for related_model, related_prefix, related_prefetched in targets:
+                self._add_serializer(
+                    field, related_model, related_prefix, related_prefetched, include_admin_fields
+                )
+
+    def _add_path(self, attrs, model, prefix, prefetched, include_last):
+        """
+        Добавляет в план связи по пути attrs, возвращает список конечных точек пути
+        в виде (модель, префикс lookup, находится ли путь внутри prefetch_related)
+        """
+        if not attrs:
+            return [(model, prefix, prefetched)]
+
+        attr, rest = attrs[0], attrs[1:]
+        effective_paths = getattr(model, "effective_paths", {})
+        if attr in effective_paths:
+            targets = []
+            for path in effective_paths[attr]:
+                targets += self._add_path(path.split("__") + rest, model, prefix, prefetched, include_last)
+            return targets
+
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # Свойство или метод модели, связи за ним планировщику не видны
+            return []
+        if not model_field.is_relation or (not rest and not include_last):
+            return []
+
+        lookup = f"{prefix}__{attr}" if prefix else attr
+        prefetched = prefetched or model_field.many_to_many or model_field.one_to_many
+        if prefetched:
+            self.prefetch_related.add(lookup)
+        else:
+            self.select_related.add(lookup)
+        return self._add_path(rest, model_field.related_model, lookup, prefetched, include_last)
+
+
+def _is_relation_field(field):
+    return isinstance(field, (serializers.RelatedField, serializers.ManyRelatedField))
+
+
+class QueryCounter:
+    """Обертка для connection.execute_wrapper, подсчитывающая выполненные запросы"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
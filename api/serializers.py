@@ -1,11 +1,13 @@
 from django.db.models import ForeignKey, ManyToManyField
 from rest_framework import serializers
+from rest_framework.utils import model_meta
 
 from api.models import (
     Event,
     EventKind,
     EventParticipant,
     EventPlace,
+    ImportRun,
     Schedule,
     Subject,
     TimeSlot,
@@ -65,8 +67,22 @@ class CommonModelSerializer(serializers.ModelSerializer):
                     setattr(instance, field, validated_data[field])
 
     def update(self, instance, validated_data):
+        # Повторяет ModelSerializer.update, но записывает в БД только изменившиеся поля
         self._detect_record_update(instance, validated_data)
-        return super().update(instance, validated_data)
+        serializers.raise_errors_on_nested_writes("update", self, validated_data)
+        info = model_meta.get_field_info(instance)
+
+        m2m_fields = []
+        for attr, value in validated_data.items():
+            if attr in info.relations and info.relations[attr].to_many:
+                m2m_fields.append((attr, value))
+            else:
+                setattr(instance, attr, value)
+
+        instance.save(update_fields=instance.changed_fields())
+        for attr, value in m2m_fields:
+            getattr(instance, attr).set(value)
+        return instance
 
 
 class CommonModelListSerializer(serializers.ListSerializer):
@@ -151,10 +167,38 @@ class EventPlaceSerializer(CommonModelSerializer):
         list_serializer_class = CommonModelListSerializer
 
 
+class HoldingInfoListSerializer(serializers.ListSerializer):
+    """
+    Событие хранит одно проведение (дату, место и время),
+    но в API оно по-прежнему передается списком `holding_info` из одного элемента
+    """
+
+    def to_representation(self, data):
+        return [self.child.to_representation(data)]
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        if len(items) != 1:
+            raise serializers.ValidationError("Событие должно иметь ровно одно проведение")
+        return items[0]
+
+
+class EventHoldingSerializer(serializers.Serializer):
+    place = EventPlaceSerializer(required=False, allow_null=True, label="Место проведения")
+    date = serializers.DateField(required=False, allow_null=True, label="Дата")
+    time_slot = TimeSlotSerializer(required=False, allow_null=True, label="Временной интервал")
+
+    class Meta:
+        list_serializer_class = HoldingInfoListSerializer
+
+
 class EventSerializer(CommonModelSerializer):
     participants = EventParticipantSerializer(many=True, label="Участники")
     subject = SubjectSerializer(label="Предмет")
-    kind = serializers.CharField(source="kind.name", label="Тип события")
+    kind = serializers.CharField(source="kind.name", allow_null=True, label="Тип события")
+    holding_info = EventHoldingSerializer(
+        source="*", many=True, required=False, label="Информация о проведении"
+    )
     schedule_id = serializers.PrimaryKeyRelatedField(
         source="schedule", label="Расписание", queryset=Schedule.objects.all()
     )
@@ -166,10 +210,22 @@ class EventSerializer(CommonModelSerializer):
             "kind",
             "participants",
             "subject",
+            "holding_info",
             "schedule_id",
         ]
         list_serializer_class = CommonModelListSerializer
 
+    @staticmethod
+    def _pop_holding_info(validated_data):
+        place_data = validated_data.pop("place", None)
+        time_slot_data = validated_data.pop("time_slot", None)
+        holding = {}
+        if place_data:
+            holding["place"] = EventPlace.objects.get_or_create(**place_data)[0]
+        if time_slot_data:
+            holding["time_slot"] = TimeSlot.objects.get_or_create(**time_slot_data)[0]
+        return holding
+
     # DRF возлагает создание и обновление объектов из вложенных сериализаторов на разработчика!
     def create(self, validated_data):
         participants_data = validated_data.pop("participants")
@@ -189,14 +245,16 @@ class EventSerializer(CommonModelSerializer):
         subject = subject_serializer.save()
 
         kind_model = EventKind.objects.get_or_create(name=kind.get("name"))[0]
+        holding = self._pop_holding_info(validated_data)
 
         event = Event.objects.create(
             kind=kind_model,
             subject=subject,
+            **holding,
             **validated_data,
         )
 
-        event.participants.set(participants)
+        event.participants_override.set(participants)
 
         return event
 
@@ -211,7 +269,7 @@ class EventSerializer(CommonModelSerializer):
             )
             participants_serializer.is_valid(raise_exception=True)
             participants = participants_serializer.save()
-            instance.participants.set(participants)
+            instance.participants_override.set(participants)
 
         if subject_data:
             subject_serializer = SubjectSerializer(instance.subject, data=subject_data)
@@ -222,16 +280,24 @@ class EventSerializer(CommonModelSerializer):
             kind_model, _ = EventKind.objects.get_or_create(name=kind_data.get("name"))
             instance.kind = kind_model
 
+        for field, value in self._pop_holding_info(validated_data).items():
+            setattr(instance, field, value)
+        if "date" in validated_data:
+            instance.date = validated_data["date"]
+
         self._detect_record_update(instance, validated_data)
         instance.schedule = validated_data.get("schedule", instance.schedule)
-        instance.save()
+        instance.save(update_fields=instance.changed_fields())
 
         return instance
 
 
 class ScheduleSerializer(CommonModelSerializer):
-    start_date = serializers.SerializerMethodField(label="Дата начала занятий")
-    finish_date = serializers.SerializerMethodField(label="Дата окончания занятий")
+    # Границы поддерживаются сигналами и импортом, см. Schedule.refresh_dates
+    start_date = serializers.DateField(read_only=True, label="Дата начала занятий")
+    finish_date = serializers.DateField(
+        source="end_date", read_only=True, label="Дата окончания занятий"
+    )
 
     class Meta:
         model = Schedule
@@ -247,14 +313,46 @@ class ScheduleSerializer(CommonModelSerializer):
         ]
         list_serializer_class = CommonModelListSerializer
 
-    def get_start_date(self, instance):
-        return instance.first_event().min_date
 
-    def get_finish_date(self, instance):
-        return instance.last_event().max_date
+class ImportRunSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    rows_done = serializers.IntegerField(read_only=True)
+    rows_per_second = serializers.FloatField(read_only=True)
+    duration = serializers.FloatField(read_only=True)
+    author = serializers.CharField(allow_null=True, read_only=True)
+
+    class Meta:
+        model = ImportRun
+        fields = [
+            "id",
+            "status",
+            "mode",
+            "source",
+            "section",
+            "offset",
+            "progress",
+            "summary",
+            "rows_done",
+            "rows_per_second",
+            "error",
+            "author",
+            "started_at",
+            "attempt_started_at",
+            "updated_at",
+            "finished_at",
+            "duration",
+        ]
+
+    def get_progress(self, run):
+        progress = {}
+        for section, entry in run.progress.items():
+            total = entry["total"]
+            remaining = None if total is None else max(total - entry["done"], 0)
+            progress[section] = {**entry, "remaining": remaining}
+        return progress
 
 
 class FileUploadSerializer(serializers.Serializer):
     """Необходимый для работы импорта сериализатор"""
 
-    file = serializers.FileField(required=False)
\ No newline at end of file
+    file = serializers.FileField()
\ No newline at end of file
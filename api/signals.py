@@ -1,28 +1,240 @@
-from django.db.models.signals import pre_save, pre_init
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.core.signals import request_finished
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
 from django.utils import timezone
 
-from api.models import CommonModel
+from api.access_tracking import access_buffer
+from api.caching import bump_model_versions
+from api.expansion import ScheduleExpander
+from api.models import (
+    AbstractDay,
+    AbstractEvent,
+    AbstractSchedule,
+    CommonModel,
+    DayDateOverride,
+    Event,
+    EventMembership,
+    Schedule,
+)
 
 
-@receiver(pre_save, sender=CommonModel)
-def update_datemodified(sender, instance, **kwargs):
-    if instance.pk:
-        original = sender.objects.get(pk=instance.pk)
-        has_changes = any(
-            getattr(original, field) != getattr(instance, field)
-            for field in instance._meta.get_fields()
-            if field.name != 'datemodified'
+@receiver(pre_save)
+def update_datemodified(sender, instance, update_fields=None, **kwargs):
+    # Изменения определяются по снимку полей, сделанному при загрузке записи (CommonModel.from_db)
+    if not issubclass(sender, CommonModel):
+        return
+    if instance._state.adding or instance.has_tracked_changes(update_fields):
+        instance.datemodified = timezone.now()
+
+
+@receiver(post_init)
+def update_dateaccessed(sender, instance, **kwargs):
+    # Отметка доступа только буферизуется, запись в БД выполняет access_buffer.flush()
+    if issubclass(sender, CommonModel) and instance.pk is not None:
+        access_buffer.record(sender, instance.pk)
+
+
+@receiver(request_finished)
+def flush_dateaccessed(sender, **kwargs):
+    # Запрос на чтение не пишет в БД, пока буфер не заполнен и не прошел интервал записи
+    access_buffer.flush_if_due()
+
+
+def _shrink_schedule_dates(schedule_id, date):
+    # Пересчет нужен, только если удаленная дата была границей расписания
+    if schedule_id is None or date is None:
+        return
+    boundary = Q(start_date=date) | Q(end_date=date)
+    if Schedule.objects.filter(boundary, pk=schedule_id).exists():
+        Schedule.refresh_dates([schedule_id])
+
+
+@receiver(post_save, sender=Event)
+def update_schedule_dates_on_save(sender, instance, created, **kwargs):
+    # Снимок полей CommonModel обновляется после post_save, здесь он еще хранит прежние значения
+    saved = (instance.schedule_id, instance.date)
+    previous = (
+        (None, None)
+        if created
+        else (instance.loaded_value("schedule_id"), instance.loaded_value("date"))
+    )
+    if previous != saved:
+        _shrink_schedule_dates(*previous)
+        if instance.date is not None:
+            Schedule.extend_dates(instance.schedule_id, instance.date)
+
+
+@receiver(post_delete, sender=Event)
+def update_schedule_dates_on_delete(sender, instance, **kwargs):
+    _shrink_schedule_dates(instance.schedule_id, instance.date)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_cache_version(sender, **kwargs):
+    if issubclass(sender, CommonModel):
+        bump_model_versions(sender)
+
+
+@receiver(m2m_changed)
+def bump_cache_version_on_m2m_change(sender, instance, action, model, **kwargs):
+    # Версия промежуточной модели (sender) отмечает изменение самих связей
+    if action.startswith("post_"):
+        bump_model_versions(
+            sender,
+            *(changed for changed in (type(instance), model) if issubclass(changed, CommonModel)),
+        )
+
+
+def _rematerialize(schedule_ids, abstract_event_ids=None, dates=None):
+    """
+    Перестраивает одной транзакцией занятия расписаний по шаблонам, ограничиваясь
+    абстрактными событиями abstract_event_ids и датами dates (см. ScheduleExpander.expand)
+    """
+    schedule_ids = {schedule_id for schedule_id in schedule_ids if schedule_id is not None}
+    if not settings.API_MATERIALIZE_EVENTS or not schedule_ids:
+        return
+    if dates is not None:
+        dates = {date for date in dates if date is not None}
+    with transaction.atomic():
+        ScheduleExpander(schedule_ids).expand(abstract_event_ids, dates)
+
+
+def _changed(instance, *attnames) -> bool:
+    # Снимок полей CommonModel обновляется после post_save, здесь он еще хранит прежние значения
+    return any(instance.loaded_value(attname) != getattr(instance, attname) for attname in attnames)
+
+
+@receiver(post_save, sender=AbstractEvent)
+def rematerialize_abstract_event(sender, instance, created, **kwargs):
+    # Тип, предмет, место и время занятий берутся из абстрактного события при чтении,
+    # поэтому занятия перестраиваются только при смене дня шаблона или расписания
+    if created or _changed(instance, "abstract_day_id", "schedule_id"):
+        _rematerialize(
+            {instance.loaded_value("schedule_id"), instance.schedule_id}, [instance.pk]
         )
-        if has_changes:
-            instance.datemodified = timezone.now()
+
+
+@receiver(post_save, sender=AbstractDay)
+def rematerialize_abstract_day(sender, instance, created, **kwargs):
+    if created or not _changed(instance, "day_number"):
+        return
+    abstract_events = dict(
+        AbstractEvent.objects.filter(abstract_day=instance).values_list("pk", "schedule_id")
+    )
+    _rematerialize(set(abstract_events.values()), list(abstract_events))
+
+
+@receiver(post_save, sender=AbstractSchedule)
+def rematerialize_abstract_schedule(sender, instance, created, **kwargs):
+    if not created and _changed(
+        instance, "repetition_period", "repeatable", "aligned_by_week_day"
+    ):
+        _rematerialize(instance.schedule_set.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Schedule)
+def rematerialize_schedule(sender, instance, created, **kwargs):
+    if not created and _changed(
+        instance, "start_date", "end_date", "starting_day_number_id", "abstract_schedule_id"
+    ):
+        _rematerialize([instance.pk])
+
+
+@receiver(post_save, sender=DayDateOverride)
+def rematerialize_day_override(sender, instance, created, **kwargs):
+    # Перенос меняет только занятия дат, с которой и на которую он выполняется
+    if not created and _changed(instance, "day_source", "day_destination"):
+        _rematerialize(
+            instance.schedule.values_list("pk", flat=True),
+            dates={
+                instance.loaded_value("day_source"),
+                instance.loaded_value("day_destination"),
+                instance.day_source,
+                instance.day_destination,
+            },
+        )
+
+
+@receiver(m2m_changed, sender=DayDateOverride.schedule.through)
+def rematerialize_day_override_schedules(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # После очистки связей расписания уже не найти
+        related = instance.day_overrides if reverse else instance.schedule
+        instance._cleared_pks = set(related.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if action == "post_clear":
+        pk_set = instance._cleared_pks
+    if reverse:
+        schedule_ids = [instance.pk]
+        overrides = DayDateOverride.objects.filter(pk__in=pk_set)
     else:
-        instance.datemodified = timezone.now()
+        schedule_ids = pk_set
+        overrides = [instance]
+    dates = set()
+    for override in overrides:
+        dates |= {override.day_source, override.day_destination}
+    _rematerialize(schedule_ids, dates=dates)
+
+
+@receiver(pre_delete, sender=DayDateOverride)
+def remember_day_override_schedules(sender, instance, **kwargs):
+    # Связи с расписаниями удаляются вместе с переносом, до post_delete
+    instance._schedule_ids = set(instance.schedule.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=DayDateOverride)
+def rematerialize_deleted_day_override(sender, instance, **kwargs):
+    _rematerialize(
+        getattr(instance, "_schedule_ids", ()),
+        dates={instance.day_source, instance.day_destination},
+    )
+
+
+@receiver(post_save, sender=Event)
+def refresh_memberships_on_save(sender, instance, created, **kwargs):
+    # Без participants_override участники занятия берутся из абстрактного события
+    if created or _changed(instance, "date", "abstract_event_id"):
+        EventMembership.refresh(Event.objects.filter(pk=instance.pk))
+
+
+def _changed_owners(instance, action, reverse, pk_set, related_name):
+    """
+    pk записей, объявивших M2M участников, связи которых изменились, или None,
+    если изменение еще не выполнено. related_name - обратная связь участника с ними
+    """
+    if action == "pre_clear" and reverse:
+        # После очистки связей записи уже не найти
+        instance._cleared_pks = set(getattr(instance, related_name).values_list("pk", flat=True))
+        return None
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return None
+    if not reverse:
+        return [instance.pk]
+    return instance._cleared_pks if action == "post_clear" else pk_set
+
+
+@receiver(m2m_changed, sender=Event.participants_override.through)
+def refresh_memberships_on_override(sender, instance, action, reverse, pk_set, **kwargs):
+    event_ids = _changed_owners(instance, action, reverse, pk_set, "event_set")
+    if event_ids:
+        EventMembership.refresh(Event.objects.filter(pk__in=event_ids))
 
 
-@receiver(pre_init, sender=CommonModel)
-def update_dateaccessed(sender, *args, **kwargs):
-    instance = kwargs.get('instance', None)
-    if instance and instance.pk:
-        instance.dateaccessed = timezone.now()
-        instance.save(update_fields=['dateaccessed'])
\ No newline at end of file
+@receiver(m2m_changed, sender=AbstractEvent.participants.through)
+def refresh_memberships_on_abstract_event(sender, instance, action, reverse, pk_set, **kwargs):
+    abstract_event_ids = _changed_owners(instance, action, reverse, pk_set, "abstractevent_set")
+    if abstract_event_ids:
+        EventMembership.refresh(Event.objects.filter(abstract_event_id__in=abstract_event_ids))
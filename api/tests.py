@@ -1,3 +1,1345 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+import msgpack
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from api.access_tracking import AccessBuffer, access_buffer
+from api.caching import bump_model_versions, model_versions
+from api.directory_import import DirectoryImporter
+from api.expansion import ScheduleExpander
+from api.exporters import JSONExporter
+from api.filters import EventFilter
+from api.ical import format_utc
+from api.importers import JSONImporter, run_import_job
+from api.json_stream import count_json_sections, iter_json_sections
+from api.models import (
+    AbstractDay,
+    AbstractEvent,
+    AbstractSchedule,
+    DayDateOverride,
+    Event,
+    EventKind,
+    EventMembership,
+    EventParticipant,
+    EventPlace,
+    ImportRun,
+    ModelVersion,
+    Schedule,
+    Subject,
+    TimeSlot,
+)
+from api.projections import Projection
+from api.serializers import (
+    EventParticipantSerializer,
+    EventPlaceSerializer,
+    EventSerializer,
+    ScheduleSerializer,
+    SubjectSerializer,
+)
+
+
+def tearDownModule():
+    # Отметки доступа, накопленные тестами, относятся к тестовой БД, которой уже нет
+    access_buffer.clear()
+
+
+class ModelVersionTests(TestCase):
+    def test_versions_survive_process_cache(self):
+        # Версии хранятся в БД: очистка кэша процесса их не сбрасывает
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_model_versions(Subject)
+        versions = model_versions([Subject])
+        cache.clear()
+        self.assertEqual(model_versions([Subject]), versions)
+
+    def test_write_bumps_version_once_per_transaction(self):
+        before = model_versions([Subject])["api.subject"]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Subject.objects.create(name="Физика")
+            Subject.objects.create(name="Химия")
+            Subject.objects.all().delete()
+            # До фиксации транзакции версия не меняется
+            self.assertEqual(model_versions([Subject])["api.subject"], before)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(model_versions([Subject])["api.subject"], before + 1)
+
+    def test_bump_outside_transaction_is_immediate(self):
+        before = model_versions([Subject])["api.subject"]
+        with mock.patch.object(transaction.get_connection(), "in_atomic_block", False):
+            bump_model_versions(Subject, Subject)
+        self.assertEqual(model_versions([Subject])["api.subject"], before + 1)
+
+    def test_versions_are_seeded_randomly(self):
+        # После пересоздания БД версии не повторяют прежние ключи кэша
+        seeds = set()
+        for _ in range(3):
+            ModelVersion.objects.all().delete()
+            seeds.add(model_versions([Subject])["api.subject"])
+        self.assertEqual(len(seeds), 3)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.subject = Subject.objects.create(name="Физика")
+
+    def test_write_from_other_process_invalidates_response(self):
+        self.client.get("/api/subjects/")
+        self.assertEqual(self.client.get("/api/subjects/")["X-Cache"], "HIT")
+        # Запись другого процесса: сигналы этого процесса не срабатывают,
+        # версия меняется только в БД
+        Subject.objects.filter(pk=self.subject.pk).update(name="Химия")
+        ModelVersion.objects.filter(label="api.subject").update(version=F("version") + 1)
+        response = self.client.get("/api/subjects/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertContains(response, "Химия")
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Subject.objects.create(name="Физика")
+        self.staff = User.objects.create_user("staff", is_staff=True)
+
+    def test_staff_and_anonymous_validators_differ(self):
+        anonymous = APIClient().get("/api/subjects/")
+        self.assertIn("Cookie", anonymous["Vary"])
+        self.assertIn("Authorization", anonymous["Vary"])
+
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        staff = client.get("/api/subjects/", HTTP_IF_NONE_MATCH=anonymous["ETag"])
+        self.assertEqual(staff.status_code, 200)
+        self.assertNotEqual(staff["ETag"], anonymous["ETag"])
+        self.assertEqual(
+            client.get("/api/subjects/", HTTP_IF_NONE_MATCH=staff["ETag"]).status_code, 304
+        )
+
+
+    def test_validators_follow_model_versions(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        first = client.get("/api/subjects/", {"search": "Физ"})
+        # Проверка условного запроса читает только таблицу версий, а не записи ответа
+        with self.assertNumQueries(1):
+            response = client.get(
+                "/api/subjects/", {"search": "Физ"}, HTTP_IF_NONE_MATCH=first["ETag"]
+            )
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Subject.objects.create(name="Химия")
+        response = client.get("/api/subjects/", {"search": "Физ"}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+
+
+class AccessBufferTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name="Физика")
+
+    def accessed(self):
+        return Subject.objects.values_list("dateaccessed", flat=True).get(pk=self.subject.pk)
+
+    def test_record_inside_transaction_is_deferred(self):
+        buffer = AccessBuffer(max_size=1, flush_interval=3600)
+        with transaction.atomic():
+            buffer.record(Subject, self.subject.pk)
+        self.assertEqual(len(buffer), 1)
+        self.assertIsNone(self.accessed())
+        self.assertEqual(buffer.flush_if_due(), 1)
+        self.assertIsNotNone(self.accessed())
+
+    def test_flush_if_due_skips_small_buffer(self):
+        buffer = AccessBuffer(max_size=100, flush_interval=3600)
+        buffer.record(Subject, self.subject.pk)
+        self.assertEqual(buffer.flush_if_due(), 0)
+        self.assertEqual(len(buffer), 1)
+        self.assertIsNone(self.accessed())
+
+    def test_failed_write_keeps_outer_transaction_usable(self):
+        buffer = AccessBuffer(max_size=100, flush_interval=3600)
+        buffer.record(Subject, self.subject.pk)
+        with transaction.atomic():
+            with mock.patch("django.db.models.QuerySet.update", side_effect=DatabaseError):
+                with self.assertLogs("api.access_tracking", "WARNING"):
+                    self.assertEqual(buffer.flush(), 0)
+            self.assertEqual(len(buffer), 1)
+            Subject.objects.create(name="Химия")
+        self.assertEqual(Subject.objects.count(), 2)
+
+
+class DirtyFieldsTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name="Физика")
+
+    def test_refresh_from_db_resets_snapshot(self):
+        Subject.objects.filter(pk=self.subject.pk).update(name="Химия")
+        self.subject.refresh_from_db()
+        self.assertEqual(self.subject.changed_fields(), set())
+        self.assertFalse(self.subject.has_tracked_changes())
+
+    def test_refresh_of_some_fields_keeps_other_changes(self):
+        self.subject.note = "изменено"
+        Subject.objects.filter(pk=self.subject.pk).update(name="Химия")
+        self.subject.refresh_from_db(fields=["name"])
+        self.assertEqual(self.subject.changed_fields(), {"note"})
+
+    def test_deferred_field_load_is_not_a_change(self):
+        subject = Subject.objects.only("pk").get(pk=self.subject.pk)
+        self.assertEqual(subject.name, "Физика")
+        self.assertEqual(subject.changed_fields(), set())
+
+
+def import_document():
+    return {
+        "subjects": [{"idnumber": "s1", "name": "Физика"}],
+        "event_kinds": [{"idnumber": "k1", "name": "Лекция"}],
+        "time_slots": [{"idnumber": "t1", "start_time": "08:30", "end_time": "10:00"}],
+        "event_places": [{"idnumber": "p1", "building": "Б", "room": "101"}],
+        "event_participants": [
+            {"idnumber": "g1", "name": "ПрИн-466", "role": "student"},
+            {"idnumber": "g2", "name": "ПрИн-467", "role": "student"},
+        ],
+        "schedules": [
+            {
+                "idnumber": "sch1",
+                "faculty": "ФЭВТ",
+                "scope": "bachelor",
+                "course": 3,
+                "semester": 5,
+                "years": "2024-2025",
+            }
+        ],
+        "events": [
+            {
+                # "#" в idnumber события не должен разделять его при выгрузке
+                "idnumber": "lec#1",
+                "subject_id": "s1",
+                "kind_id": "k1",
+                "schedule_id": "sch1",
+                "participants": ["g1", "g2"],
+                "holding_info": [
+                    {"idnumber": "a", "date": "2024-09-02", "place_id": "p1", "slot_id": "t1"},
+                    {"idnumber": "b#2", "date": "2024-09-09", "place_id": "p1", "slot_id": "t1"},
+                ],
+            },
+            {
+                "idnumber": "lab#2",
+                "subject_id": "s1",
+                "kind_id": "k1",
+                "schedule_id": "sch1",
+                "participants": ["g1"],
+            },
+        ],
+    }
+
+
+def sorted_document(document):
+    return {
+        section: sorted(items, key=lambda item: item["idnumber"])
+        for section, items in document.items()
+    }
+
+
+class ImportExportTests(TestCase):
+    def export(self):
+        return json.loads(b"".join(JSONExporter().render()))
+
+    def test_export_import_round_trip(self):
+        document = import_document()
+        JSONImporter(document).import_data()
+        exported = self.export()
+        self.assertEqual(
+            {item["idnumber"]: len(item["holding_info"]) for item in exported["events"]},
+            {"lec#1": 2, "lab#2": 0},
+        )
+
+        for model in (Event, Schedule, EventParticipant, EventPlace, TimeSlot, EventKind, Subject):
+            model.objects.all().delete()
+        JSONImporter(exported).import_data()
+        self.assertEqual(sorted_document(self.export()), sorted_document(exported))
+        self.assertEqual(
+            set(Event.objects.values_list("idnumber", "holding_idnumber")),
+            {("lec#1#a", "a"), ("lec#1#b#2", "b#2"), ("lab#2", None)},
+        )
+
+    def test_reimport_of_export_into_same_database(self):
+        JSONImporter(import_document()).import_data()
+        lecture = Event.objects.get(idnumber="lec#1#a")
+        Event.objects.create(
+            idnumber="extra",
+            schedule=lecture.schedule,
+            subject_override=lecture.subject_override,
+            kind_override=lecture.kind_override,
+            date=datetime.date(2024, 9, 16),
+            place_override=lecture.place_override,
+        )
+        records = set(Event.objects.values_list("pk", "idnumber", "date"))
+        exported = self.export()
+
+        JSONImporter(exported).import_data()
+        self.assertEqual(set(Event.objects.values_list("pk", "idnumber", "date")), records)
+        self.assertEqual(sorted_document(self.export()), sorted_document(exported))
+
+    def test_export_reports_each_invalid_parameter(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("staff", is_staff=True))
+        response = client.get("/api/export/json/", {"schedule": "1", "status": "x"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()["validation_details"]), {"status"})
+        response = client.get("/api/export/json/", {"schedule": "x", "status": "99"})
+        self.assertEqual(set(response.json()["validation_details"]), {"schedule", "status"})
+
+    def test_reimport_removes_dropped_holdings(self):
+        document = import_document()
+        JSONImporter(document).import_data()
+        document["events"][0]["holding_info"].pop(0)
+        JSONImporter(document).import_data()
+        self.assertEqual(
+            set(Event.objects.values_list("idnumber", flat=True)), {"lec#1#b#2", "lab#2"}
+        )
+
+
+def faculty_document(name):
+    """Документ с одним расписанием и двумя событиями, idnumber которых начинаются с name"""
+    document = import_document()
+    document["schedules"][0]["idnumber"] = f"{name}-sch"
+    document["events"] = [
+        {**event, "idnumber": f"{name}-{index}", "schedule_id": f"{name}-sch"}
+        for index, event in enumerate(document["events"])
+    ]
+    return document
+
+
+class DiffImportTests(TestCase):
+    def import_document(self, document, mode):
+        JSONImporter(document, mode=mode).import_data()
+
+    def event_idnumbers(self):
+        return set(Event.objects.values_list("idnumber", flat=True))
+
+    def test_diff_import_keeps_other_schedules(self):
+        self.import_document(faculty_document("a"), ImportRun.Mode.DIFF)
+        self.import_document(faculty_document("b"), ImportRun.Mode.DIFF)
+        document = faculty_document("a")
+        document["events"].pop(1)
+        self.import_document(document, ImportRun.Mode.DIFF)
+        self.assertEqual(
+            self.event_idnumbers(), {"a-0#a", "a-0#b#2", "b-0#a", "b-0#b#2", "b-1"}
+        )
+        self.assertTrue(Schedule.objects.filter(idnumber="b-sch").exists())
+
+    def test_snapshot_import_deletes_everything_missing(self):
+        self.import_document(faculty_document("a"), ImportRun.Mode.DIFF)
+        self.import_document(faculty_document("b"), ImportRun.Mode.DIFF)
+        self.import_document(faculty_document("a"), ImportRun.Mode.SNAPSHOT)
+        self.assertEqual(self.event_idnumbers(), {"a-0#a", "a-0#b#2", "a-1"})
+        self.assertFalse(Schedule.objects.filter(idnumber="b-sch").exists())
+
+
+class TemplateScheduleTestCase(TestCase):
+    """
+    Двухнедельный шаблон, выровненный по понедельнику, и расписание на сентябрь 2025 года
+    (1 сентября - понедельник): занятие в день 0 шаблона и занятие в день 9 (ср второй недели)
+    """
+
+    def setUp(self):
+        self.days = {
+            number: AbstractDay.objects.create(day_number=number, name=f"День {number}")
+            for number in (0, 9)
+        }
+        self.kind = EventKind.objects.create(name="Лекция")
+        self.subject = Subject.objects.create(name="Физика")
+        self.place = EventPlace.objects.create(building="Б", room="101")
+        self.time_slot = TimeSlot.objects.create(start_time="08:30", end_time="10:00")
+        self.groups = [
+            EventParticipant.objects.create(name=f"Группа {index}", role="student")
+            for index in range(3)
+        ]
+        abstract_schedule = AbstractSchedule.objects.create(
+            repetition_period=14, repeatable=True, aligned_by_week_day=1
+        )
+        self.schedule = Schedule.objects.create(
+            faculty="ФЭВТ",
+            scope="bachelor",
+            course=1,
+            semester=1,
+            years="2025-2026",
+            start_date=datetime.date(2025, 9, 1),
+            end_date=datetime.date(2025, 9, 28),
+            starting_day_number=self.days[0],
+            abstract_schedule=abstract_schedule,
+        )
+        self.first = self.create_abstract_event(0, self.groups[:1])
+        self.second = self.create_abstract_event(9, self.groups[1:])
+
+    def create_abstract_event(self, day_number, participants):
+        abstract_event = AbstractEvent.objects.create(
+            kind=self.kind,
+            subject=self.subject,
+            place=self.place,
+            time_slot=self.time_slot,
+            abstract_day=self.days[day_number],
+            schedule=self.schedule,
+        )
+        abstract_event.participants.set(participants)
+        return abstract_event
+
+    def dates(self, abstract_event):
+        return sorted(
+            Event.objects.filter(abstract_event=abstract_event).values_list("date", flat=True)
+        )
+
+
+def september(*days):
+    return [datetime.date(2025, 9, day) for day in days]
+
+
+@override_settings(API_MATERIALIZE_EVENTS=False)
+class ScheduleExpanderTests(TemplateScheduleTestCase):
+    def test_expand_builds_occurrences(self):
+        stats = ScheduleExpander().expand()
+        self.assertEqual(stats["created"], 4)
+        self.assertEqual(self.dates(self.first), september(1, 15))
+        self.assertEqual(self.dates(self.second), september(10, 24))
+        event = Event.objects.filter(abstract_event=self.first).first()
+        self.assertEqual(event.schedule, self.schedule)
+        self.assertEqual(event.subject, self.subject)
+
+    def test_expand_is_idempotent(self):
+        ScheduleExpander().expand()
+        stats = ScheduleExpander().expand()
+        self.assertEqual((stats["created"], stats["deleted"], stats["unchanged"]), (0, 0, 4))
+
+    def test_day_override_moves_occurrence(self):
+        override = DayDateOverride.objects.create(
+            day_source=datetime.date(2025, 9, 15), day_destination=datetime.date(2025, 9, 20)
+        )
+        override.schedule.add(self.schedule)
+        ScheduleExpander().expand()
+        self.assertEqual(self.dates(self.first), september(1, 20))
+
+    def test_manually_changed_event_is_kept(self):
+        ScheduleExpander().expand()
+        event = Event.objects.get(abstract_event=self.first, date=datetime.date(2025, 9, 15))
+        event.place_override = EventPlace.objects.create(building="В", room="202")
+        event.save()
+        Schedule.objects.filter(pk=self.schedule.pk).update(end_date=datetime.date(2025, 9, 7))
+        stats = ScheduleExpander().expand()
+        self.assertEqual(stats["kept"], 1)
+        self.assertEqual(self.dates(self.first), september(1, 15))
+        self.assertEqual(self.dates(self.second), [])
+
+    def test_manually_moved_event_is_kept(self):
+        ScheduleExpander().expand()
+        event = Event.objects.get(abstract_event=self.first, date=datetime.date(2025, 9, 15))
+        event.date = datetime.date(2025, 9, 16)
+        event.save()
+        stats = ScheduleExpander().expand()
+        self.assertEqual((stats["created"], stats["deleted"]), (0, 0))
+        self.assertEqual(self.dates(self.first), september(1, 16))
+        self.assertTrue(Event.objects.filter(pk=event.pk).exists())
+
+    def test_stale_events_are_deleted_with_memberships(self):
+        ScheduleExpander().expand()
+        Schedule.objects.filter(pk=self.schedule.pk).update(end_date=datetime.date(2025, 9, 7))
+        stats = ScheduleExpander().expand()
+        self.assertEqual(stats["deleted"], 3)
+        self.assertEqual(
+            set(EventMembership.objects.values_list("event__date", "participant")),
+            {(datetime.date(2025, 9, 1), self.groups[0].pk)},
+        )
+
+    def test_virtual_occurrences_match_stored(self):
+        ScheduleExpander().expand()
+        date_from, date_to = september(8, 21)
+        stored = Event.objects.filter(date__range=(date_from, date_to)).values_list(
+            "schedule_id", "abstract_event_id", "date"
+        )
+        self.assertEqual(
+            ScheduleExpander().occurrences_between(date_from, date_to), set(stored)
+        )
+
+
+@override_settings(API_MATERIALIZE_EVENTS=False)
+class VirtualEventListTests(TemplateScheduleTestCase):
+    def virtual_dates(self, participants):
+        response = APIClient().get(
+            "/api/events/",
+            {
+                "virtual": "1",
+                "date_from": "2025-09-01",
+                "date_to": "2025-09-28",
+                "participants": [participant.pk for participant in participants],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        items = response.json()["items"]
+        return sorted(item["holding_info"][0]["date"] for item in items)
+
+    def test_template_matched_by_several_participants_is_listed_once(self):
+        filterset = EventFilter({"participants": [group.pk for group in self.groups]})
+        self.assertTrue(filterset.is_valid())
+        self.assertEqual(
+            list(filterset.filter_abstract_events(AbstractEvent.objects.order_by("pk"))),
+            [self.first, self.second],
+        )
+        self.assertEqual(self.virtual_dates(self.groups[1:]), ["2025-09-10", "2025-09-24"])
+
+    def test_moved_exception_replaces_its_template_date(self):
+        Event.objects.create(
+            schedule=self.schedule,
+            abstract_event=self.first,
+            date=datetime.date(2025, 9, 16),
+            original_date=datetime.date(2025, 9, 15),
+        )
+        self.assertEqual(self.virtual_dates(self.groups[:1]), ["2025-09-01", "2025-09-16"])
+
+
+@override_settings(API_MATERIALIZE_EVENTS=True)
+class RematerializationTests(TemplateScheduleTestCase):
+    def test_created_abstract_event_is_materialized(self):
+        self.assertEqual(self.dates(self.first), september(1, 15))
+        self.assertEqual(self.dates(self.second), september(10, 24))
+
+    def test_abstract_event_day_change(self):
+        self.second.abstract_day = self.days[0]
+        self.second.save()
+        self.assertEqual(self.dates(self.second), september(1, 15))
+        self.assertEqual(self.dates(self.first), september(1, 15))
+
+    def test_abstract_day_number_change(self):
+        day = self.days[9]
+        day.day_number = 2
+        day.save()
+        self.assertEqual(self.dates(self.second), september(3, 17))
+
+    def test_day_override_lifecycle(self):
+        override = DayDateOverride.objects.create(
+            day_source=datetime.date(2025, 9, 15), day_destination=datetime.date(2025, 9, 20)
+        )
+        override.schedule.add(self.schedule)
+        self.assertEqual(self.dates(self.first), september(1, 20))
+
+        override.day_destination = datetime.date(2025, 9, 27)
+        override.save()
+        self.assertEqual(self.dates(self.first), september(1, 27))
+
+        override.delete()
+        self.assertEqual(self.dates(self.first), september(1, 15))
+
+    def test_abstract_event_delete_removes_its_events(self):
+        Event.objects.filter(abstract_event=self.first).update(place_override=self.place)
+        pk = self.first.pk
+        self.first.delete()
+        self.assertFalse(Event.objects.filter(abstract_event_id=pk).exists())
+        self.assertEqual(self.dates(self.second), september(10, 24))
+
+    def test_schedule_delete_through_api(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("staff", is_staff=True))
+        response = client.delete(f"/api/schedules/{self.schedule.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(AbstractEvent.objects.exists())
+        self.assertFalse(Event.objects.exists())
+        self.assertFalse(EventMembership.objects.exists())
+
+    def test_schedule_dates_change(self):
+        self.schedule.end_date = datetime.date(2025, 9, 14)
+        self.schedule.save()
+        self.assertEqual(self.dates(self.first), september(1))
+        self.assertEqual(self.dates(self.second), september(10))
+
+    def test_unrelated_change_does_not_rebuild(self):
+        pks = set(Event.objects.values_list("pk", flat=True))
+        self.first.place = EventPlace.objects.create(building="В", room="202")
+        self.first.save()
+        self.assertEqual(set(Event.objects.values_list("pk", flat=True)), pks)
+
+
+@override_settings(API_MATERIALIZE_EVENTS=True)
+class EventMembershipTests(TemplateScheduleTestCase):
+    def assertConsistent(self):
+        expected = {
+            (event.pk, participant.pk, event.date)
+            for event in Event.objects.all()
+            for participant in event.participants
+        }
+        actual = set(EventMembership.objects.values_list("event_id", "participant_id", "date"))
+        self.assertEqual(actual, expected)
+
+    def test_expanded_events_have_memberships(self):
+        self.assertEqual(EventMembership.objects.count(), 2 + 2 * 2)
+        self.assertConsistent()
+
+    def test_override_participants_changes(self):
+        event = Event.objects.filter(abstract_event=self.first).first()
+        event.participants_override.add(self.groups[2])
+        self.assertConsistent()
+        event.participants_override.remove(self.groups[2])
+        self.assertConsistent()
+        self.groups[2].event_set.add(event)
+        self.assertConsistent()
+        self.groups[2].event_set.clear()
+        self.assertConsistent()
+
+    def test_abstract_event_participants_changes(self):
+        self.first.participants.add(self.groups[2])
+        self.assertConsistent()
+        self.first.participants.remove(self.groups[0])
+        self.assertConsistent()
+        self.groups[1].abstractevent_set.clear()
+        self.assertConsistent()
+
+    def test_event_date_change_and_delete(self):
+        event = Event.objects.filter(abstract_event=self.first).first()
+        event.date = datetime.date(2025, 9, 2)
+        event.save()
+        self.assertConsistent()
+        event.delete()
+        self.assertConsistent()
+        self.groups[1].delete()
+        self.assertConsistent()
+
+    def test_participant_filter_uses_memberships(self):
+        response = APIClient().get(
+            "/api/events/",
+            {"participants": self.groups[0].pk, "date_from": "2025-09-10", "date_to": "2025-09-30"},
+        )
+        expected = Event.objects.get(abstract_event=self.first, date=september(15)[0])
+        self.assertEqual([item["id"] for item in response.json()["items"]], [expected.pk])
+
+    def test_rebuild(self):
+        EventMembership.objects.all().delete()
+        self.assertEqual(EventMembership.rebuild(chunk_size=2), 6)
+        self.assertConsistent()
+
+
+class EventPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        schedule = Schedule.objects.create(
+            faculty="ФЭВТ", scope="bachelor", course=1, semester=1, years="2025-2026"
+        )
+        subject = Subject.objects.create(name="Физика")
+        early = TimeSlot.objects.create(start_time="08:30", end_time="10:00")
+        late = TimeSlot.objects.create(start_time="10:10", end_time="11:40")
+        # Совпадающие дата и время начала упорядочиваются по id, NULL идет первым
+        rows = [
+            (None, None),
+            (None, early),
+            *[(september(1)[0], early)] * 3,
+            (september(1)[0], None),
+            *[(september(1)[0], late)] * 2,
+            *[(september(2)[0], early)] * 2,
+        ]
+        for date, time_slot in rows:
+            Event.objects.create(
+                schedule=schedule, subject_override=subject, date=date, time_slot_override=time_slot
+            )
+        self.expected = [
+            event.pk
+            for event in sorted(
+                Event.objects.select_related("time_slot_override"),
+                key=lambda event: (
+                    event.date is not None,
+                    event.date or datetime.date.min,
+                    event.time_slot is not None,
+                    event.time_slot.start_time if event.time_slot else datetime.time.min,
+                    event.pk,
+                ),
+            )
+        ]
+
+    def page(self, **params):
+        response = self.client.get("/api/events/", params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [item["id"] for item in data["items"]], data["next"], data["prev"]
+
+    def test_next_and_prev_round_trip(self):
+        pages = [self.page(page_size=3)]
+        self.assertIsNone(pages[0][2])
+        while pages[-1][1] is not None:
+            pages.append(self.page(page_size=3, cursor=pages[-1][1]))
+        self.assertEqual([pk for ids, _, _ in pages for pk in ids], self.expected)
+
+        backwards = [pages[-1][0]]
+        prev = pages[-1][2]
+        while prev is not None:
+            ids, _, prev = self.page(page_size=3, cursor=prev)
+            backwards.insert(0, ids)
+        self.assertEqual(backwards, [ids for ids, _, _ in pages])
+
+    def test_invalid_cursor_is_not_found(self):
+        tampered = base64.urlsafe_b64encode(b'{"p":["2025-13-01",null,1]}').decode()
+        for cursor in ("@@@", base64.urlsafe_b64encode(b"[1]").decode(), tampered):
+            response = self.client.get("/api/events/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class StreamingListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(5):
+            Subject.objects.create(name=f"Предмет «{index}»")
+
+    def test_stream_matches_regular_list(self):
+        client = APIClient()
+        regular = client.get("/api/subjects/").json()
+        response = client.get("/api/subjects/", {"stream": "1"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), regular)
+
+    def test_render_stream_splits_into_blocks(self):
+        # Модуль рендереров импортирует настройки DRF, которые ссылаются на него же
+        from api.handlers import ResponseJSONRenderer
+
+        items = [{"name": "а" * 10, "id": index} for index in range(10)]
+        blocks = list(ResponseJSONRenderer().render_stream(iter(items), buffer_size=30))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(
+            json.loads(b"".join(blocks)), {"type": "response", "items": items}
+        )
+        self.assertEqual(
+            json.loads(b"".join(ResponseJSONRenderer().render_stream(iter([])))),
+            {"type": "response", "items": []},
+        )
+
+
+@override_settings(API_MATERIALIZE_EVENTS=True)
+class ProjectionParityTests(TemplateScheduleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("staff", is_staff=True)
+        other_slot = TimeSlot.objects.create(start_time="10:10", end_time="11:40")
+        edited = Event.objects.filter(abstract_event=self.first).first()
+        edited.time_slot_override = other_slot
+        edited.idnumber = "edited"
+        edited.note = "перенесено"
+        edited.author = self.staff
+        edited.dateaccessed = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+        edited.save()
+        edited.participants_override.set(self.groups[1:])
+        Event.objects.create(schedule=self.schedule, subject_override=self.subject)
+
+    def assertParity(self, serializer_class, queryset):
+        for user in (AnonymousUser(), self.staff):
+            with self.subTest(serializer=serializer_class.__name__, staff=user.is_staff):
+                projection = Projection.for_serializer(
+                    serializer_class, include_admin_fields=user.is_staff
+                )
+                serializer = serializer_class(
+                    queryset, many=True, context={"request": mock.Mock(user=user)}
+                )
+                self.assertEqual(projection.evaluate(queryset), serializer.data)
+
+    def test_projection_matches_serializer(self):
+        self.assertParity(EventSerializer, Event.objects.with_effective_fields().order_by("pk"))
+        self.assertParity(ScheduleSerializer, Schedule.objects.order_by("pk"))
+        self.assertParity(SubjectSerializer, Subject.objects.order_by("pk"))
+        self.assertParity(EventParticipantSerializer, EventParticipant.objects.order_by("pk"))
+        self.assertParity(EventPlaceSerializer, EventPlace.objects.order_by("pk"))
+
+
+@override_settings(API_MATERIALIZE_EVENTS=True)
+class ParticipantCalendarTests(TemplateScheduleTestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+        self.url = f"/api/groups/{self.groups[0].pk}/calendar.ics"
+
+    def test_template_edit_changes_calendar(self):
+        first = APIClient().get(self.url)
+        self.assertContains(first, "DTSTART:20250901T053000Z")
+        self.assertEqual(
+            APIClient().get(self.url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.time_slot = TimeSlot.objects.create(start_time="12:00", end_time="13:30")
+            self.first.save()
+        response = APIClient().get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertContains(response, "DTSTART:20250901T090000Z")
+        self.first.refresh_from_db()
+        self.assertContains(response, f"DTSTAMP:{format_utc(self.first.datemodified)}")
+
+    def test_template_participants_change_calendar(self):
+        first = APIClient().get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.participants.add(self.groups[0])
+        response = APIClient().get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.count(b"BEGIN:VEVENT"), 4)
+
+
+class ProjectionAccessTrackingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subjects = [Subject.objects.create(name=f"Предмет {index}") for index in range(3)]
+        self.buffer = AccessBuffer(max_size=10**6, flush_interval=3600)
+        patcher = mock.patch("api.projections.access_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def accessed(self):
+        return list(Subject.objects.order_by("pk").values_list("dateaccessed", flat=True))
+
+    def test_list_and_stream_record_returned_records(self):
+        for params in ({}, {"stream": "1"}):
+            with self.subTest(params=params):
+                self.buffer.clear()
+                response = APIClient().get("/api/subjects/", params)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                self.assertEqual(len(self.buffer), 3)
+        self.buffer.flush()
+        self.assertNotIn(None, self.accessed())
+
+
+def decode_columnar(data):
+    """Список объектов из колоночного ответа (обратное ColumnarEncoder)"""
+    tables = {"kind": "kinds", "subject": "subjects", "participants": "participants"}
+    tables.update({"holding_info.place": "places", "holding_info.time_slot": "time_slots"})
+
+    def decode(path, value):
+        if value is None:
+            return None
+        if path in tables:
+            table = data["tables"][tables[path]]
+            return [table[index] for index in value] if isinstance(value, list) else table[value]
+        if path not in data["schemas"]:
+            return value
+        if isinstance(value, list) and value and isinstance(value[0], list):
+            return [decode_object(path, element) for element in value]
+        return decode_object(path, value)
+
+    def decode_object(path, values):
+        keys = data["schemas"][path]
+        values = [*values, *[None] * (len(keys) - len(values))]
+        return {key: decode(f"{path}.{key}", value) for key, value in zip(keys, values)}
+
+    items = [{} for _ in range(data["count"])]
+    for key, column in data["columns"].items():
+        for item, value in zip(items, column):
+            if value is not None:
+                item[key] = decode(key, value)
+    return items
+
+
+@override_settings(API_MATERIALIZE_EVENTS=True)
+class WireFormatTests(TemplateScheduleTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        Event.objects.create(schedule=self.schedule, subject_override=self.subject)
+
+    def test_msgpack_and_columnar_match_json(self):
+        client = APIClient()
+        expected = client.get("/api/events/").json()
+
+        response = client.get("/api/events/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+
+        columnar = client.get("/api/events/", {"format": "columnar"}).json()
+        self.assertEqual(columnar["layout"], "columnar")
+        self.assertEqual(columnar["count"], len(expected["items"]))
+        # Повторяющиеся объекты передаются в таблицах один раз
+        self.assertEqual(len(columnar["tables"]["subjects"]), 1)
+        self.assertEqual(decode_columnar(columnar), expected["items"])
+
+
+class ImporterReferenceTests(TestCase):
+    def document(self, events, prefix="ev"):
+        document = import_document()
+        template = document["events"][0]
+        document["events"] = [
+            {
+                **template,
+                "idnumber": f"{prefix}-{index}",
+                "holding_info": [{**template["holding_info"][0], "idnumber": "a"}],
+            }
+            for index in range(events)
+        ]
+        return document
+
+    def count_queries(self, document):
+        with CaptureQueriesContext(connection) as queries:
+            JSONImporter(document).import_data()
+        return len(queries)
+
+    def test_reference_queries_do_not_depend_on_event_count(self):
+        JSONImporter(self.document(1, "warmup")).import_data()
+        self.assertEqual(
+            self.count_queries(self.document(5, "small")),
+            self.count_queries(self.document(50, "large")),
+        )
+        self.assertEqual(Event.objects.count(), 56)
+
+    def test_unknown_references_are_reported_together(self):
+        document = self.document(2)
+        document["events"][0]["subject_id"] = "missing-subject"
+        document["events"][1]["holding_info"][0]["place_id"] = "missing-place"
+        document["events"][1]["participants"] = ["g1", "missing-group"]
+        with self.assertRaises(ValidationError) as raised:
+            JSONImporter(document).import_data()
+        self.assertEqual(
+            raised.exception.detail["unknown_references"],
+            {
+                "subject_id": ["missing-subject"],
+                "place_id": ["missing-place"],
+                "participants": ["missing-group"],
+            },
+        )
+        self.assertFalse(Event.objects.exists())
+
+
+class EventIdnumberTests(TestCase):
+    """idnumber событий, являющиеся префиксами друг друга ("ev#..." > "ev 1$" при сравнении строк)"""
+
+    def document(self, holdings):
+        document = import_document()
+        template = document["events"][0]
+        document["events"] = [
+            {
+                **template,
+                "idnumber": idnumber,
+                "holding_info": [
+                    {**template["holding_info"][0], "idnumber": holding} for holding in items
+                ],
+            }
+            for idnumber, items in holdings.items()
+        ]
+        return document
+
+    def idnumbers(self):
+        return set(Event.objects.values_list("idnumber", flat=True))
+
+    def test_reimport_removes_dropped_holdings_of_prefix_ids(self):
+        JSONImporter(self.document({"ev": ["a", "b"], "ev 1": ["a"]})).import_data()
+        JSONImporter(self.document({"ev": ["a"], "ev 1": ["a"]})).import_data()
+        self.assertEqual(self.idnumbers(), {"ev#a", "ev 1#a"})
+
+    def test_diff_import_deletes_missing_prefix_ids(self):
+        mode = ImportRun.Mode.DIFF
+        JSONImporter(self.document({"ev": ["a"], "ev 1": ["a"]}), mode=mode).import_data()
+        JSONImporter(self.document({"ev 1": ["a"]}), mode=mode).import_data()
+        self.assertEqual(self.idnumbers(), {"ev 1#a"})
+        self.assertEqual(
+            set(Event.objects.values_list("event_idnumber", "holding_idnumber")), {("ev 1", "a")}
+        )
+
+
+class JSONStreamTests(TestCase):
+    document = {
+        "subjects": [
+            {"idnumber": 's"1', "name": 'Физика {"лекции"} [1]'},
+            {"idnumber": "s\\2", "name": "Химия 😀"},
+        ],
+        "empty": [],
+        "meta": {"version": [1, 2], "note": "не список"},
+        "numbers": [-2.5e10, 0, 12345678901234567890, 1.5, True, None, "}"],
+        "events": [{"idnumber": f"e{index}", "holding_info": []} for index in range(7)],
+    }
+
+    def encoded(self):
+        # ensure_ascii=True дает escape-последовательности \uXXXX, False - многобайтные символы
+        return [
+            json.dumps(self.document, ensure_ascii=True).encode("utf-8"),
+            "\ufeff{}".format(json.dumps(self.document, ensure_ascii=False, indent=1)).encode(),
+        ]
+
+    def sections(self, raw, batch_size=3, chunk_size=1):
+        result = {}
+        for section, batch in iter_json_sections(io.BytesIO(raw), batch_size, chunk_size):
+            self.assertLessEqual(len(batch), batch_size)
+            result.setdefault(section, []).extend(batch)
+        return result
+
+    def test_sections_match_json_load_for_any_chunk_size(self):
+        # Пустые разделы и значения, не являющиеся списками, не выдаются
+        expected = {
+            section: items
+            for section, items in self.document.items()
+            if isinstance(items, list) and items
+        }
+        for raw in self.encoded():
+            for chunk_size in (1, 2, 3, 7, 64 * 1024):
+                with self.subTest(chunk_size=chunk_size, length=len(raw)):
+                    self.assertEqual(self.sections(raw, chunk_size=chunk_size), expected)
+
+    def test_count_matches_json_load(self):
+        for raw in self.encoded():
+            counts = count_json_sections(io.BytesIO(raw), chunk_size=5)
+            loaded = json.loads(raw.decode("utf-8-sig"))
+            lists = {key: value for key, value in loaded.items() if isinstance(value, list)}
+            self.assertEqual(counts, {key: len(value) for key, value in lists.items() if value})
+
+    def test_empty_document(self):
+        self.assertEqual(list(iter_json_sections(io.BytesIO(b" { } "), 10)), [])
+
+    def test_truncated_and_malformed_input_raises(self):
+        raw = self.encoded()[0]
+        for end in range(len(raw)):
+            with self.subTest(end=end):
+                with self.assertRaises(json.JSONDecodeError):
+                    self.sections(raw[:end], chunk_size=4)
+        for malformed in (b"[]", b'{"a" [1]}', b'{"a": [1 2]}', b'{"a": [1,]}', b'{"a": [1]'):
+            with self.subTest(malformed=malformed):
+                with self.assertRaises(json.JSONDecodeError):
+                    self.sections(malformed)
+
+
+class ResumableImportTests(TestCase):
+    def document(self):
+        document = faculty_document("a")
+        document["events"].append({**document["events"][1], "idnumber": "a-2"})
+        return document
+
+    def test_checkpoints_are_saved_per_batch(self):
+        document = self.document()
+        importer = JSONImporter(document, batch_size=1)
+        importer.import_data()
+        run = ImportRun.objects.get(pk=importer.run.pk)
+        self.assertEqual(run.status, ImportRun.Status.COMPLETED)
+        self.assertEqual((run.section, run.offset), ("events", 3))
+        self.assertEqual(run.progress["events"], {"done": 3, "total": 3})
+        self.assertEqual(run.progress["event_participants"], {"done": 2, "total": 2})
+        self.assertEqual(run.summary["events"], {"created": 3, "updated": 0, "unchanged": 0})
+
+    def test_failed_import_resumes_from_checkpoint(self):
+        document = self.document()
+        document["events"][1]["subject_id"] = "missing"
+        importer = JSONImporter(document, batch_size=1)
+        with self.assertRaises(ValidationError):
+            importer.import_data()
+        run = ImportRun.objects.get(pk=importer.run.pk)
+        self.assertEqual(run.status, ImportRun.Status.FAILED)
+        self.assertIn("missing", run.error)
+        # Пачка с ошибкой откатывается целиком, предыдущие пачки остаются записанными
+        self.assertEqual((run.section, run.offset), ("events", 1))
+        self.assertEqual(Event.objects.filter(event_idnumber="a-1").count(), 0)
+        self.assertEqual(Event.objects.filter(event_idnumber="a-0").count(), 2)
+
+        document["events"][1]["subject_id"] = "s1"
+        with mock.patch.object(
+            JSONImporter, "import_section", autospec=True, side_effect=JSONImporter.import_section
+        ) as import_section:
+            JSONImporter(document, run=run, batch_size=1).import_data()
+        # Записанные пачки не импортируются повторно
+        self.assertEqual(
+            [call.args[1] for call in import_section.call_args_list], ["events", "events"]
+        )
+        run.refresh_from_db()
+        self.assertEqual(run.status, ImportRun.Status.COMPLETED)
+        self.assertIsNone(run.error)
+        self.assertEqual(run.progress["events"]["done"], 3)
+        self.assertEqual(run.summary["events"]["created"], 3)
+        self.assertEqual(
+            set(Event.objects.values_list("event_idnumber", flat=True)), {"a-0", "a-1", "a-2"}
+        )
+
+
+class ImportQueueTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("staff", is_staff=True))
+
+    def upload(self, document, **params):
+        return self.client.post(
+            f"/api/import/json/?{urlencode(params)}",
+            json.dumps(document),
+            content_type="application/json",
+        )
+
+    def test_claim_next_takes_oldest_queued_job_once(self):
+        first = ImportRun.enqueue(database="a", source="a")
+        second = ImportRun.enqueue(database="b", source="b")
+        self.assertEqual(ImportRun.claim_next().pk, first.pk)
+        self.assertEqual(ImportRun.objects.get(pk=first.pk).status, ImportRun.Status.RUNNING)
+        self.assertEqual(ImportRun.claim_next().pk, second.pk)
+        self.assertIsNone(ImportRun.claim_next())
+
+    def test_uploaded_document_is_imported_by_worker(self):
+        response = self.upload(import_document())
+        self.assertEqual(response.status_code, 202)
+        job = response.json()["items"][0]["import_run"]
+        self.assertEqual(job["status"], ImportRun.Status.QUEUED)
+        self.assertFalse(Event.objects.exists())
+
+        run = ImportRun.claim_next()
+        self.assertEqual(run.pk, job["id"])
+        run_import_job(run)
+        self.assertEqual(Event.objects.count(), 3)
+        self.assertFalse(run.file)
+
+        status = self.client.get(f"/api/import/jobs/{run.pk}/").json()["items"][0]
+        self.assertEqual(status["status"], ImportRun.Status.COMPLETED)
+        self.assertEqual(status["progress"]["events"], {"done": 2, "total": 2, "remaining": 0})
+        self.assertEqual(self.client.get("/api/import/runs/").status_code, 404)
+
+    def test_failed_job_is_resumed_with_stored_document(self):
+        document = import_document()
+        document["events"][1]["kind_id"] = "missing"
+        run_id = self.upload(document).json()["items"][0]["import_run"]["id"]
+        with self.assertRaises(ValidationError):
+            run_import_job(ImportRun.claim_next())
+        run = ImportRun.objects.get(pk=run_id)
+        self.assertEqual(run.status, ImportRun.Status.FAILED)
+        self.assertTrue(run.file)
+
+        # Задание нельзя продолжить, пока оно в очереди, и после завершения
+        self.assertEqual(self.client.post(f"/api/import/json/?resume={run_id}").status_code, 202)
+        self.assertEqual(self.client.post(f"/api/import/json/?resume={run_id}").status_code, 400)
+        ImportRun.objects.filter(pk=run_id).update(status=ImportRun.Status.FAILED)
+
+        document["events"][1]["kind_id"] = "k1"
+        self.assertEqual(self.upload(document, resume=run_id).status_code, 202)
+        run_import_job(ImportRun.claim_next())
+        run.refresh_from_db()
+        self.assertEqual(run.status, ImportRun.Status.COMPLETED)
+        self.assertEqual(Event.objects.count(), 3)
+        self.assertEqual(self.client.post(f"/api/import/json/?resume={run_id}").status_code, 400)
+
+
+class DirectoryImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.write("a.json", faculty_document("a"))
+        second = faculty_document("b")
+        second["subjects"][0]["name"] = "Физика (новая)"
+        self.write("b.json", second)
+
+    def write(self, name, document):
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as fd:
+            fd.write(document if isinstance(document, str) else json.dumps(document))
+
+    def test_files_are_merged_and_written_once(self):
+        stats = DirectoryImporter.from_directory(self.directory, workers=1).import_all()
+        self.assertEqual(stats["files"], 2)
+        # Справочники обоих файлов совпадают по idnumber, предмет - с разным названием
+        self.assertEqual(stats["duplicates"], 6)
+        self.assertEqual(stats["conflicts"], 1)
+        self.assertEqual(Subject.objects.get(idnumber="s1").name, "Физика (новая)")
+        self.assertEqual(
+            set(Event.objects.values_list("event_idnumber", flat=True)),
+            {"a-0", "a-1", "b-0", "b-1"},
+        )
+
+    def test_invalid_files_are_reported_without_writing(self):
+        self.write("c.json", "{broken")
+        self.write("d.json", {"events": [{"idnumber": "x"}]})
+        with self.assertRaises(ValidationError) as raised:
+            DirectoryImporter.from_directory(self.directory, workers=1).import_all()
+        self.assertEqual(set(raised.exception.detail["files"]), {"c.json", "d.json"})
+        self.assertFalse(Subject.objects.exists())
+
+
+class DirectoryParseTests(SimpleTestCase):
+    def test_parallel_parse_matches_sequential(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("a", "b", "c"):
+                with open(os.path.join(directory, f"{name}.json"), "w") as fd:
+                    json.dump(faculty_document(name), fd)
+            sequential = DirectoryImporter.from_directory(directory, workers=1).parse()
+            parallel = DirectoryImporter.from_directory(directory, workers=3).parse()
+        strip = lambda results: [{**result, "seconds": None} for result in results]
+        self.assertEqual(strip(parallel), strip(sequential))
+
+
+def create_source_database(path):
+    """База SQLite со структурой DEFAULT_MAPPING и содержимым import_document()"""
+    document = import_document()
+    source = sqlite3.connect(path)
+    with source:
+        source.executescript(
+            """
+            CREATE TABLE disciplines (code TEXT, title TEXT);
+            CREATE TABLE event_kinds (idnumber TEXT, name TEXT);
+            CREATE TABLE time_slots (idnumber TEXT, start_time TEXT, end_time TEXT);
+            CREATE TABLE event_places (idnumber TEXT, building TEXT, room TEXT);
+            CREATE TABLE event_participants (idnumber TEXT, name TEXT, role TEXT);
+            CREATE TABLE schedules (
+                idnumber TEXT, faculty TEXT, scope TEXT, course INT, semester INT, years TEXT
+            );
+            CREATE TABLE events (idnumber TEXT, subject_id TEXT, kind_id TEXT, schedule_id TEXT);
+            CREATE TABLE event_participants_link (event_id TEXT, participant_id TEXT);
+            CREATE TABLE event_holdings (
+                event_id TEXT, idnumber TEXT, date TEXT, place_id TEXT, slot_id TEXT
+            );
+            """
+        )
+        tables = {"subjects": "disciplines"}
+        for section, items in document.items():
+            if section == "events":
+                continue
+            columns = list(items[0])
+            source.executemany(
+                f"INSERT INTO {tables.get(section, section)} "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                [[item[column] for column in columns] for item in items],
+            )
+        for event in document["events"]:
+            source.execute(
+                "INSERT INTO events VALUES (?, ?, ?, ?)",
+                [event["idnumber"], event["subject_id"], event["kind_id"], event["schedule_id"]],
+            )
+            source.executemany(
+                "INSERT INTO event_participants_link VALUES (?, ?)",
+                [[event["idnumber"], participant] for participant in event["participants"]],
+            )
+            source.executemany(
+                "INSERT INTO event_holdings VALUES (?, ?, ?, ?, ?)",
+                [
+                    [event["idnumber"], *(holding[field] for field in holding)]
+                    for holding in event.get("holding_info", [])
+                ],
+            )
+    source.close()
+
+
+class DatabaseImportTests(TestCase):
+    MAPPING = {
+        "subjects": {"table": "disciplines", "fields": {"idnumber": "code", "name": "title"}},
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "source.sqlite3")
+        create_source_database(self.path)
+
+    def import_db(self, mapping):
+        sources = {
+            "legacy": {"MODULE": "sqlite3", "OPTIONS": {"database": self.path}, "MAPPING": mapping}
+        }
+        with override_settings(API_DB_IMPORT_SOURCES=sources):
+            call_command("import_db", "legacy", "--batch-size", "1", stdout=io.StringIO())
+
+    def test_import_db_writes_mapped_tables(self):
+        self.import_db(self.MAPPING)
+        self.assertEqual(Subject.objects.get(idnumber="s1").name, "Физика")
+        self.assertEqual(
+            set(Event.objects.values_list("idnumber", "date")),
+            {
+                ("lec#1#a", datetime.date(2024, 9, 2)),
+                ("lec#1#b#2", datetime.date(2024, 9, 9)),
+                ("lab#2", None),
+            },
+        )
+        lecture = Event.objects.get(idnumber="lec#1#a")
+        self.assertEqual(
+            set(lecture.participants.values_list("idnumber", flat=True)), {"g1", "g2"}
+        )
+        self.assertEqual(ImportRun.objects.get().status, ImportRun.Status.COMPLETED)
+
+    def test_missing_column_fails_the_run(self):
+        mapping = {"subjects": {**self.MAPPING["subjects"], "fields": ["idnumber", "name"]}}
+        with self.assertRaises(sqlite3.OperationalError):
+            self.import_db(mapping)
+        run = ImportRun.objects.get()
+        self.assertEqual(run.status, ImportRun.Status.FAILED)
+        self.assertIn("no such column", run.error)
+
+
+class EffectiveFieldTests(TestCase):
+    """Занятия абстрактного события: без изменений, с другим местом и временем, с другим типом"""
+
+    def setUp(self):
+        self.kinds = [EventKind.objects.create(name=name) for name in ("Лекция", "Семинар")]
+        self.places = [EventPlace.objects.create(building="Б", room=room) for room in ("1", "2")]
+        self.slots = [
+            TimeSlot.objects.create(start_time=start, end_time=end)
+            for start, end in (("08:30", "10:00"), ("12:00", "13:30"))
+        ]
+        subject = Subject.objects.create(name="Физика")
+        schedule = Schedule.objects.create(
+            faculty="ФЭВТ", scope="bachelor", course=1, semester=1, years="2025-2026"
+        )
+        abstract_event = AbstractEvent.objects.create(
+            kind=self.kinds[0],
+            subject=subject,
+            place=self.places[0],
+            time_slot=self.slots[0],
+            abstract_day=AbstractDay.objects.create(day_number=0, name="День 0"),
+            schedule=schedule,
+        )
+        date = datetime.date(2025, 9, 1)
+        self.plain, self.moved, self.changed = [
+            Event.objects.create(
+                schedule=schedule, abstract_event=abstract_event, date=date, **overrides
+            )
+            for overrides in (
+                {},
+                {"place_override": self.places[1], "time_slot_override": self.slots[1]},
+                {"kind_override": self.kinds[1]},
+            )
+        ]
+
+    def list_ids(self, **params):
+        response = APIClient().get("/api/events/", params)
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.json()["items"]]
+
+    def test_annotations_fall_back_to_abstract_event(self):
+        values = Event.objects.with_effective_fields().order_by("pk").values_list(
+            "effective_kind", "effective_place", "effective_time_slot", "effective_start_time"
+        )
+        self.assertEqual(
+            list(values),
+            [
+                (self.kinds[0].pk, self.places[0].pk, self.slots[0].pk, datetime.time(8, 30)),
+                (self.kinds[0].pk, self.places[1].pk, self.slots[1].pk, datetime.time(12, 0)),
+                (self.kinds[1].pk, self.places[0].pk, self.slots[0].pk, datetime.time(8, 30)),
+            ],
+        )
+
+    def test_filters_use_effective_values(self):
+        self.assertEqual(
+            self.list_ids(possible_rooms=self.places[0].pk), [self.plain.pk, self.changed.pk]
+        )
+        self.assertEqual(self.list_ids(possible_rooms=self.places[1].pk), [self.moved.pk])
+        self.assertEqual(self.list_ids(can_have_kind=self.kinds[1].pk), [self.changed.pk])
+        self.assertEqual(self.list_ids(time_from="11:00"), [self.moved.pk])
+
+    def test_ordering_uses_effective_values(self):
+        self.assertEqual(
+            self.list_ids(ordering="-effective_start_time,id"),
+            [self.moved.pk, self.plain.pk, self.changed.pk],
+        )
+        self.assertEqual(
+            self.list_ids(ordering="-effective_kind,id"),
+            [self.changed.pk, self.plain.pk, self.moved.pk],
+        )
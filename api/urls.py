@@ -2,14 +2,19 @@ from django.urls import include, path
 from api.views import (
     EventKindListView,
     EventViewSet,
+    GroupCalendarAPIView,
     GroupViewSet,
+    ImportRunViewSet,
+    JSONExportAPIView,
     JSONImportAPIView,
     DBImportAPIView,
     LessonRoomViewSet,
     ObtainAPIUserToken,
+    ResponseCacheStatsAPIView,
     ScheduleViewSet,
     SchedulesAPIRootView,
     SubjectViewSet,
+    TeacherCalendarAPIView,
     TeacherViewSet,
 )
 from rest_framework.routers import DefaultRouter
@@ -23,6 +28,7 @@ router.register(r"lessonrooms", LessonRoomViewSet, basename="lessonrooms")
 router.register(r"groups", GroupViewSet, basename="groups")
 router.register(r"teachers", TeacherViewSet, basename="teachers")
 router.register(r"schedules", ScheduleViewSet, basename="schedules")
+router.register(r"import/jobs", ImportRunViewSet, basename="import-jobs")
 
 
 urlpatterns = [
@@ -30,7 +36,11 @@ urlpatterns = [
     path("events/kind/", EventKindListView.as_view()),
     path("import/json/", JSONImportAPIView.as_view()),
     path("import/db/", DBImportAPIView.as_view()),
+    path("export/json/", JSONExportAPIView.as_view()),
     path("obtain-token/", ObtainAPIUserToken.as_view()),
+    path("cache/stats/", ResponseCacheStatsAPIView.as_view()),
+    path("groups/<int:pk>/calendar.ics", GroupCalendarAPIView.as_view()),
+    path("teachers/<int:pk>/calendar.ics", TeacherCalendarAPIView.as_view()),
 ]
 
 urlpatterns += router.urls
@@ -1,8 +1,15 @@
-import json
-
-from django.shortcuts import redirect
+from django.conf import settings
+from django.core.files import File
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, generics, status, viewsets
+from rest_framework import filters, generics, serializers, status, viewsets
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.routers import APIRootView
@@ -10,14 +17,41 @@ from rest_framework.views import APIView
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 
+from api.caching import (
+    ResponseCache,
+    conditional_state,
+    not_modified_response,
+    response_cache_stats,
+    set_validators,
+)
+from api.chunking import QUERY_CHUNK_SIZE, chunked
+from api.exporters import JSONExporter
 from api.filters import EventFilter, ScheduleFilter
-from api.importers import JSONImporter
-from api.models import Event, EventKind, EventParticipant, EventPlace, Schedule, Subject
+from api.handlers import ColumnarJSONRenderer, ResponseJSONRenderer, ResponseMessagePackRenderer
+from api.ical import CALENDAR_MODELS, CalendarBuilder
+from api.expansion import ScheduleExpander
+from api.models import (
+    AbstractDay,
+    AbstractEvent,
+    AbstractSchedule,
+    DayDateOverride,
+    Event,
+    EventKind,
+    EventParticipant,
+    EventPlace,
+    ImportRun,
+    Schedule,
+    Subject,
+)
+from api.pagination import EventCursorPagination
+from api.projections import Projection
+from api.query_planning import QueryCounter, QueryPlan
 from api.serializers import (
     EventParticipantSerializer,
     EventPlaceSerializer,
     EventSerializer,
     FileUploadSerializer,
+    ImportRunSerializer,
     ScheduleSerializer,
     SubjectSerializer,
 )
@@ -37,6 +71,8 @@ class SchedulesAPIRootView(APIRootView):
     - [Место проведения](/api/lessonrooms)<br>
     - [Тип события](/api/events/kind)<br>
     - [Группы](/api/groups) и [преподаватели](/api/teachers)<br>
+        - Календарь участника в формате iCalendar: `/api/groups/<id>/calendar.ics`,
+        `/api/teachers/<id>/calendar.ics` <br>
 
 
     Каждая сущность имеет вариативность действия в зависимости от метода запроса.
@@ -45,6 +81,21 @@ class SchedulesAPIRootView(APIRootView):
     Большинство списков сущностей поддерживают опциональный аргумент `search` в URL,
     который позволяет искать записи по ключевым полям
 
+    Для выгрузки больших списков (например, всех занятий расписания за семестр) можно указать
+    аргумент `stream=1`: ответ того же формата будет передаваться по частям по мере чтения из БД
+
+    ## Форматы ответа
+
+    Формат выбирается заголовком `Accept` или аргументом `format`:<br>
+
+    - `application/json` (`format=json`) - формат по умолчанию <br>
+    - `application/msgpack` (`format=msgpack`) - тот же ответ в формате [MessagePack](https://msgpack.org) <br>
+    - `application/vnd.schedule.columnar+json` (`format=columnar`) - колоночный JSON:
+    вместо `items` ответ содержит `columns` (значения каждого поля для всех `count` записей),
+    повторяющиеся объекты (предметы, типы, участники, места и время проведения занятий)
+    передаются один раз в `tables` и заменяются в колонках индексами,
+    а остальные вложенные объекты - списками значений в порядке ключей из `schemas` <br>
+
     Более того, можно просматривать элемент каждой сущности по id. Пример URL: `/api/events/1`,
     он также поддерживает методы PUT, UPDATE, DELETE для модификации значений.
 
@@ -79,7 +130,14 @@ class SchedulesAPIRootView(APIRootView):
     Сервис поддерживает импорт данных в API из сторонних источников, доступный только администраторам:<br>
 
     - [из JSON](/api/import/json)<br>
-    - [из внешней базы данных](/api/import/db) (пока недоступно)<br>
+    - [из внешней базы данных](/api/import/db)<br>
+
+    Все данные (или расписания выбранного факультета) можно [выгрузить](/api/export/json)
+    в том же формате, что и для импорта из JSON<br>
+
+    Импорт выполняется в фоне обработчиком очереди (`python manage.py run_import_worker`),
+    ход импорта (записано и осталось записей по разделам, скорость) можно отслеживать
+    в списке [заданий импорта](/api/import/jobs)<br>
 
     """
 
@@ -109,6 +167,130 @@ class CommonViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = []
 
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.DEBUG:
+            return super().dispatch(request, *args, **kwargs)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+        response["X-Query-Count"] = str(counter.count)
+        return response
+
+    def get_query_plan(self):
+        user = self.request.user if self.request else None
+        return QueryPlan.for_serializer(
+            self.get_serializer_class(), include_admin_fields=bool(user and user.is_staff)
+        )
+
+    def get_queryset(self):
+        return self.get_query_plan().apply(super().get_queryset())
+
+    # Модели, от которых зависит результат фильтрации, но которые не выводятся в ответе
+    cache_dependencies = []
+
+    def cached_response(self, handler, request, *args, cacheable=True, **kwargs):
+        """
+        Отвечает из кэша ответов, либо ответом 304 по версиям моделей ответа,
+        и только если оба варианта невозможны, выполняет handler (сериализацию)
+        """
+        models = self.get_query_plan().related_models | set(self.cache_dependencies)
+        cache_applicable = cacheable and ResponseCache.is_applicable(
+            request, [ResponseJSONRenderer, ResponseMessagePackRenderer, ColumnarJSONRenderer]
+        )
+        response = self._cached_response(
+            handler, models, cache_applicable, request, *args, **kwargs
+        )
+        # Тело ответа зависит от пользователя (поля администратора, см. CommonModelSerializer)
+        patch_vary_headers(response, ("Cookie", "Authorization"))
+        return response
+
+    def _cached_response(self, handler, models, cache_applicable, request, *args, **kwargs):
+        if cache_applicable:
+            key, response = ResponseCache(request, models).get()
+            if response is not None:
+                return response
+
+        etag, last_modified = conditional_state(
+            models,
+            request.accepted_media_type,
+            variant="staff" if request.user.is_staff else None,
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_validators(response, etag, last_modified)
+            if cache_applicable:
+                ResponseCache.store(key, response, etag, last_modified)
+        return response
+
+    stream_query_param = "stream"
+    stream_chunk_size = 500
+    # Чтение списков через проекции (см. api.projections) вместо сериализаторов DRF
+    use_projections = True
+
+    def get_projection(self):
+        if not self.use_projections:
+            return None
+        return Projection.for_serializer(
+            self.get_serializer_class(), include_admin_fields=self.request.user.is_staff
+        )
+
+    def is_paginated(self, request):
+        if self.paginator is None:
+            return False
+        return getattr(self.paginator, "is_requested", lambda request: True)(request)
+
+    def is_streaming_requested(self, request):
+        if request.query_params.get(self.stream_query_param) not in ("1", "true"):
+            return False
+        if type(request.accepted_renderer) is not ResponseJSONRenderer:
+            return False
+        # Потоковый вывод отдает список целиком, поэтому с постраничным выводом не совмещается
+        return not self.is_paginated(request)
+
+    def projection_list(self, request, *args, **kwargs):
+        projection = self.get_projection()
+        if projection is None or self.is_paginated(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(projection.evaluate(queryset))
+
+    def stream_list(self, request, *args, **kwargs):
+        """
+        Выдает список через StreamingHttpResponse: записи читаются из БД порциями
+        по stream_chunk_size и сериализуются по одной, поэтому память на запрос
+        не растет вместе с размером списка
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        projection = self.get_projection()
+        if projection is not None:
+            items = projection.iterate(queryset, self.stream_chunk_size)
+        else:
+            serializer = self.get_serializer()
+            items = (
+                serializer.to_representation(instance)
+                for instance in queryset.iterator(chunk_size=self.stream_chunk_size)
+            )
+        renderer = request.accepted_renderer
+        return StreamingHttpResponse(
+            renderer.render_stream(items),
+            content_type=request.accepted_media_type,
+        )
+
+    def list(self, request, *args, **kwargs):
+        if self.is_streaming_requested(request):
+            return self.cached_response(
+                self.stream_list, request, *args, cacheable=False, **kwargs
+            )
+        return self.cached_response(self.projection_list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
     def get_permissions(self):
         if self.action in ["create", "update", "partial_update", "destroy"]:
             permission_classes = [IsAdminUser]
@@ -273,6 +455,26 @@ class EventViewSet(CommonViewSet):
     - `can_have_kind` - список строк - возможных типов события.  Работает как фильтр, а не точный поиск по наличию всех заданных типов <br>
     - `possible_rooms` - список ID возможных аудиторий. Работает как фильтр, а не точный поиск по наличию всех заданных участников <br>
 
+    Фильтры учитывают значения абстрактного события, если у занятия они не переопределены <br>
+
+    ## Упорядочивание: <br>
+    - `ordering` - поля через запятую (`-` перед полем - по убыванию): `effective_date`, `effective_start_time`,
+    `effective_kind`, `effective_subject`, `effective_place`, `id`. По умолчанию - по дате, времени начала и id <br>
+
+    ## Постраничный вывод: <br>
+    - `page_size` - число занятий на странице (по умолчанию 100, не более 1000). Включает постраничный вывод <br>
+    - `cursor` - курсор страницы из полей `next` или `prev` предыдущего ответа <br>
+
+    Занятия на страницах всегда упорядочены по дате, времени начала и id (`ordering` не учитывается).
+    Если курсор `next` или `prev` равен `null`, то страницы в этом направлении закончились
+
+    ## Виртуальные занятия: <br>
+    - `virtual=1` - вместе с хранимыми занятиями выводятся занятия, вычисленные по шаблонам расписаний
+    (абстрактным событиям) и переносам дней. Требует `date_from` и `date_to` (окно не длиннее года) <br>
+
+    Виртуальное занятие не имеет `id` и не выводится, если для его абстрактного события и даты есть хранимое
+    занятие. Список выводится целиком (без постраничного вывода), упорядоченным по дате, времени начала и id
+
     # Аргументы, доступные для изменения: <br>
     - `subject` - предмет (объект, [см. предметы](/api/subjects)) (обязательный) <br>
     - `kind` - [тип события](/api/events/kind), задается строкой <br>
@@ -288,8 +490,127 @@ class EventViewSet(CommonViewSet):
     """
 
     filterset_class = EventFilter
-    queryset = Event.objects.all()
+    queryset = Event.objects.with_effective_fields()
     serializer_class = EventSerializer
+    pagination_class = EventCursorPagination
+    filter_backends = [*CommonViewSet.filter_backends, filters.OrderingFilter]
+    ordering_fields = [
+        "effective_date",
+        "effective_start_time",
+        "effective_kind",
+        "effective_subject",
+        "effective_place",
+        "id",
+    ]
+    ordering = ["effective_date", "effective_start_time", "id"]
+    columnar_tables = {
+        "kind": "kinds",
+        "subject": "subjects",
+        "participants": "participants",
+        "holding_info.place": "places",
+        "holding_info.time_slot": "time_slots",
+    }
+
+    virtual_query_param = "virtual"
+    virtual_max_days = 366
+    # Модели шаблонов, по которым вычисляются виртуальные занятия
+    virtual_cache_dependencies = [
+        AbstractEvent,
+        AbstractSchedule,
+        AbstractDay,
+        DayDateOverride,
+        Schedule,
+    ]
+
+    def is_virtual_requested(self, request):
+        return request.query_params.get(self.virtual_query_param) in ("1", "true")
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_virtual_requested(request):
+            return super().list(request, *args, **kwargs)
+        self.cache_dependencies = [*self.cache_dependencies, *self.virtual_cache_dependencies]
+        return self.cached_response(self.virtual_list, request, *args, **kwargs)
+
+    def virtual_list(self, request, *args, **kwargs):
+        """
+        Хранимые занятия окна date_from..date_to и занятия, вычисленные по шаблонам
+        (см. ScheduleExpander.occurrences_between). Представление занятия абстрактного
+        события строится один раз, виртуальные занятия отличаются от него только датой
+        """
+        filterset = DjangoFilterBackend().get_filterset(request, self.get_queryset(), self)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        date_from = filterset.form.cleaned_data.get("date_from")
+        date_to = filterset.form.cleaned_data.get("date_to")
+        if date_from is None or date_to is None:
+            raise ValidationError(
+                {"date_from": ["Для виртуальных занятий нужны date_from и date_to."]}
+            )
+        if not 0 <= (date_to - date_from).days < self.virtual_max_days:
+            raise ValidationError(
+                {"date_to": [f"Окно должно быть не длиннее {self.virtual_max_days} дней."]}
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        projection = self.get_projection()
+        if projection is not None:
+            items = projection.evaluate(queryset)
+        else:
+            items = self.get_serializer(queryset, many=True).data
+
+        abstract_events = filterset.filter_abstract_events(AbstractEvent.objects.all())
+        occurrences = ScheduleExpander().occurrences_between(date_from, date_to, abstract_events)
+        # Хранимое занятие заменяет виртуальное на дате по шаблону, даже если перенесено
+        # вручную на другую дату (см. Event.original_date)
+        window = (date_from, date_to)
+        occurrences -= set(
+            Event.objects.filter(
+                Q(original_date__range=window) | Q(original_date=None, date__range=window),
+                abstract_event__in=abstract_events,
+            ).values_list("schedule_id", "abstract_event_id", Coalesce("original_date", "date"))
+        )
+        templates = self._virtual_templates({item[1] for item in occurrences})
+        date_field = serializers.DateField()
+        for schedule_id, abstract_event_id, date in occurrences:
+            template = templates[abstract_event_id]
+            holding = {**template["holding_info"][0], "date": date_field.to_representation(date)}
+            items.append({**template, "holding_info": [holding]})
+
+        items.sort(key=self._virtual_ordering_key)
+        return Response(items)
+
+    def _virtual_templates(self, abstract_event_ids) -> dict:
+        """{pk абстрактного события: представление его занятия без даты}"""
+        templates = {}
+        projection = self.get_projection()
+        for chunk in chunked(abstract_event_ids, QUERY_CHUNK_SIZE):
+            abstract_events = AbstractEvent.objects.filter(pk__in=chunk)
+            if projection is not None:
+                templates.update(
+                    projection.evaluate_mapped(
+                        abstract_events, {"abstract_event": "pk", "schedule": "schedule"}
+                    )
+                )
+                continue
+
+            abstract_events = abstract_events.select_related(
+                "kind", "subject", "place", "time_slot"
+            ).prefetch_related("participants")
+            events = [
+                Event(schedule_id=abstract_event.schedule_id, abstract_event=abstract_event)
+                for abstract_event in abstract_events
+            ]
+            data = self.get_serializer(events, many=True).data
+            templates.update(
+                (event.abstract_event_id, item) for event, item in zip(events, data)
+            )
+        return templates
+
+    @staticmethod
+    def _virtual_ordering_key(item):
+        holding = item["holding_info"][0]
+        start = (holding.get("time_slot") or {}).get("start_time") or []
+        return holding.get("date") or "", start, item.get("id", float("inf"))
 
     def get_view_name(self):
         return "Занятие"
@@ -334,30 +655,142 @@ class ScheduleViewSet(CommonViewSet):
     serializer_class = ScheduleSerializer
     search_fields = ["faculty", "years"]
     filterset_class = ScheduleFilter
+    cache_dependencies = [Event]
 
     def get_view_name(self):
         return "Расписание"
 
 
-class DBImportAPIView(APIView):
+class CalendarContentNegotiation(BaseContentNegotiation):
+    """Календарь отдается в одном формате независимо от заголовка Accept клиента"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ParticipantCalendarAPIView(APIView):
+    """
+    Расписание участника в формате iCalendar (RFC 5545) для подписки из приложений календаря.
+
+    Поддерживаются условные запросы (`If-None-Match`, `If-Modified-Since`):
+    если расписание не изменилось, возвращается ответ 304 без тела
+    """
+
+    permission_classes = [AllowAny]
+    renderer_classes = [ResponseJSONRenderer]
+    content_negotiation_class = CalendarContentNegotiation
+    participants = EventParticipant.objects.all()
+    content_type = "text/calendar; charset=utf-8"
+
+    def get(self, request, pk, *args, **kwargs):
+        participant = get_object_or_404(self.participants, pk=pk)
+        events = Event.objects.for_participant(participant)
+
+        etag, last_modified = conditional_state(
+            [*CALENDAR_MODELS, EventParticipant], self.content_type
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        response = HttpResponse(
+            CalendarBuilder(events).render(participant.name), content_type=self.content_type
+        )
+        response["Content-Disposition"] = 'inline; filename="calendar.ics"'
+        set_validators(response, etag, last_modified)
+        return response
+
+
+class GroupCalendarAPIView(ParticipantCalendarAPIView):
+    participants = GroupViewSet.queryset
+
+    def get_view_name(self):
+        return "Календарь группы"
+
+
+class TeacherCalendarAPIView(ParticipantCalendarAPIView):
+    participants = TeacherViewSet.queryset
+
+    def get_view_name(self):
+        return "Календарь преподавателя"
+
+
+class ImportJobMixin:
+    """Общие параметры запросов, ставящих задания импорта в очередь"""
+
+    def get_resumed_run(self, request):
+        """Задание из параметра ?resume=<id> для продолжения с контрольной точки"""
+        if "resume" not in request.query_params:
+            return None
+        run = get_object_or_404(ImportRun, pk=request.query_params["resume"])
+        if run.status == ImportRun.Status.COMPLETED:
+            raise ValidationError({"resume": ["Импорт уже завершен"]})
+        if run.status in (ImportRun.Status.QUEUED, ImportRun.Status.RUNNING):
+            raise ValidationError({"resume": ["Импорт уже в очереди или выполняется"]})
+        return run
+
+    def get_mode(self, request):
+        mode = request.query_params.get("mode", ImportRun.Mode.FULL)
+        if mode not in ImportRun.Mode.values:
+            choices = ", ".join(ImportRun.Mode.values)
+            raise ValidationError({"mode": [f"Допустимые значения: {choices}"]})
+        return mode
+
+    def job_response(self, run):
+        return Response(
+            {"result": True, "import_run": ImportRunSerializer(run).data},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class DBImportAPIView(ImportJobMixin, APIView):
     """
-    Данная функциональность не реализована на текущий момент. Это заглушка.
+    Импорт из внешней базы данных, настроенной администратором сервиса
+    в `API_DB_IMPORT_SOURCES` (алиас Django или модуль DB-API, например, файл SQLite)
+
+    В теле запроса передается `source` - имя источника (можно не указывать, если источник один).
+    Таблицы источника описываются декларативно (см. `api.db_import.DEFAULT_MAPPING`):
+    по таблице на раздел [JSON-импорта](/api/import/json) со столбцами, соответствующими полям
+    записей раздела, участники и элементы `holding_info` событий - в отдельных таблицах
+    со ссылкой на `idnumber` события
+
+    Таблицы читаются порциями и записываются так же, как JSON-документ: пачками в отдельных
+    транзакциях, с заданием импорта в очереди (ответ 202 с `import_run`), параметрами
+    `?mode=diff` (или `?mode=snapshot`) и `?resume=<id задания>`
     """
 
     permission_classes = [IsAdminUser]
 
     def post(self, request, *args, **kwargs):
-        # Заглушка для импорта базы данных
-        return Response(
-            {"type": "error", "message": "Not implemented", "error_code": 4},
-            status=status.HTTP_501_NOT_IMPLEMENTED,
+        run = self.get_resumed_run(request)
+        if run is not None:
+            run.requeue()
+            return self.job_response(run)
+
+        sources = settings.API_DB_IMPORT_SOURCES
+        source = request.data.get("source")
+        if source is None and len(sources) == 1:
+            source = next(iter(sources))
+        if source not in sources:
+            choices = ", ".join(sources) or "источники не настроены"
+            raise ValidationError({"source": [f"Допустимые значения: {choices}"]})
+
+        run = ImportRun.enqueue(
+            database=source,
+            source=f"База данных {source}",
+            mode=self.get_mode(request),
+            author=request.user,
         )
+        return self.job_response(run)
 
     def get_view_name(self):
         return "Импортирование из внешней базы данных"
 
 
-class JSONImportAPIView(APIView):
+class JSONImportAPIView(ImportJobMixin, APIView):
     """
     Данный инструмент позволяет администратору заполнять базу данных API расписаний
     с помощью укомплектованного JSON файла специального формата
@@ -386,35 +819,167 @@ class JSONImportAPIView(APIView):
     - `schedules` - список расписаний с ключами `faculty`, `scope`, `course`, `semester`, `years` (см. в [объекте расписаний](/api/schedules)) <br>
     - `events` - список событий вместе с информацией об их проведении. Ключи `kind_id`, `schedule_id`, `subject_id` обозначают один `idnumber` соответствующих объектов (по сути, ссылка на него),
     также объект события требует наличия списка `participants`, состоящего из `idnumber` участников,
-    и списка `holding_info`, который содержит объекты информации о проведении. Этот объект содержит ключ `date`, а также `place_id` и `slot_id`, являющиеся одним `idnumber` места проведения и временного интервала проведения события соответственно <br>
+    и списка `holding_info`, который содержит объекты информации о проведении. Этот объект содержит ключи `idnumber`, `date`, а также `place_id` и `slot_id`, являющиеся одним `idnumber` места проведения и временного интервала проведения события соответственно <br>
+
+    Каждый элемент `holding_info` становится отдельным занятием с `idnumber` вида `<idnumber события>#<idnumber элемента>`.
+    Элемент с `idnumber`, равным null, описывает занятие с `idnumber` самого события (так [выгрузка](/api/export/json)
+    передает занятия, созданные не импортом)
+    Занятия события, элементов для которых больше нет в `holding_info`, удаляются при повторном импорте,
+    а список участников занятий приводится к списку `participants`
 
     Также, стоит отметить, что у всех объектов, импортируемых через JSON, должен быть уникальный строковый идентификатор, который хранится в ключе `idnumber`
+
+    Документ можно передать файлом (поле `file` формы multipart/form-data) или телом запроса.
+    Он разбирается по мере чтения, поэтому размер документа не ограничен, но разделы обрабатываются
+    в порядке следования: раздел `events` должен идти после разделов, на записи которых ссылаются события
+
+    Документ сохраняется и ставится в очередь импорта, ответ (202) возвращается сразу
+    и содержит `import_run` - задание импорта, состояние которого можно отслеживать
+    на `/api/import/jobs/<id задания>/` (см. [список заданий](/api/import/jobs)).
+    Задания выполняются по одному в порядке постановки обработчиком очереди -
+    командой `python manage.py run_import_worker`
+
+    Записи импортируются пачками (по `API_IMPORT_CHUNK_SIZE`), каждая пачка - в отдельной транзакции.
+    Если импорт прервался, его можно продолжить с последней записанной пачки запросом
+    на `/api/import/json/?resume=<id задания>` - с исправленным документом или без документа
+    (тогда повторно используется сохраненный)
+
+    С параметром `?mode=diff` записываются только объекты, содержимое которых изменилось
+    с прошлого импорта (сравнивается хэш объекта документа по его `idnumber`), а из событий,
+    которые импортировались ранее, но отсутствуют в документе, удаляются только события
+    расписаний из раздела `schedules` документа. Так документ одного факультета не затрагивает
+    данные остальных. Повторный импорт неизменного документа в этом режиме почти ничего
+    не пишет в БД.
+
+    Режим `?mode=snapshot` - то же, но документ считается полным снимком всех данных:
+    удаляются записи всех объектов, которые импортировались ранее, но отсутствуют в непустых
+    разделах документа, во всей БД (кроме записей, на которые ссылаются другие записи). Число созданных (`created`), измененных (`updated`),
+    неизмененных (`unchanged`) и удаленных (`deleted`) объектов по разделам возвращается
+    в `summary` запуска импорта
     """
 
     permission_classes = [IsAdminUser]
     serializer_class = FileUploadSerializer
 
     def post(self, request, *args, **kwargs):
-        serializer = FileUploadSerializer(data=request.data)
-        if serializer.is_valid():
-            json_file = serializer.validated_data.get("file", None)
-            if json_file:
-                # Обработка файла
-                file_data = json_file.read().decode("utf-8")
-                json_content = json.loads(file_data)
-                return self.process_content(json_content)
-
-        json_content = json.loads(request.body.decode("utf-8"))
-        return self.process_content(json_content)
-
-    def process_content(self, json_content):
-        JSONImporter(json_content).import_data()
-        return Response({"result": True}, status=status.HTTP_200_OK)
+        run = self.get_resumed_run(request)
+
+        # Документ сохраняется без разбора: загруженный файл - из временного файла,
+        # тело запроса - напрямую из потока, без request.body и ограничения на его размер
+        if request.content_type.startswith("multipart/form-data"):
+            serializer = FileUploadSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            document = serializer.validated_data["file"]
+            name = source = document.name
+        elif request.stream is not None:
+            document = File(request.stream)
+            name, source = "request.json", "Тело запроса"
+        elif run is not None and run.file:
+            document = name = None
+        else:
+            raise ValidationError({"file": ["Требуется документ импорта"]})
+
+        if run is None:
+            run = ImportRun.enqueue(
+                document, name, source=source, mode=self.get_mode(request), author=request.user
+            )
+        else:
+            run.requeue(document, name)
+        return self.job_response(run)
 
     def get_view_name(self):
         return "Импортирование данных из JSON"
 
 
+class JSONExportAPIView(APIView):
+    """
+    Выгрузка базы данных расписаний в формате [импорта из JSON](/api/import/json).
+    Документ формируется и передается по частям, поэтому размер выгрузки не ограничен,
+    а выгрузку можно загрузить обратно через импорт
+
+    Необязательные параметры отбора расписаний (и их занятий):
+
+    - `schedule` - ID расписания, можно указать несколько раз <br>
+    - `faculty` - факультет <br>
+    - `status` - статус расписания (см. [объект расписаний](/api/schedules)) <br>
+
+    При отборе справочники (предметы, места, участники и т.д.) выгружаются только
+    используемые в выгружаемых занятиях. То же доступно командой `python manage.py export_json`
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        errors = {}
+        try:
+            schedules = [int(pk) for pk in params.getlist("schedule")]
+        except ValueError:
+            errors["schedule"] = ["Ожидаются целые числа"]
+        status_value = None
+        if "status" in params:
+            try:
+                status_value = int(params["status"])
+            except ValueError:
+                errors["status"] = ["Ожидается целое число"]
+            else:
+                if status_value not in Schedule.Status.values:
+                    errors["status"] = ["Недопустимый статус расписания"]
+        if errors:
+            raise ValidationError(errors)
+
+        exporter = JSONExporter(
+            schedules=schedules, faculty=params.get("faculty"), status=status_value
+        )
+        response = StreamingHttpResponse(exporter.render(), content_type="application/json")
+        response["Content-Disposition"] = 'attachment; filename="schedule.json"'
+        return response
+
+    def get_view_name(self):
+        return "Выгрузка данных в JSON"
+
+
+class ImportRunViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Задания (запуски) импорта и ход их выполнения <br>
+
+    - `status` - 0 - выполняется, 1 - завершено, 2 - завершено с ошибкой (текст в `error`),
+    3 - в очереди <br>
+    - `section`, `offset` - контрольная точка: раздел и число записанных записей раздела <br>
+    - `progress` - число записанных (`done`), всего (`total`) и оставшихся (`remaining`)
+    записей по разделам <br>
+    - `mode` - режим импорта (`full`, `diff` или `snapshot`), `summary` - число созданных, измененных,
+    неизмененных и удаленных объектов по разделам <br>
+    - `started_at` - время постановки в очередь, `attempt_started_at` - начало выполнения
+    текущей или последней попытки, `duration` (в секундах) и `rows_per_second` - ее длительность
+    и скорость <br>
+
+    Прерванный импорт продолжается запросом на `/api/import/json/?resume=<id задания>`
+    """
+
+    queryset = ImportRun.objects.select_related("author")
+    serializer_class = ImportRunSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_view_name(self):
+        return "Запуски импорта"
+
+
+class ResponseCacheStatsAPIView(APIView):
+    """
+    Счетчики кэша ответов на анонимные GET-запросы: число попаданий (`hits`),
+    промахов (`misses`) и доля попаданий (`hit_ratio`)
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(response_cache_stats())
+
+    def get_view_name(self):
+        return "Статистика кэша ответов"
+
+
 class ObtainAPIUserToken(ObtainAuthToken):
     """
     View для получения токена авторизации
@@ -87,6 +87,47 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Номера версий данных для ключей кэша хранятся в БД (см. api.models.ModelVersion),
+# поэтому записи любого процесса сразу делают закэшированные ответы неактуальными.
+# LocMemCache хранит ответы отдельно в каждом процессе, для нескольких процессов
+# сервера общий кэш (Redis, Memcached) позволяет переиспользовать ответы между ними
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Время хранения закэшированных ответов API в секундах (0 - кэш ответов отключен)
+API_RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# Время хранения блоков VEVENT календарей участников в секундах.
+# Ключ блока меняется вместе с данными занятия, поэтому устаревшие блоки просто вытесняются
+API_CALENDAR_EVENT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Отметки доступа к записям (dateaccessed) копятся в памяти и записываются в БД пачкой
+# при накоплении заданного числа записей или по прошествии заданного числа секунд
+# (проверяется при новой отметке вне транзакции и по окончании запроса, см. api.access_tracking)
+API_DATEACCESSED_BUFFER_SIZE = 1000
+API_DATEACCESSED_FLUSH_INTERVAL = 30
+
+# Число записей раздела, записываемых импортом в одной транзакции (см. api.models.ImportRun)
+API_IMPORT_CHUNK_SIZE = 1000
+# Интервал проверки очереди импорта обработчиком (команда run_import_worker), в секундах
+API_IMPORT_WORKER_POLL_INTERVAL = 5
+# Внешние БД для импорта (/api/import/db/): имя источника -> описание подключения.
+# "DATABASE" - алиас из DATABASES либо "MODULE" - модуль DB-API и "OPTIONS" - аргументы его connect,
+# "MAPPING" - переопределения таблиц и столбцов (см. api.db_import.DEFAULT_MAPPING). Например:
+# {"legacy": {"MODULE": "sqlite3", "OPTIONS": {"database": "legacy.sqlite3"}}}
+API_DB_IMPORT_SOURCES = {}
+# Хранить ли занятия, построенные по шаблонам расписаний (см. api.expansion). Если включено,
+# изменения шаблонов и переносов дней сразу перестраивают затронутые занятия (см. api.signals),
+# иначе они вычисляются при чтении (/api/events/?virtual=1)
+API_MATERIALIZE_EVENTS = True
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -123,6 +164,9 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Загруженные файлы (документы заданий импорта)
+MEDIA_ROOT = BASE_DIR / "media"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -136,6 +180,8 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_RENDERER_CLASSES": (
         "api.handlers.ResponseJSONRenderer",
+        "api.handlers.ResponseMessagePackRenderer",
+        "api.handlers.ColumnarJSONRenderer",
         "rest_framework.renderers.BrowsableAPIRenderer",
     ),
     "EXCEPTION_HANDLER": "api.handlers.exception_response_handler",